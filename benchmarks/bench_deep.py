@@ -0,0 +1,98 @@
+"""
+Benchmark of the tree walk on deep and wide synthetic inputs.
+
+Compares `render_markdown`, which expands lists and `handle_label` nodes on
+an explicit stack, with `recursive_render`, a copy of the previous
+recursive dispatch (render -> handle_label -> render for every level).
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_deep.py
+"""
+
+import sys
+import timeit
+
+from sciencedirect2markdown.streamlitweb import TAG_HANDLERS, handle_label, render_markdown
+from sciencedirect2markdown.writer import MarkdownWriter
+
+
+def recursive_render(data, LaTeX=False, out=None):
+    if isinstance(data, dict):
+        if "#name" in data:
+            handler, takes_latex = TAG_HANDLERS.get(data["#name"], (handle_label, False))
+            if handler is handle_label:
+                recursive_label(data, LaTeX if takes_latex else False, out)
+            elif takes_latex:
+                handler(data, LaTeX, out=out)
+            else:
+                handler(data, out=out)
+        elif "content" in data:
+            recursive_render(data["content"], out=out)
+    elif isinstance(data, list):
+        for item in data:
+            recursive_render(item, out=out)
+
+
+def recursive_label(data, LaTeX=False, out=None):
+    if "_" in data:
+        out.write(data["_"])
+    if "$$" in data:
+        for item in data["$$"]:
+            recursive_render(item, LaTeX, out)
+
+
+def deep(depth):
+    node = {"#name": "__text__", "_": "x"}
+    for _ in range(depth):
+        node = {"#name": "label", "_": "a", "$$": [node]}
+    return {"content": [node]}
+
+
+def wide(width, depth=4):
+    node = {"#name": "__text__", "_": "x"}
+    for _ in range(depth):
+        node = {"#name": "label", "$$": [node] * width}
+    return {"content": [node]}
+
+
+def count_nodes(data):
+    if isinstance(data, list):
+        return sum(count_nodes(item) for item in data)
+    if "content" in data:
+        return count_nodes(data["content"])
+    return 1 + count_nodes(data.get("$$", []))
+
+
+def render_with(walk, data):
+    out = MarkdownWriter()
+    walk(data, out=out)
+    return out.getvalue()
+
+
+def main(repeat=5, number=20):
+    sys.setrecursionlimit(10_000)
+    cases = [("deep 400", deep(400)), ("deep 3000", deep(3000)), ("wide 8^4", wide(8))]
+    print(f"{'input':<12}{'nodes':>8}{'stack ns/node':>16}{'recursive ns/node':>20}")
+    for name, data in cases:
+        nodes = count_nodes(data)
+        assert render_with(render_markdown, data) == render_with(recursive_render, data)
+        timings = []
+        for walk in (render_markdown, recursive_render):
+            best = min(
+                timeit.repeat(lambda: render_with(walk, data), repeat=repeat, number=number)
+            )
+            timings.append(best / number / nodes * 1e9)
+        print(f"{name:<12}{nodes:>8}{timings[0]:>16.0f}{timings[1]:>20.0f}")
+
+    # The recursive walk needs two frames per level
+    sys.setrecursionlimit(1000)
+    render_with(render_markdown, deep(100_000))
+    try:
+        render_with(recursive_render, deep(100_000))
+    except RecursionError:
+        print("deep 100000: recursive walk hits the recursion limit, stack walk succeeds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Micro-benchmark of the per-node tag dispatch in `render_markdown`.
+
+Renders a flat list of empty nodes, one per registered tag, so the measured
+time is dominated by looking up and calling the handler.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_dispatch.py
+"""
+
+import timeit
+
+from sciencedirect2markdown.streamlitweb import TAG_HANDLERS, render_markdown
+
+# Handlers that need attributes or children to do anything useful
+SKIP = {"math", "inf", "cross-ref", "inter-ref", "intra-ref", "link", "glyph"}
+
+
+def main(repeat=5, number=200):
+    tags = [tag for tag in TAG_HANDLERS if tag not in SKIP]
+    nodes = [{"#name": tag, "_": "x"} for tag in tags] * 20
+
+    print(f"{'tag':<24}{'ns/node':>10}")
+    for tag in ("para", "bold", "link", "__text__", "acknowledgment"):
+        if tag in SKIP:
+            tag_nodes = [{"#name": tag, "$": {}}] * len(nodes)
+        else:
+            tag_nodes = [{"#name": tag, "_": "x"}] * len(nodes)
+        best = min(
+            timeit.repeat(lambda: render_markdown(tag_nodes), repeat=repeat, number=number)
+        )
+        print(f"{tag:<24}{best / number / len(tag_nodes) * 1e9:>10.0f}")
+
+    best = min(timeit.repeat(lambda: render_markdown(nodes), repeat=repeat, number=number))
+    print(f"{'(all tags)':<24}{best / number / len(nodes) * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Reports how long building the document index takes compared with rendering.
+
+Run from the repository root on one or more ScienceDirect JSON files:
+
+    PYTHONPATH=src python benchmarks/bench_index.py article.json [...]
+"""
+
+import sys
+from pathlib import Path
+
+from sciencedirect2markdown.context import ConversionContext
+from sciencedirect2markdown.jsonio import loads
+from sciencedirect2markdown.streamlitweb import json_to_markdown
+
+
+def main(paths):
+    print(f"{'file':<40}{'index ms':>10}{'targets ms':>12}{'render ms':>11}")
+    for path in paths:
+        data = loads(Path(path).read_bytes())
+        context = ConversionContext()
+        json_to_markdown(data, context=context)
+        index_seconds = context.index.seconds
+        context.index.targets
+        targets_seconds = context.index.seconds - index_seconds
+        print(
+            f"{Path(path).name:<40}{index_seconds * 1e3:>10.2f}"
+            f"{targets_seconds * 1e3:>12.2f}{context.render_seconds * 1e3:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""
+Benchmark of JSON parsing with trailing-comma repair on multi-MB payloads.
+
+Compares the old two-pass `re.sub` repair with the single-pass
+`remove_trailing_commas`, and `loads`, which only repairs when strict
+parsing fails, on both clean and comma-damaged input.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_json_repair.py [size_mb]
+"""
+
+import json
+import re
+import sys
+import timeit
+
+from sciencedirect2markdown.jsonio import loads, remove_trailing_commas
+
+
+def two_pass_repair(json_string):
+    json_string = re.sub(r",\s*}", "}", json_string)
+    return re.sub(r",\s*]", "]", json_string)
+
+
+def make_payload(size_mb):
+    def para(text):
+        return {
+            "#name": "para",
+            "$": {"id": "p0010", "view": "all"},
+            "_": text,
+            "$$": [{"#name": "italic", "_": "in vitro"}, {"#name": "__text__", "_": "text"}],
+        }
+
+    # One paragraph in ten quotes sequences the old repair used to corrupt
+    paras = [para("Rates scale with k, T and so on. ")] * 9
+    paras.append(para("Written as [1, 2,] or {a,} in the source. "))
+    count = int(size_mb * 1e6 / len(json.dumps(paras)))
+    return json.dumps({"content": [{"#name": "body", "$$": paras * count}]})
+
+
+def main(size_mb=8.0, repeat=3):
+    clean = make_payload(size_mb)
+    damaged = clean.replace("}]", "},]")
+    print(f"payload: {len(clean) / 1e6:.1f} MB")
+
+    cases = [
+        ("two-pass re.sub repair", lambda: two_pass_repair(damaged)),
+        ("single-pass repair", lambda: remove_trailing_commas(damaged)),
+        ("json.loads (clean)", lambda: json.loads(clean)),
+        ("loads (clean)", lambda: loads(clean)),
+        ("two-pass + json.loads (clean)", lambda: json.loads(two_pass_repair(clean))),
+        ("loads (damaged)", lambda: loads(damaged)),
+    ]
+    print(f"{'case':<32}{'seconds':>10}{'MB/s':>10}")
+    for name, func in cases:
+        best = min(timeit.repeat(func, repeat=repeat, number=1))
+        print(f"{name:<32}{best:>10.3f}{len(clean) / 1e6 / best:>10.1f}")
+
+    # The old repair also rewrote string literals
+    assert json.loads(remove_trailing_commas(damaged)) == json.loads(clean)
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:2]))
@@ -0,0 +1,122 @@
+"""
+Benchmark of the native JSON-to-LaTeX math renderer against the XSLT path.
+
+Converts every equation of a corpus with `math_to_latex` and with
+`build_mathml` + the "yarosh" stylesheet, and reports the time per
+equation, how many equations the native renderer supports and how many of
+those come out identical. The XSLT is timed once per equation and batched
+per document with `mathml2latex_yarosh_batch`. The corpus is the `math` nodes
+of the given ScienceDirect JSON files (one batch per file), or a synthetic
+one when no file is given.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_math.py [article.json ...]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+from sciencedirect2markdown.jsonio import loads
+from sciencedirect2markdown.mathlatex import UnsupportedMath, math_to_latex
+from sciencedirect2markdown.streamlitweb import (
+    build_mathml,
+    mathml2latex_yarosh,
+    mathml2latex_yarosh_batch,
+)
+
+TEXTS = ["x", "y", "k", "sin", "exp", "1", "2", "0.5", "10", "α", "β", "∞", "+", "−", "=", "≤", "×"]
+
+
+def find_math(data, found):
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            if node.get("#name") == "math":
+                found.append(node)
+            else:
+                stack.extend(value for value in node.values() if isinstance(value, (dict, list)))
+    return found
+
+
+def synthetic_corpus(count=2000, seed=0, per_document=100):
+    rng = random.Random(seed)
+
+    def token():
+        tag_name = rng.choice(["mi", "mi", "mn", "mo"])
+        return {"#name": tag_name, "_": rng.choice(TEXTS)}
+
+    def expression(depth):
+        if depth == 0 or rng.random() < 0.4:
+            return token()
+        tag_name, arity = rng.choice(
+            [("mrow", 3), ("mfrac", 2), ("msub", 2), ("msup", 2), ("msubsup", 3),
+             ("msqrt", 1), ("mover", 2), ("munderover", 3)]
+        )
+        return {"#name": tag_name, "$$": [expression(depth - 1) for _ in range(arity)]}
+
+    corpus = []
+    for _ in range(count):
+        children = [expression(3) for _ in range(rng.randint(1, 5))]
+        if rng.random() < 0.05:
+            # Something only the stylesheet handles
+            children.append({"#name": "mfenced", "$$": [token()]})
+        corpus.append({"#name": "math", "$": {"altimg": "si1.svg"}, "$$": children})
+    return [corpus[i : i + per_document] for i in range(0, count, per_document)]
+
+
+def xslt_latex(data):
+    return str(mathml2latex_yarosh(build_mathml(data)))
+
+
+def main(paths):
+    documents = [find_math(loads(Path(path).read_bytes()), []) for path in paths]
+    documents = [equations for equations in documents if equations] or synthetic_corpus()
+    corpus = [data for equations in documents for data in equations]
+
+    # Compile the stylesheet and load the entity tables before timing
+    xslt_latex(corpus[0])
+    try:
+        math_to_latex(corpus[0])
+    except UnsupportedMath:
+        pass
+
+    start = time.perf_counter()
+    expected = [xslt_latex(data) for data in corpus]
+    xslt_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = []
+    for equations in documents:
+        batched.extend(mathml2latex_yarosh_batch([build_mathml(d) for d in equations]))
+    batch_seconds = time.perf_counter() - start
+    assert batched == expected
+
+    native = []
+    start = time.perf_counter()
+    for data in corpus:
+        try:
+            native.append(math_to_latex(data))
+        except UnsupportedMath:
+            native.append(None)
+    native_seconds = time.perf_counter() - start
+
+    supported = [index for index, latex in enumerate(native) if latex is not None]
+    identical = sum(1 for index in supported if native[index] == expected[index])
+    count = len(corpus)
+    print(f"equations: {count} in {len(documents)} documents")
+    print(f"native renderer supports: {len(supported)} ({len(supported) / count:.1%})")
+    print(f"identical to XSLT: {identical} of {len(supported)}")
+    print(f"{'path':<10}{'us/equation':>14}")
+    print(f"{'xslt':<10}{xslt_seconds / count * 1e6:>14.1f}")
+    print(f"{'batched':<10}{batch_seconds / count * 1e6:>14.1f}")
+    print(f"{'native':<10}{native_seconds / count * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
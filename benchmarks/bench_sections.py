@@ -0,0 +1,66 @@
+"""
+Benchmark of the section cache on a revised article.
+
+Converts a synthetic article without the cache, then with it: once cold, and
+once more after revising a few of its top-level sections, which is how
+corrected versions of an article come back. Each run starts with an empty
+math cache, like a new process would. Reports the times, the hit rate and the
+time the cache reports as saved, net of computing the section keys.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_sections.py [revised sections]
+"""
+
+import contextlib
+import copy
+import io
+import sys
+import time
+
+from synthetic import generate_document
+
+from sciencedirect2markdown import streamlitweb
+
+
+def revise(document, count):
+    revised = copy.deepcopy(document)
+    sections = revised["content"][0]["$$"][0]["$$"]
+    for section in sections[:count]:
+        para = next(item for item in section["$$"] if item["#name"] == "para")
+        para["$$"].append({"#name": "__text__", "_": " Corrected."})
+    return revised
+
+
+def timed(document):
+    streamlitweb.configure_math_cache()
+    start = time.perf_counter()
+    markdown = streamlitweb.json_to_markdown(document)
+    return markdown, time.perf_counter() - start
+
+
+def main(revised_sections=3):
+    document = generate_document(paragraphs=3000, sections=30)
+    revised = revise(document, revised_sections)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        timed(document)  # compile the stylesheets
+        expected, uncached = timed(revised)
+        cache = streamlitweb.configure_section_cache()
+        _, cold = timed(document)
+        markdown, warm = timed(revised)
+    assert markdown == expected
+    stats = cache.stats()
+    print(f"revised sections: {revised_sections} of 30")
+    print(f"{'run':<10}{'ms':>10}")
+    print(f"{'uncached':<10}{uncached * 1e3:>10.1f}")
+    print(f"{'cold':<10}{cold * 1e3:>10.1f}")
+    print(f"{'revised':<10}{warm * 1e3:>10.1f}")
+    print(
+        f"hits: {stats['hits']}, misses: {stats['misses']}, "
+        f"hit rate: {stats['hit_rate']:.0%}, saved: {stats['seconds_saved'] * 1e3:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
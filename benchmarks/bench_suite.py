@@ -0,0 +1,150 @@
+"""
+Benchmark suite on synthetic documents, with regression checks.
+
+Generates documents of several sizes and shapes with `synthetic.py` (many
+paragraphs, deep sections, big spanning tables, a 5000-row supplementary
+table, heavy inline math, many floats) and times the conversion end to end
+and per subsystem: JSON parsing, indexing, rendering, and the self time of
+each tag handler from one profiled run. Timings are the best of `--repeat`
+runs, each with a fresh math cache.
+
+`--save` stores the results as the baseline; later runs compare against it
+and exit with status 1 when a timing is slower by more than `--threshold`.
+Baselines are machine specific, so keep them out of version control.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_suite.py --save
+    PYTHONPATH=src python benchmarks/bench_suite.py [--threshold 0.2] [case ...]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+from synthetic import generate_document
+
+from sciencedirect2markdown import streamlitweb
+from sciencedirect2markdown.context import ConversionContext
+from sciencedirect2markdown.jsonio import loads
+
+CASES = {
+    "small": dict(paragraphs=100, sections=4),
+    "large": dict(paragraphs=3000, sections=30),
+    "deep-sections": dict(paragraphs=800, sections=2, section_depth=12),
+    "tables": dict(paragraphs=100, tables=20, table_rows=150, table_cols=8),
+    "big-table": dict(paragraphs=40, tables=1, table_rows=5000, table_cols=12, figures=0),
+    "math-heavy": dict(paragraphs=400, equations=4, math_depth=4),
+    "floats": dict(paragraphs=800, figures=300, tables=40, table_rows=5),
+}
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+# Timings shorter than this are too noisy to flag
+MIN_SECONDS = 0.002
+
+
+def convert(text):
+    streamlitweb.configure_math_cache()
+    context = ConversionContext()
+    start = time.perf_counter()
+    data = loads(text)
+    parse_seconds = time.perf_counter() - start
+    streamlitweb.json_to_markdown(data, context=context)
+    return {
+        "total": time.perf_counter() - start,
+        "parse": parse_seconds,
+        "index": context.index.seconds,
+        "render": context.render_seconds,
+    }
+
+
+def run_case(options, repeat):
+    text = json.dumps(generate_document(**options), ensure_ascii=False)
+    best = {}
+    # Unhandled tags and math failures are printed; keep them off the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            for name, seconds in convert(text).items():
+                best[name] = min(seconds, best.get(name, seconds))
+        streamlitweb.configure_math_cache()
+        with streamlitweb.profile_handlers() as profiler:
+            streamlitweb.json_to_markdown(loads(text))
+    handlers = profiler.to_dict()["handlers"]
+    for tag_name, stats in handlers.items():
+        best[f"handler:{tag_name}"] = stats["self_seconds"]
+    return {"size_mb": len(text.encode("utf-8")) / 1e6, "seconds": best}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, result in results.items():
+        previous = baseline.get(case, {}).get("seconds", {})
+        for name, seconds in result["seconds"].items():
+            before = previous.get(name)
+            if before is None or seconds < MIN_SECONDS:
+                continue
+            if seconds > before * (1 + threshold):
+                regressions.append((case, name, before, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("cases", nargs="*", help=f"cases to run: {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="store the results as baseline")
+    args = parser.parse_args(argv)
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    results = {}
+    print(f"{'case':<16}{'MB':>7}{'total ms':>10}{'parse':>8}{'index':>8}{'render':>8}  top handlers")
+    for case in args.cases or CASES:
+        result = results[case] = run_case(CASES[case], args.repeat)
+        seconds = result["seconds"]
+        handlers = sorted(
+            (name for name in seconds if name.startswith("handler:")),
+            key=seconds.get,
+            reverse=True,
+        )[:3]
+        top = ", ".join(f"{name[8:]} {seconds[name] * 1e3:.0f}" for name in handlers)
+        print(
+            f"{case:<16}{result['size_mb']:>7.2f}{seconds['total'] * 1e3:>10.1f}"
+            f"{seconds['parse'] * 1e3:>8.1f}{seconds['index'] * 1e3:>8.1f}"
+            f"{seconds['render'] * 1e3:>8.1f}  {top}"
+        )
+
+    if args.save:
+        baseline = {}
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("no baseline to compare with; run with --save first")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare(results, baseline, args.threshold)
+    for case, name, before, seconds in regressions:
+        print(
+            f"REGRESSION {case} {name}: {before * 1e3:.1f} ms -> {seconds * 1e3:.1f} ms "
+            f"(+{seconds / before - 1:.0%})"
+        )
+    if not regressions:
+        print(f"no regression beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Generator of synthetic ScienceDirect `body` JSON documents.
+
+The documents use the tags the converter handles, in the shapes the article
+API returns: nested sections with labels and titles, paragraphs mixing text,
+formatting, cross-references and inline math, display formulas, lists,
+`tgroup` tables with `colname`/`namest`/`nameend` entries, and figure and
+table floats anchored from the text.
+
+Write one to stdout from the repository root:
+
+    PYTHONPATH=src python benchmarks/synthetic.py [paragraphs] > article.json
+"""
+
+import json
+import random
+import sys
+
+WORDS = (
+    "the of a flux reactor kinetic energy model rate thermal neutron coefficient "
+    "measured sample temperature pressure boundary layer transport yield"
+).split()
+
+IDENTIFIERS = ["x", "y", "k", "T", "E", "α", "β", "λ", "ϕ", "Re"]
+OPERATORS = ["+", "−", "=", "≤", "×", "/"]
+
+
+class DocumentGenerator:
+    """
+    Builds one synthetic document.
+
+    Args:
+        paragraphs: Total number of paragraphs in the body.
+        section_depth: Depth of the nested `section` elements.
+        sections: Number of top-level sections.
+        equations: Inline equations per paragraph, on average.
+        math_depth: Nesting depth of the generated MathML.
+        tables: Number of table floats.
+        table_rows: Body rows per table.
+        table_cols: Columns per table.
+        figures: Number of figure floats.
+        lists: Probability that a paragraph is followed by a nested list.
+        seed: Seed of the random generator, so sizes are reproducible.
+    """
+
+    def __init__(
+        self,
+        paragraphs=200,
+        section_depth=3,
+        sections=8,
+        equations=1.0,
+        math_depth=3,
+        tables=4,
+        table_rows=20,
+        table_cols=6,
+        figures=8,
+        lists=0.1,
+        seed=0,
+    ):
+        self.paragraphs = paragraphs
+        self.section_depth = section_depth
+        self.sections = sections
+        self.equations = equations
+        self.math_depth = math_depth
+        self.tables = tables
+        self.table_rows = table_rows
+        self.table_cols = table_cols
+        self.figures = figures
+        self.lists = lists
+        self.random = random.Random(seed)
+        self._ids = 0
+
+    def document(self):
+        floats = [self.figure(i) for i in range(self.figures)]
+        floats += [self.table(i) for i in range(self.tables)]
+        attachments = []
+        for i in range(self.figures):
+            for suffix, kind in (("sml", "IMAGE-THUMBNAIL"), ("jpg", "IMAGE-DOWNSAMPLED")):
+                attachments.append(
+                    {
+                        "file-basename": f"gr{i}",
+                        "attachment-eid": f"1-s2.0-S0000000000000000-gr{i}.{suffix}",
+                        "attachment-type": kind,
+                    }
+                )
+
+        per_section = max(1, self.paragraphs // max(1, self.sections))
+        remaining = self.paragraphs
+        sections = []
+        for index in range(1, self.sections + 1):
+            count = per_section if index < self.sections else remaining
+            remaining -= count
+            sections.append(self.section([index], count))
+        body = {"#name": "body", "$$": [{"#name": "sections", "$$": sections}]}
+        return {"content": [body], "floats": floats, "attachments": attachments}
+
+    def next_id(self, prefix):
+        self._ids += 1
+        return f"{prefix}{self._ids:04d}"
+
+    def words(self, count):
+        return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+    def section(self, number, paragraphs):
+        children = [
+            {"#name": "label", "_": ".".join(map(str, number))},
+            {"#name": "section-title", "_": self.words(4).capitalize()},
+        ]
+        # Split the paragraphs between this level and one subsection
+        nested = paragraphs // 2 if len(number) < self.section_depth else 0
+        for _ in range(paragraphs - nested):
+            children.append(self.para())
+            if self.random.random() < self.lists:
+                children.append(self.list(1))
+            if self.random.random() < 0.05:
+                children.append(self.display())
+        if nested:
+            children.append(self.section(number + [1], nested))
+        return {"#name": "section", "$": {"id": self.next_id("s")}, "$$": children}
+
+    def para(self):
+        children = [{"#name": "__text__", "_": self.words(20) + " "}]
+        equations = int(self.equations) + (self.random.random() < self.equations % 1)
+        for _ in range(equations):
+            children.append(self.math())
+            children.append({"#name": "__text__", "_": " " + self.words(8) + " "})
+        roll = self.random.random()
+        if roll < 0.3:
+            children.append({"#name": "italic", "_": self.words(2)})
+        elif roll < 0.5:
+            children.append({"#name": "bold", "_": self.words(1)})
+        elif roll < 0.6:
+            children.append({"#name": "sup", "_": "2"})
+        if self.figures and self.random.random() < 0.2:
+            figure = self.random.randrange(self.figures)
+            children.append(
+                {"#name": "cross-ref", "$": {"refid": f"f{figure}"}, "_": f"Fig. {figure + 1}"}
+            )
+            if self.random.random() < 0.3:
+                children.append({"#name": "float-anchor", "$": {"refid": f"f{figure}"}})
+        if self.tables and self.random.random() < 0.1:
+            table = self.random.randrange(self.tables)
+            children.append({"#name": "float-anchor", "$": {"refid": f"t{table}"}})
+        if self.random.random() < 0.1:
+            children.append(
+                {
+                    "#name": "inter-ref",
+                    "$": {"href": "https://doi.org/10.1016/j.example.2020.01.001"},
+                    "_": "doi",
+                }
+            )
+        children.append({"#name": "__text__", "_": " " + self.words(10) + "."})
+        return {"#name": "para", "$": {"id": self.next_id("p")}, "$$": children}
+
+    def list(self, depth):
+        items = []
+        for index in range(self.random.randint(2, 5)):
+            children = [
+                {"#name": "label", "_": f"{index + 1}." if depth % 2 else "•"},
+                {"#name": "para", "$$": [{"#name": "__text__", "_": self.words(8)}]},
+            ]
+            if depth < 3 and self.random.random() < 0.3:
+                children.append(self.list(depth + 1))
+            items.append({"#name": "list-item", "$$": children})
+        return {"#name": "list", "$$": items}
+
+    def display(self):
+        formula = {
+            "#name": "formula",
+            "$": {"id": self.next_id("e")},
+            "$$": [{"#name": "label", "_": f"({self._ids})"}, self.math(display=True)],
+        }
+        return {"#name": "display", "$$": [formula]}
+
+    def math(self, display=False):
+        attributes = {"altimg": f"si{self.next_id('')}.svg"}
+        if display:
+            attributes["display"] = "block"
+        return {"#name": "math", "$": attributes, "$$": [self.math_node(self.math_depth)]}
+
+    def math_node(self, depth):
+        if depth == 0 or self.random.random() < 0.3:
+            if self.random.random() < 0.3:
+                return {"#name": "mn", "_": str(self.random.randint(0, 99))}
+            return {"#name": "mi", "_": self.random.choice(IDENTIFIERS)}
+        layout = self.random.choice(["mrow", "mfrac", "msub", "msup", "msubsup", "msqrt"])
+        if layout == "mrow":
+            children = []
+            for _ in range(self.random.randint(2, 4)):
+                if children:
+                    children.append({"#name": "mo", "_": self.random.choice(OPERATORS)})
+                children.append(self.math_node(depth - 1))
+        elif layout == "msqrt":
+            children = [self.math_node(depth - 1)]
+        else:
+            arity = 3 if layout == "msubsup" else 2
+            children = [self.math_node(depth - 1) for _ in range(arity)]
+        return {"#name": layout, "$$": children}
+
+    def figure(self, index):
+        return {
+            "#name": "figure",
+            "$": {"id": f"f{index}"},
+            "$$": [
+                {"#name": "label", "_": f"Fig. {index + 1}"},
+                {
+                    "#name": "caption",
+                    "$$": [{"#name": "simple-para", "_": self.words(15)}],
+                },
+                {"#name": "link", "$": {"locator": f"gr{index}"}},
+            ],
+        }
+
+    def table(self, index):
+        cols = self.table_cols
+        colspecs = [{"#name": "colspec", "$": {"colname": f"col{c + 1}"}} for c in range(cols)]
+        header = {
+            "#name": "row",
+            "$$": [{"#name": "entry", "_": self.words(2)} for _ in range(cols)],
+        }
+        rows = []
+        for _ in range(self.table_rows):
+            entries = []
+            column = 1
+            while column <= cols:
+                span = self.random.randint(2, 3) if self.random.random() < 0.1 else 1
+                end = min(cols, column + span - 1)
+                if end > column:
+                    attributes = {"namest": f"col{column}", "nameend": f"col{end}"}
+                else:
+                    attributes = {"colname": f"col{column}"}
+                if self.random.random() < 0.1:
+                    entry = {"#name": "entry", "$": attributes, "$$": [self.math()]}
+                else:
+                    value = f"{self.random.uniform(0, 1000):.2f}"
+                    entry = {"#name": "entry", "$": attributes, "_": value}
+                entries.append(entry)
+                column = end + 1
+            rows.append({"#name": "row", "$$": entries})
+        tgroup = {
+            "#name": "tgroup",
+            "$": {"cols": str(cols)},
+            "$$": colspecs
+            + [{"#name": "thead", "$$": [header]}, {"#name": "tbody", "$$": rows}],
+        }
+        return {
+            "#name": "table",
+            "$": {"id": f"t{index}"},
+            "$$": [
+                {"#name": "label", "_": f"Table {index + 1}"},
+                {"#name": "caption", "$$": [{"#name": "simple-para", "_": self.words(10)}]},
+                tgroup,
+                {
+                    "#name": "table-footnote",
+                    "$$": [
+                        {"#name": "label", "_": "a"},
+                        {"#name": "note-para", "_": self.words(6)},
+                    ],
+                },
+            ],
+        }
+
+
+def generate_document(**options):
+    """Returns a synthetic document; see `DocumentGenerator` for the options."""
+    return DocumentGenerator(**options).document()
+
+
+if __name__ == "__main__":
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    json.dump(generate_document(paragraphs=paragraphs), sys.stdout, ensure_ascii=False)
@@ -0,0 +1,66 @@
+import tempfile
+import zipfile
+
+# Archives larger than this are moved from memory to a temporary file
+SPOOL_SIZE = 32 * 1024 * 1024
+
+
+class MarkdownArchive:
+    """
+    A ZIP archive written one document at a time.
+
+    Each document is compressed as soon as it is added, so the caller can
+    drop its Markdown right away. The archive is held in memory until it
+    grows past `spool_size`, then in a temporary file.
+
+    Args:
+        compresslevel: The deflate level, 0 (fastest) to 9 (smallest);
+            None for zlib's default.
+        store_only: Store the documents uncompressed, the fastest option.
+        spool_size: Size in bytes past which the archive spills to disk.
+
+    Attributes:
+        count: Number of documents added.
+    """
+
+    def __init__(self, compresslevel=None, store_only=False, spool_size=SPOOL_SIZE):
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        compression = zipfile.ZIP_STORED if store_only else zipfile.ZIP_DEFLATED
+        self._zip = zipfile.ZipFile(
+            self.file,
+            "w",
+            compression,
+            compresslevel=None if store_only else compresslevel,
+        )
+        self.count = 0
+
+    def add(self, filename, content):
+        """Compresses `content` (str or bytes) into the archive as `filename`."""
+        self._zip.writestr(filename, content)
+        self.count += 1
+
+    def finish(self):
+        """
+        Writes the central directory.
+
+        Returns:
+            The archive file object, positioned at its start.
+        """
+        self._zip.close()
+        self.file.seek(0)
+        return self.file
+
+    @property
+    def spilled(self):
+        """Whether the archive was moved to a temporary file."""
+        return self.file._rolled
+
+    def close(self):
+        self._zip.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
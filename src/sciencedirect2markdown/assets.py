@@ -0,0 +1,282 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import http.client
+import os
+import tempfile
+import threading
+import urllib.parse
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+
+try:
+    from .caching import LRUCache, SQLiteStore
+except ImportError:  # run as a script by `streamlit run`
+    from caching import LRUCache, SQLiteStore
+
+IMAGE_BASE_URL = "https://ars.els-cdn.com/content/image/"
+
+# Statuses worth asking again for; others fail right away
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """
+    A download that failed.
+
+    Attributes:
+        url: The URL requested.
+        status: The HTTP status, or None when no response arrived.
+    """
+
+    def __init__(self, url, status=None, message=None):
+        super().__init__(f"{url}: {message or f'HTTP {status}'}")
+        self.url = url
+        self.status = status
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRY_STATUSES
+
+
+class HTTPFetcher:
+    """
+    Downloads URLs over pooled keep-alive connections.
+
+    Requests run in worker threads with `asyncio.to_thread`, each borrowing
+    an idle connection to the host when there is one, so a burst of images
+    from the same CDN pays for a handful of TLS handshakes instead of one
+    per image.
+
+    Args:
+        timeout: Socket timeout of a request, in seconds.
+        headers: Extra request headers.
+        pool_size: Idle connections kept per host.
+
+    Attributes:
+        connections: Number of connections opened.
+    """
+
+    def __init__(self, timeout=30, headers=None, pool_size=8):
+        self.timeout = timeout
+        self.headers = {"User-Agent": "sciencedirect2markdown", **(headers or {})}
+        self.pool_size = pool_size
+        self.connections = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    async def fetch(self, url):
+        """Returns the body of `url`, raising `FetchError` on failure."""
+        return await asyncio.to_thread(self.get, url)
+
+    def get(self, url):
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        connection = self._acquire(host)
+        try:
+            connection.request("GET", path, headers=self.headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise FetchError(url, message=str(e) or type(e).__name__) from e
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(host, connection)
+        if response.status != 200:
+            raise FetchError(url, response.status)
+        return body
+
+    def _acquire(self, host):
+        with self._lock:
+            idle = self._idle.get(host)
+            if idle:
+                return idle.pop()
+            self.connections += 1
+        scheme, netloc = host
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, host, connection):
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class RateLimiter:
+    """Spaces the starts of requests at least `1 / rate` seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AssetMirror:
+    """
+    Local copies of the images and attachments of documents.
+
+    Attachments are downloaded concurrently and stored in `directory` under
+    the hash of their content, so identical files are kept once however many
+    documents share them. An SQLite index in the same directory maps
+    attachment eids to their files: an eid is downloaded once, even across
+    runs. Only the `maxsize` most recently used entries of the index, and
+    of the failures, are kept in memory.
+
+    Args:
+        directory: Directory of the files, created if needed.
+        link_prefix: Prefix of the links to the files, e.g. their path
+            relative to the Markdown file. Defaults to `directory`.
+        fetcher: Object with an async `fetch(url)` method returning the body,
+            `HTTPFetcher()` by default. It should raise `FetchError` or
+            `OSError` on failure.
+        concurrency: Downloads in flight at once.
+        rate: Maximum downloads started per second; None for no limit.
+        retries: Attempts after the first for retryable failures.
+        backoff: Delay before the first retry, doubled for each next one.
+        base_url: URL the eids are appended to.
+        maxsize: Entries of the index and failures kept in memory.
+
+    Attributes:
+        paths: `LRUCache` of the file paths, relative to `directory`, by eid.
+        failures: Error by eid of the latest attachments that stay remote.
+        downloaded: Number of attachments downloaded.
+    """
+
+    def __init__(
+        self,
+        directory,
+        link_prefix=None,
+        fetcher=None,
+        concurrency=8,
+        rate=None,
+        retries=3,
+        backoff=0.5,
+        base_url=IMAGE_BASE_URL,
+        maxsize=4096,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.link_prefix = (
+            self.directory.as_posix() if link_prefix is None else link_prefix.rstrip("/")
+        )
+        self.fetcher = fetcher if fetcher is not None else HTTPFetcher()
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.base_url = base_url
+        self.maxsize = maxsize
+        self.store = SQLiteStore(self.directory / "index.sqlite", table="assets")
+        self.paths = LRUCache(maxsize=maxsize, store=self.store)
+        self.failures = OrderedDict()
+        self.downloaded = 0
+        self._lock = threading.Lock()
+
+    def link(self, eid):
+        """Returns the link to the local copy of `eid`, or None."""
+        relative = self.paths.get(eid)
+        return None if relative is None else f"{self.link_prefix}/{relative}"
+
+    def localize(self, eids):
+        """
+        Mirrors the attachments `eids`, blocking until all are done.
+
+        Returns:
+            The links of the attachments now available locally, by eid.
+            Failed ones are left out and recorded in `failures`.
+        """
+        coroutine = self.localize_async(eids)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        # asyncio.run can't nest in a running loop, e.g. in a notebook
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+    async def localize_async(self, eids):
+        """The coroutine behind `localize`."""
+        eids = [eid for eid in dict.fromkeys(eids) if eid]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate) if self.rate else None
+        links = await asyncio.gather(
+            *(self._localize(eid, semaphore, limiter) for eid in eids)
+        )
+        return {eid: link for eid, link in zip(eids, links) if link is not None}
+
+    async def _localize(self, eid, semaphore, limiter):
+        relative = self.paths.get(eid)
+        if relative is None or not (self.directory / relative).exists():
+            try:
+                body = await self._fetch(self.base_url + eid, semaphore, limiter)
+            except (FetchError, OSError) as e:
+                with self._lock:
+                    self.failures[eid] = str(e)
+                    self.failures.move_to_end(eid)
+                    if len(self.failures) > self.maxsize:
+                        self.failures.popitem(last=False)
+                return None
+            relative = self._write(body, PurePosixPath(eid).suffix)
+            self.paths.put(eid, relative)
+            with self._lock:
+                self.downloaded += 1
+        with self._lock:
+            self.failures.pop(eid, None)
+        return f"{self.link_prefix}/{relative}"
+
+    async def _fetch(self, url, semaphore, limiter):
+        for attempt in range(self.retries + 1):
+            if limiter is not None:
+                await limiter.wait()
+            try:
+                async with semaphore:
+                    return await self.fetcher.fetch(url)
+            except (FetchError, OSError) as e:
+                if attempt == self.retries or not getattr(e, "retryable", True):
+                    raise
+            await asyncio.sleep(self.backoff * 2**attempt)
+
+    def _write(self, body, suffix):
+        digest = hashlib.sha256(body).hexdigest()
+        relative = f"{digest[:2]}/{digest}{suffix}"
+        path = self.directory / relative
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with open(fd, "wb") as f:
+                    f.write(body)
+                os.replace(temp_path, path)
+            except BaseException:
+                Path(temp_path).unlink(missing_ok=True)
+                raise
+        return relative
+
+    def close(self):
+        if hasattr(self.fetcher, "close"):
+            self.fetcher.close()
+        self.store.close()
@@ -0,0 +1,323 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+
+try:
+    from .jsonio import STREAMING_THRESHOLD
+except ImportError:  # run as a script by `streamlit run`
+    from jsonio import STREAMING_THRESHOLD
+
+
+class BatchResult:
+    """
+    The outcome of converting one source.
+
+    Attributes:
+        name: The source name, e.g. the uploaded file name.
+        markdown: The Markdown output, or None if the conversion failed.
+        error: The error message, or None on success.
+        seconds: Time spent converting.
+        size: Size of the input in bytes.
+    """
+
+    __slots__ = ("name", "markdown", "error", "seconds", "size")
+
+    def __init__(self, name, markdown=None, error=None, seconds=0.0, size=0):
+        self.name = name
+        self.markdown = markdown
+        self.error = error
+        self.seconds = seconds
+        self.size = size
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchStats:
+    """Throughput counters of a batch run."""
+
+    def __init__(self):
+        self.files = 0
+        self.failures = 0
+        self.input_bytes = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, result):
+        self.files += 1
+        self.input_bytes += result.size
+        if not result.ok:
+            self.failures += 1
+        self.seconds = time.perf_counter() - self.started
+
+    @property
+    def docs_per_second(self):
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.input_bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (
+            f"{self.files} files ({self.failures} failed) in {self.seconds:.2f}s: "
+            f"{self.docs_per_second:.1f} docs/s, {self.mb_per_second:.2f} MB/s"
+        )
+
+
+def _converters():
+    try:
+        from .streamlitweb import convert_json_file, convert_json_string
+    except ImportError:  # run as a script by `streamlit run`
+        from streamlitweb import convert_json_file, convert_json_string
+    return convert_json_string, convert_json_file
+
+
+def _iterators():
+    try:
+        from .streamlitweb import iter_json_string, iter_markdown_file
+    except ImportError:  # run as a script by `streamlit run`
+        from streamlitweb import iter_json_string, iter_markdown_file
+    return iter_json_string, iter_markdown_file
+
+
+def _convert_path(convert_file, path):
+    with open(path, "rb") as fp:
+        return convert_file(fp)
+
+
+def _iter_path(iter_file, path):
+    with open(path, "rb") as fp:
+        yield from iter_file(fp)
+
+
+def _write_fragments(fragments, target):
+    # Written next to the target first, so it never holds partial output
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = target.with_name(target.name + ".part")
+    try:
+        with open(partial_path, "w", encoding="utf-8") as f:
+            for text in fragments:
+                f.write(text)
+        os.replace(partial_path, target)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+
+
+def convert_source(name, payload, target=None):
+    """
+    Converts a single JSON payload, turning any failure into an error result.
+
+    Args:
+        name: The source name.
+        payload: The JSON document as bytes or str, or a path to read it from.
+            Files larger than `STREAMING_THRESHOLD` are streamed from disk.
+        target: Optional path to write the Markdown to, fragment by fragment
+            as it is rendered, instead of returning it in the result.
+
+    Returns:
+        A `BatchResult`.
+    """
+    start = time.perf_counter()
+    size = 0
+    try:
+        if isinstance(payload, os.PathLike):
+            size = os.path.getsize(payload)
+            streamed = size > STREAMING_THRESHOLD
+            if not streamed:
+                payload = Path(payload).read_bytes()
+        else:
+            size = len(payload)
+            streamed = False
+        if target is None:
+            convert_string, convert_file = _converters()
+            if streamed:
+                convert = partial(_convert_path, convert_file, payload)
+            else:
+                convert = partial(convert_string, payload)
+        else:
+            iter_string, iter_file = _iterators()
+            if streamed:
+                fragments = _iter_path(iter_file, payload)
+            else:
+                fragments = iter_string(payload)
+            convert = partial(_write_fragments, fragments, target)
+        markdown = convert()
+        error = None
+    except Exception as e:
+        markdown = None
+        error = str(e)
+    return BatchResult(name, markdown, error, time.perf_counter() - start, size)
+
+
+def convert_batch(
+    sources, workers=None, timeout=None, progress=None, stats=None, targets=None
+):
+    """
+    Converts many sources on a process pool, yielding results as they complete.
+
+    Args:
+        sources: Iterable of (name, payload) pairs, see `convert_source`.
+        workers: Number of worker processes; defaults to the CPU count. With
+            one worker, or a single source, everything runs in-process unless
+            there is a timeout.
+        timeout: Optional per-source limit in seconds. Sources then always
+            run in worker processes, and a worker past the limit is killed
+            and replaced, whatever it is doing.
+        progress: Optional callback called as `progress(done, total, result)`.
+        stats: Optional `BatchStats` updated with every result.
+        targets: Optional output path by source name. Those sources are
+            written there as they are rendered, see `convert_source`.
+
+    Yields:
+        A `BatchResult` per source, in completion order.
+    """
+    sources = list(sources)
+    total = len(sources)
+    if stats is None:
+        stats = BatchStats()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, total)
+    targets = targets or {}
+
+    def report(result):
+        stats.add(result)
+        if progress is not None:
+            progress(stats.files, total, result)
+        return result
+
+    if timeout:
+        for result in _convert_with_deadlines(sources, workers, timeout, targets):
+            yield report(result)
+        return
+
+    if workers <= 1:
+        for name, payload in sources:
+            yield report(convert_source(name, payload, targets.get(name)))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {
+            pool.submit(convert_source, name, payload, targets.get(name)): name
+            for name, payload in sources
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # e.g. a worker process died
+                    result = BatchResult(name, error=str(e))
+                yield report(result)
+
+
+def _serve(connection):
+    # Worker process of `_convert_with_deadlines`: converts the sources it
+    # receives until it gets None
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        connection.send(convert_source(*task))
+
+
+class _Worker:
+    """A worker process converting one source at a time, which can be killed."""
+
+    def __init__(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.name = None
+        self.target = None
+        self.size = 0
+        self.started = 0.0
+
+    def submit(self, name, payload, target):
+        self.name = name
+        self.target = target
+        if isinstance(payload, os.PathLike):
+            self.size = os.path.getsize(payload)
+        else:
+            self.size = len(payload)
+        self.started = time.perf_counter()
+        self.connection.send((name, payload, target))
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _convert_with_deadlines(sources, workers, timeout, targets):
+    # Runs the sources on `workers` processes, killing any that runs a source
+    # for more than `timeout` seconds; a new process takes its place. Unlike
+    # an alarm in the worker, this also stops a long libxslt call.
+    queue = deque(sources)
+    idle = []
+    busy = {}
+    try:
+        while queue or busy:
+            while queue and len(busy) < max(workers, 1):
+                worker = idle.pop() if idle else _Worker()
+                name, payload = queue.popleft()
+                worker.submit(name, payload, targets.get(name))
+                busy[worker.connection] = worker
+            deadline = min(worker.started for worker in busy.values()) + timeout
+            ready = multiprocessing.connection.wait(
+                list(busy), max(0.0, deadline - time.perf_counter())
+            )
+            for connection in ready:
+                worker = busy.pop(connection)
+                try:
+                    result = connection.recv()
+                except (EOFError, OSError):
+                    worker.kill()
+                    result = BatchResult(
+                        worker.name,
+                        error=f"Worker exited with code {worker.process.exitcode}",
+                        size=worker.size,
+                    )
+                else:
+                    idle.append(worker)
+                yield result
+            now = time.perf_counter()
+            for connection, worker in list(busy.items()):
+                if now - worker.started >= timeout:
+                    del busy[connection]
+                    worker.kill()
+                    if worker.target is not None:
+                        # What `_write_fragments` had written when it was killed
+                        target = Path(worker.target)
+                        target.with_name(target.name + ".part").unlink(missing_ok=True)
+                    yield BatchResult(
+                        worker.name,
+                        error=f"Conversion timed out after {timeout}s",
+                        seconds=now - worker.started,
+                        size=worker.size,
+                    )
+    finally:
+        for worker in idle:
+            worker.stop()
+        for worker in busy.values():
+            worker.kill()
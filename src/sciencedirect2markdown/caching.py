@@ -0,0 +1,369 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    from .xslt import MATHCONVERTER_DIR
+except ImportError:  # run as a script by `streamlit run`
+    from xslt import MATHCONVERTER_DIR
+
+_MISSING = object()
+
+
+def content_key(data, *salt):
+    """
+    Builds a content-addressed key for a JSON subtree.
+
+    Args:
+        data: Any JSON-serialisable value.
+        salt: Extra strings mixed into the key, e.g. the backend name.
+
+    Returns:
+        A hex SHA-256 digest of the canonical JSON encoding.
+    """
+    digest = hashlib.sha256()
+    for part in salt:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    canonical = encode_json(data, sort_keys=True, ensure_ascii=False)
+    digest.update(canonical.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def encode_json(data, sort_keys=False, ensure_ascii=True):
+    """
+    Returns the compact JSON encoding of `data`, like `json.dumps` with
+    `separators=(",", ":")`, however deeply it is nested.
+
+    Trees deeper than the recursion limit, e.g. nested MathML, are encoded
+    on an explicit stack to the same text.
+    """
+    try:
+        return json.dumps(
+            data, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=ensure_ascii
+        )
+    except RecursionError:
+        pass
+    dumps = functools.partial(json.dumps, ensure_ascii=ensure_ascii)
+    parts = []
+    # (value, is_text) pairs, the next one to encode last
+    stack = [(data, False)]
+    while stack:
+        value, is_text = stack.pop()
+        if is_text:
+            parts.append(value)
+        elif isinstance(value, dict):
+            items = sorted(value.items()) if sort_keys else list(value.items())
+            stack.append(("}", True))
+            for i in range(len(items) - 1, -1, -1):
+                key, item = items[i]
+                stack.append((item, False))
+                stack.append((("," if i else "") + dumps(key) + ":", True))
+            stack.append(("{", True))
+        elif isinstance(value, (list, tuple)):
+            stack.append(("]", True))
+            for i in range(len(value) - 1, -1, -1):
+                stack.append((value[i], False))
+                if i:
+                    stack.append((",", True))
+            stack.append(("[", True))
+        else:
+            parts.append(dumps(value))
+    return "".join(parts)
+
+
+def payload_key(payload, *salt):
+    """
+    Builds a content-addressed key for a raw payload, without parsing it.
+
+    Args:
+        payload: The document as str or bytes.
+        salt: Extra strings mixed into the key, e.g. the converter version.
+
+    Returns:
+        A hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in salt:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8", "surrogatepass")
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+class SQLiteStore:
+    """A persistent string-to-string store backed by a single SQLite table."""
+
+    def __init__(self, path, table="cache"):
+        self.path = str(path)
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT value FROM "{self.table}" WHERE key = ?', (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}" (key, value) VALUES (?, ?)',
+                (key, value),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f'DELETE FROM "{self.table}"')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU cache with an optional persistent tier.
+
+    Lookups that miss in memory fall through to `store` (if any); values found
+    there are promoted back into memory. Every `put` is written through.
+    """
+
+    def __init__(self, maxsize=1024, store=None):
+        self.maxsize = maxsize
+        self.store = store
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._insert(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._insert(key, value)
+        if self.store is not None:
+            self.store.put(key, value)
+
+    def stats(self):
+        """Returns the hit/miss/eviction counters and the current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        """Empties the in-memory tier and resets the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _insert(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache bounded by entry count and total size, whose
+    entries expire `ttl` seconds after they were stored.
+
+    Sizes are measured with `sizeof`; the least recently used entries are
+    evicted until both bounds hold. A value larger than `maxbytes` is not
+    stored at all.
+    """
+
+    def __init__(self, maxsize=1024, maxbytes=None, ttl=None, sizeof=len, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, size, expiry time or None)
+        self._data = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.bytes > self.maxbytes
+            ):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def stats(self):
+        """Returns the counters, the current size and the bytes held."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._data),
+                "bytes": self.bytes,
+                "maxbytes": self.maxbytes,
+            }
+
+    def clear(self):
+        """Empties the cache and resets the counters."""
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        self.bytes -= self._data.pop(key)[1]
+
+
+class SectionCache:
+    """
+    Rendered Markdown of document sections, kept across conversions.
+
+    Each entry holds the Markdown of a section, the floats it rendered (they
+    are marked as processed again when the entry is reused) and the time the
+    rendering took, which is what a hit saves.
+    """
+
+    def __init__(self, maxsize=256, store=None):
+        self.entries = LRUCache(maxsize=maxsize, store=store)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.lookup_seconds = 0.0
+
+    def get(self, key, lookup_seconds=0.0):
+        """
+        Returns the entry stored under `key` as a dict with "markdown",
+        "floats" and "seconds", or None.
+
+        Args:
+            key: The section key.
+            lookup_seconds: Time spent computing the key, counted against
+                the time saved.
+        """
+        value = self.entries.get(key)
+        entry = json.loads(value) if value is not None else None
+        with self._lock:
+            self.lookup_seconds += lookup_seconds
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.seconds_saved += entry["seconds"]
+        return entry
+
+    def put(self, key, markdown, floats=(), seconds=0.0):
+        value = {"markdown": markdown, "floats": sorted(floats), "seconds": seconds}
+        self.entries.put(key, json.dumps(value, ensure_ascii=False))
+
+    def stats(self):
+        """
+        Returns the hit/miss counters, the hit rate and the rendering time
+        saved by hits, net of the time spent looking sections up.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.seconds_saved - self.lookup_seconds,
+            }
+
+    def clear(self):
+        """Empties the in-memory tier and resets the counters."""
+        self.entries.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+            self.seconds_saved = self.lookup_seconds = 0.0
+
+
+@functools.lru_cache(maxsize=None)
+def converter_version():
+    """
+    Returns a version string that changes with the converter's code.
+
+    Persistent caches of rendered Markdown mix it into their keys, so output
+    of an older converter is never reused. It hashes the package's modules
+    and the XSLT stylesheets.
+    """
+    digest = hashlib.sha256()
+    paths = sorted(Path(__file__).parent.glob("*.py"))
+    paths += sorted(MATHCONVERTER_DIR.rglob("*.xsl"))
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
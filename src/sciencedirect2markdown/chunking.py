@@ -0,0 +1,197 @@
+import string
+
+# Text made of these only, like block separators and rules, is blank
+_BLANK = string.whitespace + "-"
+
+
+def _is_blank(text):
+    return not text.strip(_BLANK)
+
+
+class Chunk:
+    """
+    A piece of the Markdown of a document, cut between blocks.
+
+    Attributes:
+        index: Position of the chunk in the document, from 0.
+        text: The Markdown.
+        start: Offset of the text in the whole Markdown output.
+        end: Offset of the end of the text.
+        section_path: Headings of the enclosing sections, outermost first.
+        label: Label of the innermost section, e.g. "2.1", or "".
+        float_ids: Ids of the floats (figures, tables) rendered in the chunk.
+        size: Size of the text, as measured by the `Chunker`.
+    """
+
+    __slots__ = ("index", "text", "start", "end", "section_path", "label", "float_ids", "size")
+
+    def __init__(self, index, text, start, section_path=(), label="", float_ids=(), size=0):
+        self.index = index
+        self.text = text
+        self.start = start
+        self.end = start + len(text)
+        self.section_path = tuple(section_path)
+        self.label = label
+        self.float_ids = list(float_ids)
+        self.size = size
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "text": self.text,
+            "start": self.start,
+            "end": self.end,
+            "section_path": list(self.section_path),
+            "label": self.label,
+            "float_ids": self.float_ids,
+            "size": self.size,
+        }
+
+
+class Chunker:
+    """
+    Groups blocks of Markdown into chunks of at most `max_size`.
+
+    Blocks are added in document order with the section they belong to. A
+    chunk never spans two sections and is only cut between blocks, unless a
+    single block is larger than `max_size`: that one is cut between lines,
+    or anywhere in overlong lines. Blank text (whitespace and rules) never
+    makes a chunk of its own: it goes with the text after it, or ends the
+    last chunk, so each chunk is returned once the next one is cut.
+
+    Args:
+        max_size: The budget of a chunk.
+        measure: Returns the size of a text; `len` counts characters, a
+            tokenizer's counting function makes it a token budget. Sizes are
+            added up block by block.
+    """
+
+    def __init__(self, max_size=4000, measure=len):
+        if max_size < 1:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.measure = measure
+        self.offset = 0
+        self.count = 0
+        self._parts = []
+        self._size = 0
+        self._section = None
+        self._float_ids = []
+        # Whether the parts are all blank
+        self._blank = True
+        # The last chunk cut, held back in case blank text ends the document
+        self._held = None
+
+    def add(self, text, section=((), ""), float_ids=()):
+        """
+        Adds a block of Markdown.
+
+        Args:
+            text: The Markdown of the block.
+            section: (section path, label) of the block.
+            float_ids: Floats rendered in the block.
+
+        Returns:
+            The chunks completed by this block.
+        """
+        chunks = []
+        if self._parts and section != self._section and not self._blank:
+            chunks += self._complete()
+        if not text:
+            if float_ids:
+                self._section = section
+                self._float_ids.extend(float_ids)
+            return chunks
+        self._section = section
+        if self._parts and self._blank:
+            text = "".join(self._parts) + text
+            self._parts = []
+            self._size = 0
+        size = self.measure(text)
+        if self._parts and self._size + size > self.max_size:
+            chunks += self._complete()
+        if size > self.max_size:
+            pieces = list(self._split(text))
+            for piece, piece_size in pieces[:-1]:
+                self._append(piece, piece_size)
+                chunks += self._complete()
+            text, size = pieces[-1]
+        self._append(text, size)
+        self._float_ids.extend(float_ids)
+        return chunks
+
+    def flush(self):
+        """Returns the chunks left, if any."""
+        held, self._held = self._held, None
+        if self._parts and self._blank and held is not None:
+            held.text += "".join(self._parts)
+            held.end = held.start + len(held.text)
+            held.size += self._size
+            held.float_ids = list(dict.fromkeys(held.float_ids + self._float_ids))
+            self.offset = held.end
+            self._parts = []
+            self._size = 0
+            self._float_ids = []
+        chunks = [held] if held is not None else []
+        if self._parts:
+            chunks.append(self._cut())
+        return chunks
+
+    def _append(self, text, size):
+        self._parts.append(text)
+        self._size += size
+        if self._blank and not _is_blank(text):
+            self._blank = False
+
+    def _complete(self):
+        # Cuts a chunk and returns the one held before it
+        held, self._held = self._held, self._cut()
+        return [held] if held is not None else []
+
+    def _cut(self):
+        path, label = self._section
+        chunk = Chunk(
+            self.count,
+            "".join(self._parts),
+            self.offset,
+            path,
+            label,
+            dict.fromkeys(self._float_ids),
+            self._size,
+        )
+        self.count += 1
+        self.offset = chunk.end
+        self._parts = []
+        self._size = 0
+        self._float_ids = []
+        self._blank = True
+        return chunk
+
+    def _split(self, text):
+        # Yields (piece, size) pairs of at most max_size, cut after newlines.
+        # Blank lines are kept with the line after them.
+        piece = []
+        piece_size = 0
+        blank = True
+        for line in text.splitlines(keepends=True):
+            size = self.measure(line)
+            if piece and piece_size + size > self.max_size:
+                if blank:
+                    line = "".join(piece) + line
+                    size = self.measure(line)
+                else:
+                    yield "".join(piece), piece_size
+                piece = []
+                piece_size = 0
+                blank = True
+            while size > self.max_size and len(line) > 1:
+                # Cut an overlong line in proportion to its size
+                cut = max(1, len(line) * self.max_size // size)
+                head, line = line[:cut], line[cut:]
+                yield head, self.measure(head)
+                size = self.measure(line)
+            piece.append(line)
+            piece_size += size
+            if blank and not _is_blank(line):
+                blank = False
+        yield "".join(piece), piece_size
@@ -0,0 +1,169 @@
+import argparse
+import glob
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    from .batch import BatchStats, convert_batch
+except ImportError:  # run as a script
+    from batch import BatchStats, convert_batch
+
+
+def has_magic(pattern):
+    return any(char in pattern for char in "*?[")
+
+
+def glob_root(pattern):
+    """Returns the leading directories of a glob pattern that contain no wildcard."""
+    parts = []
+    for part in Path(pattern).parts:
+        if has_magic(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def collect_inputs(patterns):
+    """
+    Expands the command-line inputs into JSON files.
+
+    Args:
+        patterns: Files, directories (searched recursively for *.json) or glob
+            patterns.
+
+    Returns:
+        A list of (path, root) pairs, where `root` is the directory the path is
+        mirrored from when writing into an output directory.
+    """
+    inputs = []
+    seen = set()
+    for pattern in patterns:
+        if has_magic(pattern):
+            root = glob_root(pattern)
+            paths = [Path(p) for p in sorted(glob.glob(pattern, recursive=True))]
+        elif os.path.isdir(pattern):
+            root = Path(pattern)
+            paths = sorted(root.rglob("*.json"))
+        else:
+            root = Path(pattern).parent
+            paths = [Path(pattern)]
+        for path in paths:
+            if path.is_file() and path.resolve() not in seen:
+                seen.add(path.resolve())
+                inputs.append((path, root))
+    return inputs
+
+
+def output_path(path, root, output_dir=None):
+    """Returns where the Markdown for `path` is written."""
+    if output_dir is None:
+        return path.with_suffix(".md")
+    return Path(output_dir) / path.relative_to(root).with_suffix(".md")
+
+
+def is_up_to_date(source, target):
+    """Whether `target` exists and is at least as new as `source`."""
+    try:
+        return target.stat().st_mtime >= source.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="sciencedirect2markdown",
+        description="Convert ScienceDirect body JSON files to Markdown.",
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="JSON files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="write into a mirror of the input tree instead of next to the inputs",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="per-file limit in seconds"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="convert even if the output is newer"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="only print the final summary"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="time the tag handlers (in-process, so not with --timeout) and write "
+        "the results to FILE as JSON, plus a collapsed-stack FILE.folded for "
+        "flame graphs",
+    )
+    return parser
+
+
+@contextmanager
+def profiling(path, quiet=False):
+    """Profiles the handlers in the block and writes the results to `path`."""
+    if path is None:
+        yield
+        return
+    try:
+        from .streamlitweb import profile_handlers
+    except ImportError:  # run as a script
+        from streamlitweb import profile_handlers
+    with profile_handlers() as profiler:
+        yield
+    profiler.write_json(path)
+    profiler.write_collapsed(Path(path).with_suffix(".folded"))
+    if not quiet:
+        print(profiler.summary())
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.profile and args.timeout:
+        # A deadline needs a worker process to kill, and workers would keep
+        # their timings to themselves
+        parser.error("--timeout cannot be used with --profile")
+
+    targets = {}
+    skipped = 0
+    for path, root in collect_inputs(args.inputs):
+        target = output_path(path, root, args.output_dir)
+        if not args.force and is_up_to_date(path, target):
+            skipped += 1
+            continue
+        targets[str(path)] = target
+
+    def progress(done, total, result):
+        if not args.quiet:
+            status = "ok" if result.ok else "FAILED"
+            print(f"[{done}/{total}] {status} {result.name} ({result.seconds:.2f}s)")
+
+    stats = BatchStats()
+    failures = []
+    sources = [(name, Path(name)) for name in targets]
+    jobs = 1 if args.profile else args.jobs
+    with profiling(args.profile, args.quiet):
+        # Each output is written as it is rendered, by the worker converting it
+        for result in convert_batch(sources, jobs, args.timeout, progress, stats, targets):
+            if not result.ok:
+                failures.append(result)
+
+    converted = stats.files - len(failures)
+    print(f"Converted: {converted}, skipped: {skipped}, failed: {len(failures)}")
+    if stats.files:
+        print(stats.summary())
+    for result in failures:
+        print(f"  {result.name}: {result.error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import contextvars
+from contextlib import contextmanager
+
+try:
+    from .index import DocumentIndex
+except ImportError:  # run as a script by `streamlit run`
+    from index import DocumentIndex
+
+
+class ConversionContext:
+    """
+    The state of one document conversion.
+
+    Attributes:
+        index: The `DocumentIndex` of the document being converted.
+        processed_floats: Ids of the floats already rendered at an anchor.
+        render_seconds: Time spent rendering, to compare with `index.seconds`.
+        prepared_math: Markdown of the equations converted ahead of rendering,
+            by `id` of their node. See `prepare_math`.
+        math_failures: Number of equations the XSLT couldn't convert.
+        in_section: Whether a top-level section is being rendered, so that
+            only those go through the section cache.
+        asset_links: Links to the local copies of attachments, by eid. See
+            `AssetMirror`.
+        normalize_nodes: Whether the output of every node is post-processed
+            on its own, see `render_normalized`.
+    """
+
+    def __init__(self, index=None):
+        self.index = index if index is not None else DocumentIndex()
+        self.processed_floats = set()
+        self.render_seconds = 0.0
+        self.prepared_math = {}
+        self.math_failures = 0
+        self.in_section = False
+        self.asset_links = {}
+        self.normalize_nodes = False
+
+
+_current_context = contextvars.ContextVar("conversion_context")
+
+
+def current_context():
+    """
+    Returns the context of the conversion running in this thread or task.
+
+    Handlers called outside `use_context` get a context of their own that is
+    kept for the rest of the calling thread.
+    """
+    try:
+        return _current_context.get()
+    except LookupError:
+        context = ConversionContext()
+        _current_context.set(context)
+        return context
+
+
+@contextmanager
+def use_context(context=None):
+    """
+    Makes `context` (or a new one) current for the duration of the block.
+
+    Contexts are stored in a `ContextVar`, so conversions running in parallel
+    threads never see each other's state, and the state is released as soon
+    as the block exits.
+    """
+    if context is None:
+        context = ConversionContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
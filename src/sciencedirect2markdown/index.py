@@ -0,0 +1,116 @@
+import time
+
+THUMBNAIL = "IMAGE-THUMBNAIL"
+HIGH_RES = "IMAGE-HIGH-RES"
+
+
+class DocumentIndex:
+    """
+    Lookup tables of one document, built once before rendering.
+
+    Attributes:
+        attachments: attachment-eid by file-basename. A thumbnail is only used
+            when nothing else exists for the basename; otherwise the last
+            other attachment wins, or the high-res one with `prefer_high_res`.
+        floats: Float (figure/table) nodes by id.
+        targets: Every node that carries an id, by id. These are what
+            `cross-ref` and `float-anchor` refids point at. Rendering doesn't
+            need them, so the content is only walked on first access.
+        documents: Number of documents added.
+        seconds: Time spent indexing.
+    """
+
+    def __init__(self, prefer_high_res=False):
+        self.prefer_high_res = prefer_high_res
+        self.attachments = {}
+        self.floats = {}
+        self.documents = 0
+        self.seconds = 0.0
+        self._targets = {}
+        self._unwalked = []
+        self._attachment_ranks = {}
+
+    @property
+    def targets(self):
+        if self._unwalked:
+            start = time.perf_counter()
+            for data in self._unwalked:
+                self.add_targets(data)
+            self._unwalked.clear()
+            self.seconds += time.perf_counter() - start
+        return self._targets
+
+    def add_document(self, data):
+        """Indexes the attachments and floats of a JSON document."""
+        start = time.perf_counter()
+        if isinstance(data, dict):
+            if "attachments" in data:
+                self.add_attachments(data["attachments"])
+            if "floats" in data:
+                self.add_floats(data["floats"])
+            self._unwalked.append(data.get("content", data))
+        self.documents += 1
+        self.seconds += time.perf_counter() - start
+
+    def add_attachments(self, attachments):
+        for attachment in attachments:
+            file_basename = attachment.get("file-basename")
+            attachment_eid = attachment.get("attachment-eid")
+            if file_basename is None or attachment_eid is None:
+                continue
+            rank = self._rank(attachment.get("attachment-type"))
+            current = self._attachment_ranks.get(file_basename)
+            if current is None or (rank and rank >= current):
+                self.attachments[file_basename] = attachment_eid
+                self._attachment_ranks[file_basename] = rank
+
+    def add_floats(self, floats):
+        for float_item in floats:
+            if "$" in float_item and "id" in float_item["$"]:
+                float_id = float_item["$"]["id"]
+                self.floats[float_id] = float_item
+                self._targets[float_id] = float_item
+
+    def add_targets(self, data):
+        """Records every node with an id under `data`."""
+        targets = self._targets
+        stack = list(data) if isinstance(data, list) else [data]
+        while stack:
+            node = stack.pop()
+            # Children may be bare strings (in math) or nested lists
+            if type(node) is list:
+                stack.extend(node)
+                continue
+            if type(node) is not dict:
+                continue
+            attributes = node.get("$")
+            if attributes and "id" in attributes:
+                targets.setdefault(attributes["id"], node)
+            children = node.get("$$")
+            if children:
+                stack.extend(children)
+
+    def _rank(self, attachment_type):
+        # Missing types count as thumbnails: they never replace anything
+        if attachment_type is None or attachment_type == THUMBNAIL:
+            return 0
+        if self.prefer_high_res and attachment_type == HIGH_RES:
+            return 2
+        return 1
+
+
+def build_index(data, prefer_high_res=False):
+    """
+    Builds the `DocumentIndex` of a JSON document.
+
+    Args:
+        data: The parsed ScienceDirect JSON document.
+        prefer_high_res: Link figures to their high-res attachment when the
+            document has one.
+
+    Returns:
+        The `DocumentIndex`.
+    """
+    index = DocumentIndex(prefer_high_res)
+    index.add_document(data)
+    return index
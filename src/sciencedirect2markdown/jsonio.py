@@ -0,0 +1,290 @@
+import codecs
+import json
+import re
+from json.decoder import scanstring
+
+_TOKEN_RE = re.compile(
+    r"""[ \t\n\r]*(?:
+        ([{}\[\]:,])
+      | "([^"\\]*(?:\\.[^"\\]*)*)"
+      | (-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?)
+      | (true|false|null)
+    )""",
+    re.S | re.X,
+)
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+# Characters that may continue a number, e.g. after "1." or "1e-"
+_NUMBER_TAIL_RE = re.compile(r"[0-9.eE+-]*")
+# Everything up to the next bracket that is not inside a string
+_SKIP_RE = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_TRAILING_COMMA_RE = re.compile(r",[ \t\n\r]*[}\]]")
+# Text and whole string literals, i.e. stops only inside an unfinished string
+_OUTSIDE_STRINGS_RE = re.compile(r'(?:[^"]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_LITERALS = {"true": True, "false": False, "null": None}
+
+# Payloads larger than this are converted section by section instead of being
+# parsed whole; the incremental tokenizer is slower than `json.loads`.
+STREAMING_THRESHOLD = 16 * 1024 * 1024
+
+# Token kinds besides the structural characters "{", "}", "[", "]", ":" and ","
+VALUE = "value"
+END = "end"
+
+
+class TokenStream:
+    """
+    Incremental JSON tokenizer over a file object.
+
+    The file is read in chunks, so only the current chunk and any token that
+    straddles a chunk boundary are held in memory. Both text and binary (UTF-8)
+    files are accepted.
+    """
+
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def _fill(self):
+        """Reads the next chunk; returns False at end of file."""
+        if self.eof:
+            return False
+        while True:
+            chunk = self.fp.read(self.chunk_size)
+            if not isinstance(chunk, bytes):
+                break
+            text = self._decoder.decode(chunk, final=not chunk)
+            # Nothing is decoded from a read ending inside a UTF-8 sequence
+            if text or not chunk:
+                chunk = text
+                break
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def next(self):
+        """
+        Returns the next token as a (kind, value) pair.
+
+        `kind` is one of the structural characters, `VALUE` for strings,
+        numbers and literals, or `END` once the input is exhausted.
+        """
+        while True:
+            buffer = self.buffer
+            match = _TOKEN_RE.match(buffer, self.pos)
+            # A token that ends the buffer may continue in the next chunk, as
+            # may a number followed by what is left of it, e.g. "1." of "1.5"
+            if (
+                match is None
+                or match.end() == len(buffer)
+                or (
+                    match.lastindex == 3
+                    and _NUMBER_TAIL_RE.match(buffer, match.end()).end() == len(buffer)
+                )
+            ) and self._fill():
+                continue
+            if match is None:
+                self.pos = _WHITESPACE_RE.match(self.buffer, self.pos).end()
+                if self.pos == len(self.buffer):
+                    return END, None
+                raise self.error(f"Unexpected character {self.buffer[self.pos]!r}")
+
+            self.pos = match.end()
+            group = match.lastindex
+            if group == 1:
+                return match.group(1), None
+            if group == 2:
+                value = match.group(2)
+                if "\\" in value:
+                    value = scanstring(self.buffer, match.start(2))[0]
+                return VALUE, value
+            if group == 3:
+                text = match.group(3)
+                if "." in text or "e" in text or "E" in text:
+                    return VALUE, float(text)
+                return VALUE, int(text)
+            return VALUE, _LITERALS[match.group(4)]
+
+    def read_container(self, capture=True):
+        """
+        Consumes the rest of an object or array whose opening bracket was the
+        last token, without tokenizing its contents.
+
+        Args:
+            capture: Whether to return the source text of the container.
+
+        Returns:
+            The container's JSON text (brackets included), or None.
+        """
+        parts = []
+        begin = self.pos - 1
+        depth = 1
+        while depth:
+            buffer = self.buffer
+            pos = _SKIP_RE.match(buffer, self.pos).end()
+            if pos == len(buffer) or buffer[pos] == '"':
+                # The buffer ends here or inside a string; read on
+                self.pos = pos
+                if capture:
+                    parts.append(buffer[begin:pos])
+                begin = 0
+                if not self._fill():
+                    raise self.error("Unexpected end of input")
+                continue
+            self.pos = pos + 1
+            depth += 1 if buffer[pos] in "{[" else -1
+        if capture:
+            parts.append(self.buffer[begin : self.pos])
+            return "".join(parts)
+        return None
+
+    def expect(self, kind):
+        token = self.next()
+        if token[0] != kind:
+            raise self.error(f"Expected {kind!r}, got {token[0]!r}")
+        return token
+
+
+def iter_object(stream):
+    """
+    Yields the keys of an object whose "{" was just consumed.
+
+    After each key (and its ":") the caller must consume the value, e.g. with
+    `parse_value` or `skip_value`. Trailing commas are accepted.
+    """
+    kind, key = stream.next()
+    while kind != "}":
+        if kind != VALUE or not isinstance(key, str):
+            raise stream.error("Expected an object key")
+        stream.expect(":")
+        yield key
+        kind, _ = stream.next()
+        if kind == "}":
+            return
+        if kind != ",":
+            raise stream.error("Expected ',' or '}'")
+        kind, key = stream.next()
+
+
+def iter_array(stream):
+    """
+    Yields the first token of every element of an array whose "[" was just
+    consumed. The caller must consume the rest of each element. Trailing
+    commas are accepted.
+    """
+    token = stream.next()
+    while token[0] != "]":
+        yield token
+        kind, _ = stream.next()
+        if kind == "]":
+            return
+        if kind != ",":
+            raise stream.error("Expected ',' or ']'")
+        token = stream.next()
+
+
+def parse_value(stream, token=None):
+    """
+    Builds the value starting at `token` (or the next token).
+
+    Objects and arrays are cut out of the input whole and handed to `loads`,
+    which is much faster than building them token by token.
+    """
+    token = token or stream.next()
+    if token[0] in "{[":
+        return loads(stream.read_container())
+    return _build_value(stream, token)
+
+
+def _build_value(stream, token=None):
+    kind, value = token or stream.next()
+    if kind == VALUE:
+        return value
+    if kind == "{":
+        obj = {}
+        for key in iter_object(stream):
+            obj[key] = _build_value(stream)
+        return obj
+    if kind == "[":
+        return [_build_value(stream, item) for item in iter_array(stream)]
+    raise stream.error(f"Unexpected token {kind!r}")
+
+
+def skip_value(stream, token=None):
+    """Consumes the value starting at `token` (or the next token) unparsed."""
+    kind, _ = token or stream.next()
+    if kind in "{[":
+        stream.read_container(capture=False)
+    elif kind != VALUE:
+        raise stream.error(f"Unexpected token {kind!r}")
+
+
+def remove_trailing_commas(json_string):
+    """
+    Removes the commas that directly precede a closing bracket.
+
+    Candidate commas are found in one scan. Each is dropped only if it lies
+    outside a string literal, so strings containing ",}" or ",]" are left
+    untouched. Between candidates, string state is the parity of the quotes,
+    or a string-aware scan when the span contains backslash escapes. A
+    candidate inside a string moves the scan past the end of that string, so
+    no text is scanned twice.
+    """
+    pieces = []
+    start = 0
+    # `pos` is always outside a string literal
+    pos = 0
+    for match in _TRAILING_COMMA_RE.finditer(json_string):
+        comma = match.start()
+        if comma < pos:
+            # In the string skipped below
+            continue
+        if json_string.find("\\", pos, comma) == -1:
+            outside = json_string.count('"', pos, comma) % 2 == 0
+        else:
+            outside = False
+        if not outside:
+            string_start = _OUTSIDE_STRINGS_RE.match(json_string, pos, comma).end()
+            outside = string_start == comma
+        if outside:
+            pieces.append(json_string[start:comma])
+            start = pos = comma + 1
+        else:
+            string = _STRING_RE.match(json_string, string_start)
+            pos = string.end() if string is not None else len(json_string)
+    pieces.append(json_string[start:])
+    return "".join(pieces)
+
+
+def loads(text):
+    """
+    Parses a JSON str or UTF-8 bytes document, tolerating trailing commas.
+
+    Valid JSON goes straight to `json.loads`; the text is only repaired with
+    `remove_trailing_commas` when that fails.
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(remove_trailing_commas(text))
+
+
+def load(fp):
+    """Parses a whole JSON document from `fp`, tolerating trailing commas."""
+    stream = TokenStream(fp)
+    value = _build_value(stream)
+    if stream.next()[0] != END:
+        raise stream.error("Extra data")
+    return value
@@ -0,0 +1,505 @@
+import math
+import re
+import threading
+
+from lxml import etree
+
+try:
+    from .xslt import registry as xslt_registry
+except ImportError:  # run as a script by `streamlit run`
+    from xslt import registry as xslt_registry
+
+XSL_NAMESPACES = {"xsl": "http://www.w3.org/1999/XSL/Transform"}
+
+_STARTS_WITH_RE = re.compile(r"""starts-with\(\$content,\s*(?:'([^']*)'|"([^"]*)")\)""")
+_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_.-]*")
+# Characters `build_mathml` can't put in an XML tree
+_NON_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+# `number()` as libxml2 implements it, which also reads an exponent
+_NUMBER_RE = re.compile(
+    r"[ \t\r\n]*(-?(?:\d+(?:\.\d*)?|\.\d+))(?:[eE]([+-]?\d*))?[ \t\r\n]*"
+)
+_XML_SPACE_RE = re.compile(r"[ \t\r\n]+")
+
+VARIANTS = {
+    "normal": "\\mathrm{",
+    "bold": "\\mathbf{",
+    "italic": "\\mathit{",
+    "bold-italic": "\\mathit{",
+    "double-struck": "\\mathbb{",
+    "bold-fraktur": "\\mathfrak{",
+    "script": "\\mathcal{",
+    "bold-script": "\\mathcal{",
+    "fraktur": "\\mathfrak{",
+    "sans-serif": "\\mathsf{",
+    "bold-sans-serif": "\\mathsf{",
+    "sans-serif-italic": "\\mathsf{",
+    "sans-serif-bold-italic": "\\mathsf{",
+    "monospace": "\\mathtt{",
+}
+
+FENCES = set("()[]{}|")
+BIG_OPERATORS = set("∑∏∐⋂⋃⊔")
+
+OVER_ACCENTS = {
+    "¯": "\\overline{",
+    "︷": "\\overbrace{",
+    "←": "\\overleftarrow{",
+    "→": "\\overrightarrow{",
+    "↔": "\\overleftrightarrow{",
+}
+# Only `mover` itself knows these
+MOVER_ACCENTS = {
+    "˜": "\\tilde{",
+    "✓": "\\check{",
+    "˙": "\\dot{",
+    "¨": "\\ddot{",
+}
+UNDER_ACCENTS = {
+    "̲": "\\underline{",
+    "︸": "\\underbrace{",
+    "←": "\\underleftarrow{",
+    "→": "\\underrightarrow{",
+    "↔": "\\underleftrightarrow{",
+}
+
+# Attributes that make a node take a path of the stylesheet not ported here
+UNSUPPORTED_ATTRIBUTES = {
+    "mi": {"mathbackground", "color", "mathcolor"},
+    "mn": {"mathbackground", "color", "mathcolor"},
+    "mo": {"mathbackground", "color", "mathcolor"},
+    "mtext": {"mathbackground", "color", "mathcolor"},
+    "mfrac": {"linethickness", "numalign", "denomalign", "bevelled"},
+    "mstyle": {"background", "color", "mathcolor"},
+    "mtable": {"columnalign", "frame"},
+    "mtd": {"columnspan", "columnalign"},
+}
+
+
+class UnsupportedMath(Exception):
+    """Raised for math the native renderer leaves to the XSLT stylesheet."""
+
+
+class _EntityTable:
+    # The `replaceEntities`-style templates of entities.xsl as one regex
+
+    def __init__(self, replacements):
+        self.replacements = {}
+        for prefix, replacement in replacements:
+            self.replacements.setdefault(prefix, replacement)
+        # Alternatives are tried in stylesheet order, like its `xsl:when`s
+        self.pattern = re.compile(
+            "|".join(re.escape(prefix) for prefix, _ in replacements)
+        )
+
+    def replace(self, text):
+        if not text:
+            return text
+        return self.pattern.sub(lambda match: self.replacements[match.group()], text)
+
+
+_entity_tables = None
+_entity_lock = threading.Lock()
+
+
+def load_entity_tables(path=None):
+    """
+    Reads the entity replacement tables from entities.xsl.
+
+    Returns:
+        A dict with the `_EntityTable` of the "replaceEntities" and
+        "replaceMtextEntities" templates.
+    """
+    if path is None:
+        path = xslt_registry.require("yarosh").with_name("entities.xsl")
+    document = etree.parse(str(path))
+    tables = {}
+    for name in ("replaceEntities", "replaceMtextEntities"):
+        replacements = []
+        whens = document.xpath(
+            f"//xsl:template[@name='{name}']//xsl:when", namespaces=XSL_NAMESPACES
+        )
+        for when in whens:
+            match = _STARTS_WITH_RE.fullmatch(when.get("test", ""))
+            if match is None:
+                raise ValueError(f"Unexpected test in {name}: {when.get('test')}")
+            prefix = match.group(1) if match.group(1) is not None else match.group(2)
+            value = when.find("xsl:value-of", XSL_NAMESPACES)
+            replacement = value.get("select")[1:-1] if value is not None else ""
+            replacements.append((prefix, replacement))
+        tables[name] = _EntityTable(replacements)
+    return tables
+
+
+def _tables():
+    global _entity_tables
+    if _entity_tables is None:
+        with _entity_lock:
+            if _entity_tables is None:
+                _entity_tables = load_entity_tables()
+    return _entity_tables
+
+
+def normalize_space(text):
+    return _XML_SPACE_RE.sub(" ", text).strip(" ")
+
+
+def xpath_number(text):
+    match = _NUMBER_RE.fullmatch(text)
+    if match is None:
+        return math.nan
+    mantissa, exponent = match.groups()
+    if exponent and exponent[-1].isdigit():
+        return float(f"{mantissa}e{exponent}")
+    return float(mantissa)
+
+
+def math_to_latex(data):
+    """
+    Converts a ScienceDirect JSON math tree straight to LaTeX.
+
+    The output is the same as running `build_mathml` and the
+    "yarosh" stylesheet, for the subset of presentation MathML ported here:
+    tokens, `mrow`, fractions, roots, scripts, under/over scripts, `mstyle`,
+    `mspace`, `mphantom` and plain `mtable`s.
+
+    Args:
+        data: A `math` node.
+
+    Returns:
+        The LaTeX string, including the `$ ...$` or `\\[ ... \\]` delimiters.
+
+    Raises:
+        UnsupportedMath: The tree uses a construct that isn't ported, or
+            can't be built as MathML.
+    """
+    if not isinstance(data, dict) or data.get("#name") != "math":
+        raise UnsupportedMath("not a math node")
+    _check_markup(data)
+    attributes = _attributes(data, "math")
+    mode = attributes.get("mode")
+    display = attributes.get("display")
+    try:
+        content = "".join(_render_children(_element_children(data)))
+    except RecursionError:
+        raise UnsupportedMath("math is nested too deeply") from None
+    if ((mode is None or mode == "inline") and display is None) or display == "inline":
+        return f"$ {content}$"
+    if display == "block" or (mode == "display" and display is None):
+        return f"\n\\[\n\t{content}\n\\]"
+    # No template matches: the built-in one just renders the children
+    return content
+
+
+def _check_markup(data):
+    # Everything `build_mathml` would fail on or build differently
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict) or not isinstance(node.get("#name"), str):
+            raise UnsupportedMath("child that is not an element")
+        tag_name = node["#name"]
+        if not _NAME_RE.fullmatch(tag_name):
+            raise UnsupportedMath(f"tag name {tag_name!r}")
+        attributes = node.get("$", {})
+        if not isinstance(attributes, dict):
+            raise UnsupportedMath("attributes that are not a mapping")
+        for name, value in attributes.items():
+            if not _NAME_RE.fullmatch(name) or name == "xmlns":
+                raise UnsupportedMath(f"attribute {name!r}")
+            if _NON_XML_RE.search(str(value)):
+                raise UnsupportedMath(f"value of {name!r}")
+        children = node.get("$$")
+        if children is not None:
+            if "_" in node and tag_name != "math":
+                raise UnsupportedMath("mixed content")
+            if not isinstance(children, list):
+                raise UnsupportedMath("children that are not a list")
+            stack.extend(children)
+        elif "_" in node and _NON_XML_RE.search(str(node["_"])):
+            raise UnsupportedMath("text with characters XML can't represent")
+
+
+def _attributes(node, tag_name):
+    attributes = node.get("$")
+    if not attributes:
+        return {}
+    unsupported = UNSUPPORTED_ATTRIBUTES.get(tag_name)
+    if unsupported and not unsupported.isdisjoint(attributes):
+        raise UnsupportedMath(f"{tag_name} with {', '.join(unsupported & set(attributes))}")
+    return {name: str(value) for name, value in attributes.items()}
+
+
+def _element_children(node):
+    return node.get("$$") or []
+
+
+def _text(node):
+    # The text of a node without element children
+    if "$$" in node:
+        raise UnsupportedMath("token with child elements")
+    text = node.get("_", "")
+    return text if isinstance(text, str) else str(text)
+
+
+def _content(node):
+    # What `apply-templates` produces for the content of a layout node
+    if "$$" in node:
+        return "".join(_render_children(_element_children(node)))
+    return _tables()["replaceEntities"].replace(normalize_space(_text(node)))
+
+
+def _string_value(node):
+    # XPath string value, without the whitespace-only text stripped away
+    if node is None:
+        return ""
+    if "$$" in node:
+        return "".join(_string_value(child) for child in _element_children(node))
+    text = _text(node)
+    return text if text.strip(" \t\r\n") else ""
+
+
+def _nth(children, position):
+    return children[position - 1] if len(children) >= position else None
+
+
+def _render_nth(children, position):
+    child = _nth(children, position)
+    return "" if child is None else _render(child, children, position - 1)
+
+
+def _render_children(children):
+    for position, child in enumerate(children):
+        yield _render(child, children, position)
+
+
+def _render(node, siblings, position):
+    tag_name = node["#name"]
+    renderer = RENDERERS.get(tag_name)
+    if renderer is None:
+        raise UnsupportedMath(f"<{tag_name}>")
+    return renderer(node, _attributes(node, tag_name), siblings, position)
+
+
+def _token(node, attributes, siblings, position):
+    text = _text(node)
+    variant = attributes.get("mathvariant")
+    tag_name = node["#name"]
+    if tag_name == "mtext":
+        content = _tables()["replaceMtextEntities"].replace(normalize_space(text))
+        content = f"\\text{{{content}}}"
+    else:
+        normalized = normalize_space(text)
+        content = _tables()["replaceEntities"].replace(normalized)
+        if tag_name == "mi":
+            if len(normalized) > 1 and variant is None:
+                content = f"\\mathrm{{{content}}}"
+        elif tag_name == "mn":
+            if math.isnan(xpath_number(text)) and variant is None:
+                content = f"\\mathrm{{{content}}}"
+        else:
+            content = _fence(node, attributes, siblings, position) + content
+    if variant is not None:
+        return VARIANTS.get(variant, "{") + content + "}"
+    return content
+
+
+def _is_fence(node):
+    return node["#name"] == "mo" and normalize_space(_string_value(node)) in FENCES
+
+
+def _stretchy(node):
+    return (node.get("$") or {}).get("stretchy") != "false"
+
+
+def _fence(node, attributes, siblings, position):
+    if not _is_fence(node) or attributes.get("stretchy") == "false":
+        return ""
+    preceding = [s for s in siblings[:position] if s["#name"] == "mo"]
+    following = [s for s in siblings[position + 1 :] if s["#name"] == "mo"]
+    fences_before = sum(1 for s in preceding if _is_fence(s))
+    if fences_before % 2 == 0:
+        if following and _stretchy(following[0]) and _is_fence(following[0]):
+            return "\\left"
+    elif preceding and _stretchy(preceding[-1]) and _is_fence(preceding[-1]):
+        return "\\right"
+    return ""
+
+
+def _mspace(node, attributes, siblings, position):
+    depth = attributes.get("depth")
+    width = attributes.get("width", "0ex")
+    height = attributes.get("height", "0ex")
+    depth = f"[-{depth}]" if depth is not None else ""
+    return f"\\phantom{{\\rule{depth}{{{width}}}{{{height}}}}}"
+
+
+def _mrow(node, attributes, siblings, position):
+    return _content(node)
+
+
+def _wrapper(opening, closing="}"):
+    def render(node, attributes, siblings, position):
+        return opening + _content(node) + closing
+
+    return render
+
+
+def _mfrac(node, attributes, siblings, position):
+    children = _element_children(node)
+    return (
+        f"\\frac{{{_render_nth(children, 1)}}}{{{_render_nth(children, 2)}}}"
+    )
+
+
+def _mroot(node, attributes, siblings, position):
+    children = _element_children(node)
+    if len(children) != 2:
+        return "\\text{exception 25:}"
+    return f"\\sqrt[{_render_nth(children, 2)}]{{{_render_nth(children, 1)}}}"
+
+
+def _mstyle(node, attributes, siblings, position):
+    content = _content(node)
+    if attributes.get("displaystyle") == "true":
+        return f"{{\\displaystyle {content}}}"
+    if "scriptlevel" in attributes:
+        level = xpath_number(attributes["scriptlevel"])
+        if level == 0:
+            style = "\\textstyle "
+        elif level == 1:
+            style = "\\scriptstyle "
+        else:
+            style = "\\scriptscriptstyle "
+        return f"{{{style}{content}}}"
+    return content
+
+
+def _scripts(*separators):
+    def render(node, attributes, siblings, position):
+        children = _element_children(node)
+        parts = ["{"]
+        for index, separator in enumerate(separators, 1):
+            parts.append(_render_nth(children, index))
+            parts.append(separator)
+        return "".join(parts)
+
+    return render
+
+
+def _script_value(children, position):
+    return _string_value(_nth(children, position)).replace(" ", "")
+
+
+def _mover(node, attributes, children, pos_over=2):
+    base = _script_value(children, 1)
+    over = _script_value(children, pos_over)
+    opening = OVER_ACCENTS.get(over) or MOVER_ACCENTS.get(over)
+    if opening is None and over in ("̂", "^"):
+        opening = "\\widehat{" if attributes.get("accent") == "true" else "\\hat{"
+    if opening is not None:
+        return opening + _render_nth(children, 1) + "}"
+    if base in BIG_OPERATORS:
+        return _render_nth(children, 1) + "^{" + _render_nth(children, pos_over) + "}"
+    return (
+        "\\stackrel{"
+        + _render_nth(children, pos_over)
+        + "}{"
+        + _render_nth(children, 1)
+        + "}"
+    )
+
+
+def _munder(node, attributes, children):
+    base = _script_value(children, 1)
+    under = _script_value(children, 2)
+    opening = UNDER_ACCENTS.get(under)
+    if opening is not None:
+        return opening + _render_nth(children, 1) + "}"
+    if base in BIG_OPERATORS:
+        return _render_nth(children, 1) + "_{" + _render_nth(children, 2) + "}"
+    return "\\underset{" + _render_nth(children, 2) + "}{" + _render_nth(children, 1) + "}"
+
+
+def _mover_element(node, attributes, siblings, position):
+    return _mover(node, attributes, _element_children(node))
+
+
+def _munder_element(node, attributes, siblings, position):
+    return _munder(node, attributes, _element_children(node))
+
+
+def _munderover(node, attributes, siblings, position):
+    children = _element_children(node)
+    base = _script_value(children, 1)
+    under = _script_value(children, 2)
+    over = _script_value(children, 3)
+    opening = OVER_ACCENTS.get(over)
+    if opening is not None:
+        return opening + _munder(node, attributes, children) + "}"
+    opening = UNDER_ACCENTS.get(under)
+    if opening is not None:
+        return opening + _mover(node, attributes, children, pos_over=3) + "}"
+    if base in BIG_OPERATORS:
+        return (
+            _render_nth(children, 1)
+            + "_{"
+            + _render_nth(children, 2)
+            + "}^{"
+            + _render_nth(children, 3)
+            + "}"
+        )
+    return (
+        "\\underset{"
+        + _render_nth(children, 2)
+        + "}{\\overset{"
+        + _render_nth(children, 3)
+        + "}{"
+        + _render_nth(children, 1)
+        + "}}"
+    )
+
+
+def _mtable(node, attributes, siblings, position):
+    rows = _element_children(node)
+    if any(row["#name"] != "mtr" for row in rows):
+        raise UnsupportedMath("mtable with rows other than mtr")
+    columns = len(_element_children(rows[0])) if rows else 0
+    parts = ["\\begin{array}{", "c" * columns, "}"]
+    for index, row in enumerate(rows):
+        _attributes(row, "mtr")
+        cells = _element_children(row)
+        for cell_index, cell in enumerate(cells):
+            if cell["#name"] != "mtd":
+                raise UnsupportedMath("mtr with cells other than mtd")
+            _attributes(cell, "mtd")
+            parts.append(_content(cell))
+            if cell_index < len(cells) - 1:
+                parts.append("& ")
+        if index < len(rows) - 1:
+            parts.append("\\\\ ")
+    parts.append("\\end{array}")
+    return "".join(parts)
+
+
+RENDERERS = {
+    "mi": _token,
+    "mn": _token,
+    "mo": _token,
+    "mtext": _token,
+    "mspace": _mspace,
+    "mrow": _mrow,
+    "merror": _mrow,
+    "mfrac": _mfrac,
+    "msqrt": _wrapper("\\sqrt{"),
+    "mroot": _mroot,
+    "mphantom": _wrapper("\\phantom{"),
+    "mstyle": _mstyle,
+    "msub": _scripts("}_{", "}"),
+    "msup": _scripts("}^{", "}"),
+    "msubsup": _scripts("}_{", "}^{", "}"),
+    "mover": _mover_element,
+    "munder": _munder_element,
+    "munderover": _munderover,
+    "mtable": _mtable,
+}
@@ -0,0 +1,160 @@
+import functools
+import json
+import threading
+import time
+from collections import Counter
+
+try:
+    from .writer import render_to_string
+except ImportError:  # run as a script by `streamlit run`
+    from writer import render_to_string
+
+
+class HandlerStats:
+    """
+    Counters of one tag.
+
+    Attributes:
+        calls: Number of handler calls.
+        seconds: Cumulative time, including the handlers called from it.
+        self_seconds: Time spent in the handler itself.
+        chars: Characters of Markdown written, including nested handlers.
+    """
+
+    __slots__ = ("calls", "seconds", "self_seconds", "chars")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.self_seconds = 0.0
+        self.chars = 0
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "self_seconds": self.self_seconds,
+            "chars": self.chars,
+        }
+
+
+class HandlerProfiler:
+    """
+    Per-tag timings of the tag handlers.
+
+    Handlers are only timed once wrapped with `wrap`, which
+    `streamlitweb.profile_handlers` does for every registered handler while
+    profiling, so the unprofiled path stays untouched.
+
+    Attributes:
+        stats: `HandlerStats` by tag name.
+        unhandled: Count of nodes without a handler, by tag name.
+        stacks: Self time by stack of tag names, for flame graphs.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.unhandled = Counter()
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def wrap(self, handler):
+        """
+        Returns `handler` timed under the `#name` of the node it renders.
+
+        The wrapper takes the same arguments as the handler, including
+        `out=None` to return a string.
+        """
+
+        @functools.wraps(handler)
+        def profiled(data, *args, out=None, **kwargs):
+            if out is None:
+                return render_to_string(profiled, data, *args, **kwargs)
+            frames = getattr(self._local, "frames", None)
+            if frames is None:
+                frames = self._local.frames = []
+            tag_name = handler.__name__
+            if isinstance(data, dict):
+                tag_name = data.get("#name", tag_name)
+            # [tag name, time spent in nested handlers]
+            frame = [tag_name, 0.0]
+            frames.append(frame)
+            position = out.tell()
+            start = time.perf_counter()
+            try:
+                return handler(data, *args, out=out, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                chars = out.tell() - position
+                frames.pop()
+                if frames:
+                    frames[-1][1] += seconds
+                self._record(frames, tag_name, seconds, seconds - frame[1], chars)
+
+        profiled.__wrapped_handler__ = handler
+        return profiled
+
+    def count_unhandled(self, tag_name):
+        with self._lock:
+            self.unhandled[tag_name] += 1
+
+    def _record(self, frames, tag_name, seconds, self_seconds, chars):
+        stack = ";".join([frame[0] for frame in frames] + [tag_name])
+        with self._lock:
+            stats = self.stats.get(tag_name)
+            if stats is None:
+                stats = self.stats[tag_name] = HandlerStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.self_seconds += self_seconds
+            stats.chars += chars
+            self.stacks[stack] += self_seconds
+
+    def to_dict(self):
+        """
+        Returns the results as JSON-serializable data.
+
+        Returns:
+            A dict like {"handlers": {"table": {"calls": ..., "seconds": ...,
+            "self_seconds": ..., "chars": ...}}, "unhandled": {"tag": count}},
+            with the handlers sorted by self time.
+        """
+        with self._lock:
+            handlers = sorted(
+                self.stats.items(), key=lambda item: item[1].self_seconds, reverse=True
+            )
+            return {
+                "handlers": {tag_name: stats.to_dict() for tag_name, stats in handlers},
+                "unhandled": dict(self.unhandled.most_common()),
+            }
+
+    def collapsed_stacks(self):
+        """
+        Returns the self times in the collapsed stack format of flamegraph.pl
+        and speedscope: one "body;section;para;math <microseconds>" line per
+        stack.
+        """
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        return "".join(
+            f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in stacks
+        )
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed_stacks())
+
+    def summary(self, limit=10):
+        """Returns the `limit` tags with the most self time as a text table."""
+        lines = [f"{'tag':<24}{'calls':>9}{'self s':>10}{'total s':>10}{'chars':>12}"]
+        for tag_name, stats in list(self.to_dict()["handlers"].items())[:limit]:
+            lines.append(
+                f"{tag_name:<24}{stats['calls']:>9}{stats['self_seconds']:>10.3f}"
+                f"{stats['seconds']:>10.3f}{stats['chars']:>12}"
+            )
+        return "\n".join(lines)
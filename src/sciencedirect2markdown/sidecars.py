@@ -0,0 +1,153 @@
+import csv
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+# Rows handed to the Parquet writer at once
+PARQUET_BATCH_ROWS = 1024
+
+UNSAFE_NAME_RE = re.compile(r"[^\w.-]+")
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TableSpill:
+    """
+    Where the bodies of large tables go instead of the Markdown.
+
+    A table with more body rows than `threshold` is written to a sidecar
+    file in `directory`, one row at a time, and the Markdown only keeps its
+    header, the first `preview_rows` rows and a link to the file. Sidecars
+    are named after the table and a hash of their content, so the tables of
+    many documents can share a directory.
+
+    Args:
+        directory: Directory of the sidecar files, created if needed.
+        threshold: Number of body rows above which a table is spilled.
+        format: "csv", or "parquet" when pyarrow is installed; CSV is used
+            otherwise.
+        preview_rows: Body rows kept in the Markdown.
+        link_prefix: Prefix of the links to the sidecars, e.g. their path
+            relative to the Markdown file. Defaults to `directory`.
+
+    Attributes:
+        written: Paths of the sidecar files written.
+    """
+
+    def __init__(
+        self, directory, threshold=1000, format="csv", preview_rows=10, link_prefix=None
+    ):
+        if format not in ("csv", "parquet"):
+            raise ValueError(f"Unknown table format: {format}")
+        if format == "parquet" and not parquet_available():
+            format = "csv"
+        self.directory = Path(directory)
+        self.threshold = threshold
+        self.format = format
+        self.preview_rows = preview_rows
+        self.link_prefix = (
+            Path(directory).as_posix() if link_prefix is None else link_prefix.rstrip("/")
+        )
+        self.written = []
+
+    def spills(self, rows):
+        """Whether a table with `rows` body rows goes to a sidecar."""
+        return rows > self.threshold
+
+    def write(self, name, header, rows, num_cols):
+        """
+        Writes a table to a new sidecar file.
+
+        Args:
+            name: Name of the table, e.g. its id.
+            header: The header rows, lists of cells.
+            rows: Iterable of body rows, consumed one at a time.
+            num_cols: Number of columns.
+
+        Returns:
+            The link to the file and the number of body rows written.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            if self.format == "parquet":
+                os.close(fd)
+                count = _write_parquet(temp_path, header, rows, num_cols)
+            else:
+                with open(fd, "w", encoding="utf-8", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerows(header)
+                    count = 0
+                    for row in rows:
+                        writer.writerow(row)
+                        count += 1
+            digest = _file_digest(temp_path)
+            filename = f"{UNSAFE_NAME_RE.sub('_', name)}-{digest[:12]}.{self.format}"
+            path = self.directory / filename
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        self.written.append(path)
+        return f"{self.link_prefix}/{filename}", count
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def column_names(header, num_cols):
+    """
+    Returns unique column names from the header rows, joining the cells of
+    multi-row headers; unnamed columns are called "col<number>".
+    """
+    names = []
+    for index in range(num_cols):
+        parts = []
+        for row in header:
+            cell = row[index].strip() if index < len(row) else ""
+            if cell and (not parts or parts[-1] != cell):
+                parts.append(cell)
+        name = " ".join(parts) or f"col{index + 1}"
+        while name in names:
+            name += "_"
+        names.append(name)
+    return names
+
+
+def _write_parquet(path, header, rows, num_cols):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.string()) for name in column_names(header, num_cols)])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) == PARQUET_BATCH_ROWS:
+                writer.write_table(_parquet_table(pa, schema, batch))
+                batch = []
+        if batch or not count:
+            writer.write_table(_parquet_table(pa, schema, batch))
+    return count
+
+
+def _parquet_table(pa, schema, batch):
+    columns = [pa.array(list(column), pa.string()) for column in zip(*batch)]
+    if not columns:
+        columns = [pa.array([], pa.string()) for _ in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
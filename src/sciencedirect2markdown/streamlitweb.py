@@ -1,316 +1,785 @@
-import os
 import re
 import json
-from io import BytesIO
-import zipfile
+import hashlib
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from io import BytesIO, StringIO
+from importlib.metadata import entry_points
+from types import FunctionType
 from lxml import etree
 
-import glyph_match
+try:
+    from .archive import MarkdownArchive
+    from .assets import IMAGE_BASE_URL, AssetMirror
+    from .batch import BatchResult, BatchStats, convert_batch
+    from .chunking import Chunker
+    from .caching import (
+        LRUCache,
+        SectionCache,
+        SQLiteStore,
+        TTLCache,
+        content_key,
+        converter_version,
+        encode_json,
+        payload_key,
+    )
+    from .context import ConversionContext, current_context, use_context
+    from .glyph_match import glyph_match
+    from .index import DocumentIndex
+    from .jsonio import (
+        STREAMING_THRESHOLD,
+        TokenStream,
+        iter_array,
+        iter_object,
+        loads as loads_json,
+        parse_value,
+        remove_trailing_commas,
+        skip_value,
+    )
+    from .mathlatex import UnsupportedMath, math_to_latex
+    from .profiling import HandlerProfiler
+    from .sidecars import TableSpill
+    from .writer import MarkdownWriter, render_to_string
+    from .xslt import registry as xslt_registry
+except ImportError:  # run as a script by `streamlit run`
+    from archive import MarkdownArchive
+    from assets import IMAGE_BASE_URL, AssetMirror
+    from batch import BatchResult, BatchStats, convert_batch
+    from chunking import Chunker
+    from caching import (
+        LRUCache,
+        SectionCache,
+        SQLiteStore,
+        TTLCache,
+        content_key,
+        converter_version,
+        encode_json,
+        payload_key,
+    )
+    from context import ConversionContext, current_context, use_context
+    from glyph_match import glyph_match
+    from index import DocumentIndex
+    from jsonio import (
+        STREAMING_THRESHOLD,
+        TokenStream,
+        iter_array,
+        iter_object,
+        loads as loads_json,
+        parse_value,
+        remove_trailing_commas,
+        skip_value,
+    )
+    from mathlatex import UnsupportedMath, math_to_latex
+    from profiling import HandlerProfiler
+    from sidecars import TableSpill
+    from writer import MarkdownWriter, render_to_string
+    from xslt import registry as xslt_registry
 
 import streamlit as st
 
-attachment_lookup = {}
-floats = {}
-processed_floats = set()
+# Converted equations, keyed by a hash of their JSON subtree
+math_cache = LRUCache(maxsize=4096)
+
+# Rendered top-level sections; disabled until `configure_section_cache`
+section_cache = None
+
+# Large tables written to sidecar files; disabled until `configure_table_spill`
+table_spill = None
+
+# Local copies of the attachments; disabled until `configure_asset_mirror`
+asset_mirror = None
+
+# Bounds of the app's cache of converted documents, see `shared_result_cache`
+RESULT_CACHE_BYTES = 256 * 1024 * 1024
+RESULT_CACHE_TTL = 60 * 60
+
+# Render equations with `math_to_latex`, using the XSLT only for what it
+# doesn't support. Both produce the same LaTeX.
+native_math = True
+
+# Convert the equations of a document before rendering it, with one XSLT
+# run for all of those the native renderer can't handle
+batch_math = False
+
+MATHML_NAMESPACE = "http://www.w3.org/1998/Math/MathML"
 
+# Written after each equation of a batch. A private-use character: it can't
+# come out of the stylesheet unless it is in the input.
+MATH_SEPARATOR = "\ue000"
 
-def json_to_markdown(data, LaTeX=False):
+
+def json_to_markdown(data, LaTeX=False, context=None):
     """
     Converts the given JSON data to Markdown.
 
     Args:
         data: The JSON data to convert.
+        context: Optional `ConversionContext` to convert into. A fresh one is
+            used by default, so every call starts from a clean state. Its
+            index is built from `data` unless it already holds a document.
 
     Returns:
         The Markdown string.
     """
-    global attachment_lookup
-    global floats
-    global processed_floats
+    with use_context(context) as context:
+        if not context.index.documents:
+            context.index.add_document(data)
+        localize_assets(context)
+        start = time.perf_counter()
+        context.prepared_math = prepare_math(data) if batch_math else {}
+        markdown = handle_post_process(render_markdown(data, LaTeX))
+        context.render_seconds += time.perf_counter() - start
+        return markdown
+
+
+def render_markdown(data, LaTeX=False, out=None):
+    """
+    Renders the given JSON data to Markdown without post-processing.
 
-    markdown_output = ""
-    processed_floats = set()
+    Nodes are expanded on an explicit stack instead of recursing, so deeply
+    nested input doesn't hit the recursion limit and each level costs a stack
+    push rather than two function calls: the nodes `handle_label` renders
+    (text, `body`, `sections`, unknown tags...) inline, and those of the
+    handlers in `HANDLER_PARTS` (lists, sections, paragraphs, inline
+    wrappers...) through their parts. Other handlers are called as usual and
+    recurse through this function. `json_to_markdown` normalizes the result
+    once at the top level, see `render_normalized` for the exceptions.
 
-    # Create a lookup dictionary for attachment-eid based on file-basename
-    if "attachments" in data:
-        for attachment in data["attachments"]:
-            if "file-basename" in attachment and "attachment-eid" in attachment:
-                file_basename = attachment["file-basename"]
-                if file_basename not in attachment_lookup:
-                    attachment_lookup[file_basename] = attachment["attachment-eid"]
-                else:
-                    if (
-                        "attachment-type" in attachment
-                        and attachment["attachment-type"] != "IMAGE-THUMBNAIL"
-                    ):
-                        attachment_lookup[file_basename] = attachment["attachment-eid"]
-
-    # float
-    if "floats" in data:
-        for float_item in data["floats"]:
-            if "$" in float_item and "id" in float_item["$"]:
-                float_id = float_item["$"]["id"]
-                floats[float_id] = float_item
-
-    if isinstance(data, dict):
-        if "#name" in data:
-            tag_name = data["#name"]
-
-            if tag_name == "para":
-                markdown_output += handle_para(data)
-            elif tag_name == "list":
-                markdown_output += handle_list(data)
-            elif tag_name == "math":
-                markdown_output += handle_math(data)
-            elif tag_name == "figure":
-                markdown_output += handle_figure(data)
-            elif tag_name == "table":
-                markdown_output += handle_table(data)
-            elif tag_name == "outline":
-                markdown_output += handle_outline(data)
-            elif tag_name == "sections" or tag_name == "body":
-                markdown_output += handle_label(data)
-            elif tag_name == "section":
-                markdown_output += handle_section(data)
-            elif tag_name == "section-title":
-                markdown_output += handle_section_title(data)
-            elif tag_name == "simple-para":
-                markdown_output += handle_simple_para(data)
-            elif tag_name == "br":
-                markdown_output += handle_br(data)
-            elif tag_name == "bold":
-                markdown_output += handle_bold(data, LaTeX)
-            elif tag_name == "italic":
-                markdown_output += handle_italic(data, LaTeX)
-            elif tag_name == "small-caps":
-                markdown_output += handle_small_caps(data)
-            elif tag_name == "sup":
-                markdown_output += handle_sup(data)
-            elif tag_name == "inf":
-                markdown_output += handle_inf(data)
-            elif tag_name == "hsp":
-                markdown_output += handle_hsp(data)
-            elif tag_name == "formula":
-                markdown_output += handle_formula(data)
-            elif tag_name == "glyph":
-                markdown_output += handle_glyph(data)
-            elif tag_name == "label":
-                markdown_output += handle_label(data)
-            elif tag_name == "cross-ref":
-                markdown_output += handle_cross_ref(data)
-            elif tag_name == "inter-ref":
-                markdown_output += handle_inter_ref(data)
-            elif tag_name == "intra-ref":
-                markdown_output += handle_intra_ref(data)
-            elif tag_name == "display":
-                markdown_output += handle_display(data)
-            elif tag_name == "textbox":
-                markdown_output += handle_textbox(data)
-            elif tag_name == "caption":
-                markdown_output += handle_caption(data)
-            elif tag_name == "textbox-body":
-                markdown_output += handle_textbox_body(data)
-            elif tag_name == "chem":
-                markdown_output += handle_label(data)
-            elif tag_name == "inline-figure":
-                markdown_output += handle_inline_figure(data)
-            elif tag_name == "link":
-                markdown_output += handle_link(data)
-            elif tag_name == "__text__":
-                markdown_output += handle_label(data)
-            elif tag_name == "acknowledgment" or tag_name == "conflict-of-interest":
-                markdown_output += handle_label(data)
+    Args:
+        data: The JSON data to convert.
+        out: Optional `MarkdownWriter` to append the output to.
+
+    Returns:
+        The raw Markdown string, or None when `out` is given.
+    """
+    if out is None:
+        return render_to_string(render_markdown, data, LaTeX=LaTeX)
+    render_parts([(data, LaTeX)], out)
+
+
+def render_parts(parts, out):
+    """
+    Renders a list of parts into `out`, one after the other.
+
+    A part is a string, written as is; a `(node, LaTeX)` pair, rendered like
+    `render_markdown(node, LaTeX)`; or a callable, called as `part(out)` when
+    its turn comes, which returns the parts to render in its place, if any.
+    """
+    normalize = current_context().normalize_nodes
+    # Writers of the nodes being normalized, the innermost last
+    outer = []
+    # The parts left, the next one to render last
+    stack = parts[::-1]
+    pop = stack.pop
+    push = stack.append
+    extend = stack.extend
+    while stack:
+        part = pop()
+        if type(part) is tuple:
+            if normalize:
+                # Rendered into a writer of its own, see `render_normalized`
+                extend((_END_NODE, list(part), _START_NODE))
+                continue
+        elif type(part) is str:
+            out.write(part)
+            continue
+        elif type(part) is not list:
+            if part is _START_NODE:
+                outer.append(out)
+                out = MarkdownWriter()
+            elif part is _END_NODE:
+                text = out.getvalue()
+                out = outer.pop()
+                out.write(handle_post_process(text))
             else:
-                markdown_output += handle_label(data)
-                print(f"Unhandled tag: {tag_name} - {data}")
+                more = part(out)
+                if more:
+                    extend(reversed(more))
+            continue
+
+        data, LaTeX = part
+        if isinstance(data, dict):
+            if "#name" in data:
+                tag_name = data["#name"]
+
+                entry = TAG_HANDLERS.get(tag_name)
+                if entry is None:
+                    if handler_profiler is not None:
+                        handler_profiler.count_unhandled(tag_name)
+                    print(f"Unhandled tag: {tag_name} - {data}")
+                    handler, takes_latex = handle_label, False
+                else:
+                    handler, takes_latex = entry
+                if handler is handle_label:
+                    if "_" in data:
+                        out.write(data["_"])
+                    if "$$" in data:
+                        # handle_label passes its own flag to every child
+                        LaTeX = LaTeX if takes_latex else False
+                        for item in reversed(data["$$"]):
+                            push((item, LaTeX))
+                elif handler in HANDLER_PARTS:
+                    LaTeX = LaTeX if takes_latex else False
+                    extend(reversed(HANDLER_PARTS[handler](data, LaTeX)))
+                elif takes_latex:
+                    handler(data, LaTeX, out=out)
+                else:
+                    handler(data, out=out)
 
-        elif "content" in data:
-            markdown_output += json_to_markdown(data["content"])
-        elif "floats" in data:
-            markdown_output += json_to_markdown(data["floats"])
-        # elif "attachments" in data:
-        #     markdown_output += json_to_markdown(data["attachments"])
+            elif "content" in data:
+                push((data["content"], False))
+            elif "floats" in data:
+                push((data["floats"], False))
+            # elif "attachments" in data:
+            #     push((data["attachments"], False))
 
-    elif isinstance(data, list):
-        for item in data:
-            markdown_output += json_to_markdown(item)
+        elif isinstance(data, list):
+            for item in reversed(data):
+                push((item, False))
 
-    markdown_output = handle_post_process(markdown_output)
 
-    return markdown_output
+# Markers around a node whose output is post-processed on its own
+_START_NODE = object()
+_END_NODE = object()
+
 
+def render_normalized(handler, data, **kwargs):
+    """
+    Returns `handler(data, **kwargs)` with the output of every node below
+    post-processed on its own before its parent adds to it, as the converter
+    did before `render_markdown`. For text that is changed (stripped, its
+    newlines replaced...) before the final `handle_post_process` sees it, so
+    that the output stays the same.
+    """
+    context = current_context()
+    outer, context.normalize_nodes = context.normalize_nodes, True
+    try:
+        return handler(data, **kwargs)
+    finally:
+        context.normalize_nodes = outer
 
-def handle_sections(data):
-    markdown_output = ""
+
+def handle_sections(data, out=None):
+    if out is None:
+        return render_to_string(handle_sections, data)
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
-    return markdown_output
+        render_markdown(data["$$"], out=out)
 
 
-def handle_para(data):
-    global processed_floats
-    markdown_output = ""
-    float_content = ""
-    if "_" in data:
-        markdown_output += handle_label(data)
+def handle_para(data, out=None):
+    if out is None:
+        return render_to_string(handle_para, data)
+    render_parts(_para_parts(data), out)
+
+
+def _para_parts(data, LaTeX=False):
+    float_content = MarkdownWriter()
+    parts = _label_parts(data) if "_" in data else []
     if "$$" in data:
         for item in data["$$"]:
             if item["#name"] == "float-anchor":
                 float_id = item["$"]["refid"]
-                if float_id not in processed_floats:
-                    if float_id in floats:
-                        float_data = floats[float_id]
-                        if float_data["#name"] == "figure":
-                            float_content += handle_figure(float_data)
-                        elif float_data["#name"] == "table":
-                            float_content += handle_table(float_data)
-                        processed_floats.add(float_id)
+                parts.append(partial(_render_float, float_id, float_content))
             else:
-                markdown_output += json_to_markdown(item)
+                parts.append((item, False))
 
-    markdown_output += "\n\n" + float_content
-    return markdown_output
+    parts.append("\n\n")
+    parts.append(partial(_write_floats, float_content))
+    return parts
 
 
-def handle_simple_para(data):
-    markdown_output = ""
-    if "_" in data:
-        markdown_output += handle_label(data)
+def _write_floats(float_content, out):
+    out.write(float_content.getvalue())
+
+
+def _render_float(float_id, float_content, out):
+    # Renders an anchored float into `float_content`, the first time only
+    context = current_context()
+    if float_id not in context.processed_floats:
+        float_data = context.index.floats.get(float_id)
+        if float_data is not None:
+            if float_data["#name"] == "figure":
+                handle_figure(float_data, out=float_content)
+            elif float_data["#name"] == "table":
+                handle_table(float_data, out=float_content)
+            context.processed_floats.add(float_id)
+
+
+def handle_simple_para(data, out=None):
+    if out is None:
+        return render_to_string(handle_simple_para, data)
+    render_parts(_simple_para_parts(data), out)
+
+
+def _simple_para_parts(data, LaTeX=False):
+    parts = _label_parts(data) if "_" in data else []
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
-    markdown_output += "\n\n"
-    return markdown_output
+        parts.append((data["$$"], False))
+    parts.append("\n\n")
+    return parts
+
+
+def handle_list(data, level=0, out=None):
+    if out is None:
+        return render_to_string(handle_list, data, level=level)
+    render_parts(_list_parts(data, level=level), out)
 
 
-def handle_list(data, level=0):
-    markdown_output = "\n"
-    current_level = level
+def _list_parts(data, LaTeX=False, level=0):
+    parts = ["\n"]
     if "$$" in data:
         for item in data["$$"]:
             if item.get("#name") == "section-title":
-                markdown_output += handle_section_title(item)
+                parts.append(partial(handle_section_title, item))
 
             if item.get("#name") == "list-item":
                 if "$$" in item:
-                    label = None
-                    content = None
-                    nested_content = ""
-
-                    # First pass - get label, content and nested lists
-                    for subitem in item["$$"]:
-                        if subitem.get("#name") == "label":
-                            label = handle_label(subitem)
-                            if label == "•":
-                                label = None
-                        elif subitem.get("#name") == "para":
-                            content = handle_para(subitem).strip()
-                        elif subitem.get("#name") == "list":
-                            nested_content = handle_list(subitem, current_level + 1)
-
-                    # Format the list item with proper indentation
-                    if label:
-                        if label[-1] == "." and label[:-1].isdigit():
-                            # Ordered list item
-                            markdown_output += (
-                                "    " * current_level + f"{label} {content}\n"
-                            )
-                        else:
-                            # Unordered list item
-                            markdown_output += (
-                                "    " * current_level + f"- {label} {content}\n"
-                            )
-                    else:
-                        markdown_output += "    " * current_level + f"- {content}\n"
-
-                    # Add any nested content
-                    if nested_content:
-                        markdown_output += nested_content
+                    parts.append(partial(_list_item_parts, item, level))
 
             elif item.get("#name") == "list":
-                markdown_output += handle_list(item, level + 1)
-
-    markdown_output += "\n"
+                parts.append(partial(_nested_list_parts, item, level + 1))
+
+    parts.append("\n")
+    return parts
+
+
+def _nested_list_parts(data, level, out):
+    return _list_parts(data, level=level)
+
+
+def _list_item_parts(item, current_level, out):
+    label = None
+    content = None
+    nested_content = ""
+
+    # First pass - get label, content and nested lists
+    for subitem in item["$$"]:
+        if subitem.get("#name") == "label":
+            label = render_normalized(handle_label, subitem)
+            if label == "•":
+                label = None
+        elif subitem.get("#name") == "para":
+            if not isinstance(nested_content, str):
+                # A list before the content is rendered before it
+                nested_content = handle_list(nested_content, current_level + 1)
+            content = render_normalized(handle_para, subitem).strip()
+        elif subitem.get("#name") == "list":
+            if not isinstance(nested_content, str):
+                # Only the last list is kept, but all are rendered
+                handle_list(nested_content, current_level + 1)
+            nested_content = subitem
+
+    # Format the list item with proper indentation
+    if label:
+        if label[-1] == "." and label[:-1].isdigit():
+            # Ordered list item
+            line = "    " * current_level + f"{label} {content}\n"
+        else:
+            # Unordered list item
+            line = "    " * current_level + f"- {label} {content}\n"
+    else:
+        line = "    " * current_level + f"- {content}\n"
 
-    return markdown_output
+    # Add any nested content, left on the stack rather than recursing
+    if isinstance(nested_content, str):
+        return [line, nested_content]
+    return [line, partial(_nested_list_parts, nested_content, current_level + 1)]
 
 
 def mathml2latex_yarosh(equation):
     """MathML to LaTeX conversion with XSLT from Vasil Yaroshevich"""
-    xslt_file = os.path.join("mathconverter", "xsl_yarosh", "mmltex.xsl")
-    dom = etree.fromstring(equation)
-    xslt = etree.parse(xslt_file)
-    transform = etree.XSLT(xslt)
-    newdom = transform(dom)
-    return newdom
+    dom = etree.fromstring(equation) if isinstance(equation, str) else equation
+    return xslt_registry.transform("yarosh", dom)
+
+
+def mathml2latex_yarosh_batch(equations):
+    """
+    Converts several MathML equations with a single run of the Yaroshevich
+    XSLT.
+
+    The equations are wrapped in one container element, so the transform
+    renders them one after the other; `MATH_SEPARATOR` is appended to each
+    to split the text output back.
+
+    Args:
+        equations: MathML strings or element trees, e.g. from `build_mathml`.
+            Elements are moved into the container.
+
+    Returns:
+        A list with the LaTeX of each equation, or None for the equations
+        that aren't well-formed XML or fail to transform.
+    """
+    container = etree.Element("equations")
+    results = []
+    for equation in equations:
+        try:
+            dom = etree.fromstring(equation) if isinstance(equation, str) else equation
+        except etree.XMLSyntaxError:
+            results.append(None)
+            continue
+        dom.tail = MATH_SEPARATOR
+        container.append(dom)
+        results.append(dom)
+    if not len(container):
+        return results
+
+    try:
+        parts = str(xslt_registry.transform("yarosh", container)).split(MATH_SEPARATOR)
+    except etree.XSLTApplyError:
+        parts = []
+    if len(parts) != len(container) + 1:
+        # The separator was in the input, or one equation broke the run
+        for dom in list(container):
+            container.remove(dom)
+            dom.tail = None
+        return [None if dom is None else _transform_or_none(dom) for dom in results]
+    converted = iter(parts)
+    return [None if dom is None else next(converted) for dom in results]
+
+
+def _transform_or_none(dom):
+    try:
+        return str(mathml2latex_yarosh(dom))
+    except etree.XSLTApplyError:
+        return None
 
 
 def mathml2latex_transpect(equation):
     """MathML to LaTeX conversion with XSLT from Transpect"""
-    xslt_file = os.path.join("mathconverter", "xsl_transpect", "xsl", "mml2tex.xsl")
     dom = etree.fromstring(equation)
-    xslt = etree.parse(xslt_file)
-    transform = etree.XSLT(xslt)
-    newdom = transform(dom)
-    return newdom
+    return xslt_registry.transform("transpect", dom)
 
 
-def handle_math(data):
+def configure_math_cache(maxsize=4096, path=None):
+    """
+    Replaces the equation cache.
+
+    Args:
+        maxsize: The number of converted equations kept in memory.
+        path: Optional SQLite file that keeps conversions across runs.
+
+    Returns:
+        The new cache.
+    """
+    global math_cache
+    store = SQLiteStore(path, table="math") if path else None
+    math_cache = LRUCache(maxsize=maxsize, store=store)
+    return math_cache
+
+
+def configure_section_cache(maxsize=256, path=None):
+    """
+    Enables the cache of rendered top-level sections.
+
+    A section is looked up by a hash of its JSON subtree, of the converter
+    version and of what its rendering depends on outside the subtree: the
+    floats it anchors and the attachments it links to. Re-converting a
+    revised article then only renders the sections that changed.
+
+    Args:
+        maxsize: The number of sections kept in memory.
+        path: Optional SQLite file that keeps sections across runs.
+
+    Returns:
+        The new `SectionCache`; its `stats()` report the hit rate and the
+        time saved.
+    """
+    global section_cache
+    store = SQLiteStore(path, table="sections") if path else None
+    section_cache = SectionCache(maxsize=maxsize, store=store)
+    return section_cache
+
+
+def disable_section_cache():
+    global section_cache
+    section_cache = None
+
+
+def configure_table_spill(
+    directory, threshold=1000, format="csv", preview_rows=10, link_prefix=None
+):
+    """
+    Writes the bodies of tables with more than `threshold` rows to CSV or
+    Parquet files in `directory`, keeping a preview and a link in the
+    Markdown. See `TableSpill` for the arguments.
+
+    Returns:
+        The new `TableSpill`; its `written` lists the files.
+    """
+    global table_spill
+    table_spill = TableSpill(directory, threshold, format, preview_rows, link_prefix)
+    return table_spill
+
+
+def disable_table_spill():
+    global table_spill
+    table_spill = None
+
+
+def configure_asset_mirror(directory, link_prefix=None, fetcher=None, **options):
+    """
+    Downloads the attachments of every converted document to `directory`
+    before rendering it, and links the images to the local copies. See
+    `AssetMirror` for the arguments; attachments that fail to download keep
+    their remote URL.
+
+    Returns:
+        The new `AssetMirror`; its `failures` list what stayed remote.
+    """
+    global asset_mirror
+    disable_asset_mirror()
+    asset_mirror = AssetMirror(directory, link_prefix, fetcher, **options)
+    return asset_mirror
+
+
+def disable_asset_mirror():
+    global asset_mirror
+    if asset_mirror is not None:
+        asset_mirror.close()
+    asset_mirror = None
+
+
+def localize_assets(context):
+    """
+    Mirrors the attachments of the document indexed in `context`, if the
+    asset mirror is enabled, and records their links in the context.
+    """
+    mirror = asset_mirror
+    if mirror is not None:
+        context.asset_links = mirror.localize(context.index.attachments.values())
+
+
+# String values of the JSON encoding, found without walking the tree
+REFID_RE = re.compile(r'"refid":"((?:[^"\\]|\\.)*)"')
+LOCATOR_RE = re.compile(r'"locator":"((?:[^"\\]|\\.)*)"')
+
+
+def _json_strings(pattern, text):
+    return {
+        json.loads(f'"{value}"') if "\\" in value else value
+        for value in pattern.findall(text)
+    }
+
+
+def section_key(data, context):
+    """
+    Returns the `section_cache` key of a section in the current document.
+
+    Every refid and locator in the section counts as a dependency, which is
+    a superset of the float anchors and links that are rendered.
+    """
+    index = context.index
+    # ASCII output is the fastest to encode and hash
+    section = encode_json(data)
+    floats = {
+        refid: [refid in context.processed_floats, index.floats[refid]]
+        for refid in sorted(_json_strings(REFID_RE, section))
+        if refid in index.floats
+    }
+    floats = json.dumps(floats, separators=(",", ":"))
+    locators = _json_strings(LOCATOR_RE, section) | _json_strings(LOCATOR_RE, floats)
+    attachments = []
+    for locator in sorted(locators):
+        eid = index.attachments.get(locator)
+        attachments.append([locator, eid, context.asset_links.get(eid)])
+    spill = table_spill
+    settings = None
+    if spill is not None:
+        # Spilled tables render as a preview and a link
+        settings = [spill.threshold, spill.format, spill.preview_rows, spill.link_prefix]
+    digest = hashlib.sha256()
+    for part in (converter_version(), section, floats, json.dumps([attachments, settings])):
+        digest.update(part.encode("ascii"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def handle_math(data, out=None):
+    if out is None:
+        return render_to_string(handle_math, data)
     if not ("$$" in data and isinstance(data["$$"], list)):
-        return ""
+        return
 
-    mathml_content = convert_json_to_mathml(data)
+    prepared = current_context().prepared_math.get(id(data))
+    if prepared is not None:
+        out.write(prepared)
+        return
 
-    try:
-        latex_string = mathml2latex_yarosh(mathml_content)
-    except:
-        latex_string = mathml_content
+    key = content_key(data, "yarosh", converter_version())
+    cached = math_cache.get(key)
+    if cached is not None:
+        out.write(cached)
+        return
 
-    return f"${latex_string}$"
+    latex_string = _native_latex(data)
+    if latex_string is None:
+        try:
+            latex_string = mathml2latex_yarosh(build_mathml(data))
+        except (ValueError, TypeError, etree.XSLTApplyError) as error:
+            # Not cached, so the failure is counted every time
+            out.write(f"${_math_failure(data, error)}$")
+            return
 
+    markdown_output = f"${latex_string}$"
+    math_cache.put(key, markdown_output)
+    out.write(markdown_output)
 
-def convert_json_to_mathml(data):
-    """Converts the math part of JSON data to MathML."""
-    if isinstance(data, dict):
-        if "#name" in data:
-            tag_name = data["#name"]
-            if tag_name == "math":
-                mathml_string = "<math"
-                mathml_string += """ xmlns="http://www.w3.org/1998/Math/MathML" """
-                if "$" in data:
-                    for attr, value in data["$"].items():
-                        mathml_string += f'{attr}="{value}" '
-                mathml_string = mathml_string.strip()
-                mathml_string += ">"
-                if "$$" in data:
-                    mathml_string += convert_json_to_mathml(data["$$"])
-                mathml_string += "</math>"
-                return mathml_string
+
+def _native_latex(data):
+    if native_math:
+        try:
+            return math_to_latex(data)
+        except UnsupportedMath:
+            pass
+    return None
+
+
+def prepare_math(data):
+    """
+    Converts every equation under `data` ahead of rendering.
+
+    Equations found in the cache or supported by the native renderer are
+    converted as `handle_math` would; the rest go through the XSLT together,
+    with `mathml2latex_yarosh_batch`.
+
+    Args:
+        data: A JSON document or node.
+
+    Returns:
+        A dict with the Markdown of each equation by the `id` of its node,
+        for `ConversionContext.prepared_math`.
+    """
+    prepared = {}
+    pending = {}
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            if node.get("#name") != "math":
+                if "$$" in node:
+                    stack.append(node["$$"])
+                elif "#name" not in node:
+                    stack.extend(node.get(key) for key in ("content", "floats"))
+                continue
+            if not isinstance(node.get("$$"), list):
+                continue
+            key = content_key(node, "yarosh", converter_version())
+            markdown_output = math_cache.get(key)
+            if markdown_output is None:
+                if key in pending:
+                    pending[key].append(node)
+                    continue
+                latex_string = _native_latex(node)
+                if latex_string is None:
+                    pending[key] = [node]
+                    continue
+                markdown_output = f"${latex_string}$"
+                math_cache.put(key, markdown_output)
+            prepared[id(node)] = markdown_output
+
+    equations = []
+    for key, nodes in list(pending.items()):
+        try:
+            equations.append(build_mathml(nodes[0]))
+        except (ValueError, TypeError) as error:
+            # Failures aren't cached, so they are counted in every document
+            markdown_output = f"${_math_failure(nodes[0], error)}$"
+            for node in pending.pop(key):
+                prepared[id(node)] = markdown_output
+
+    converted = mathml2latex_yarosh_batch(equations)
+    for (key, nodes), latex_string in zip(pending.items(), converted):
+        if latex_string is None:
+            markdown_output = f"${_math_failure(nodes[0], 'the stylesheet failed')}$"
+        else:
+            markdown_output = f"${latex_string}$"
+            math_cache.put(key, markdown_output)
+        for node in nodes:
+            prepared[id(node)] = markdown_output
+    return prepared
+
+
+def build_mathml(data):
+    """
+    Builds the MathML element tree of the math part of JSON data.
+
+    Text and attribute values are set on lxml elements, so they are escaped
+    as needed and the tree goes to the XSLT without being serialized.
+
+    Raises:
+        ValueError: A tag or attribute name isn't valid XML, or the text has
+            characters XML can't represent.
+        TypeError: A tag name isn't a string.
+    """
+    root = etree.Element(
+        f"{{{MATHML_NAMESPACE}}}{data['#name']}", nsmap={None: MATHML_NAMESPACE}
+    )
+    stack = [(data, root)]
+    while stack:
+        data, element = stack.pop()
+        for attr, value in data.get("$", {}).items():
+            element.set(attr, str(value))
+        if "_" in data and data["#name"] != "math":
+            element.text = str(data["_"])
+        children = data.get("$$")
+        if not children:
+            continue
+        items = list(reversed(children))
+        while items:
+            item = items.pop()
+            if isinstance(item, dict):
+                if "#name" in item:
+                    child = etree.SubElement(element, f"{{{MATHML_NAMESPACE}}}{item['#name']}")
+                    stack.append((item, child))
+            elif isinstance(item, list):
+                items.extend(reversed(item))
+            elif len(element):
+                element[-1].tail = (element[-1].tail or "") + str(item)
             else:
-                mathml_string = f"<{tag_name}"
-                if "$" in data:
-                    for attr, value in data["$"].items():
-                        mathml_string += f' {attr}="{value}"'
-                mathml_string += ">"
-                if "_" in data:
-                    mathml_string += handle_label(data)
-                if "$$" in data:
-                    mathml_string += convert_json_to_mathml(data["$$"])
-                mathml_string += f"</{tag_name}>"
-                return mathml_string
+                element.text = (element.text or "") + str(item)
+    return root
+
+
+def convert_json_to_mathml(data, out=None):
+    """Converts the math part of JSON data to MathML."""
+    if out is None:
+        return render_to_string(convert_json_to_mathml, data)
+    out.write(etree.tostring(build_mathml(data), encoding="unicode"))
+
+
+def _math_failure(data, error):
+    # Counts an equation the XSLT couldn't convert and returns what is shown
+    # in its place: the MathML, or only its text if there is no valid MathML
+    current_context().math_failures += 1
+    print(f"Math conversion failed: {error}")
+    try:
+        return convert_json_to_mathml(data)
+    except (ValueError, TypeError):
+        pass
+    texts = []
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            if "$$" in node:
+                stack.append(node["$$"])
+            if "_" in node and node.get("#name") != "math":
+                texts.append(str(node["_"]))
         else:
-            return ""
-    elif isinstance(data, list):
-        mathml_string = ""
-        for item in data:
-            mathml_string += convert_json_to_mathml(item)
-        return mathml_string
-    else:
-        return str(data)
+            texts.append(str(node))
+    return "".join(texts)
 
 
-def handle_figure(data):
-    global attachment_lookup
-    markdown_output = ""
+def handle_figure(data, out=None):
+    if out is None:
+        return render_to_string(handle_figure, data)
+    attachment_lookup = current_context().index.attachments
     caption = ""
     image_url = ""
     label = ""
@@ -318,9 +787,9 @@ def handle_figure(data):
     if "$$" in data:
         for item in data["$$"]:
             if item["#name"] == "label":
-                label = handle_label(item)
+                label = render_normalized(handle_label, item)
             if item["#name"] == "caption":
-                caption = handle_caption(item).strip()
+                caption = render_normalized(handle_caption, item).strip()
             elif item["#name"] == "link":
                 if "$" in item and "locator" in item["$"]:
                     locator = item["$"]["locator"]
@@ -340,15 +809,15 @@ def handle_figure(data):
             caption_part = f" {clean_caption}"
     
         # markdown_output += f'![{label.replace('\n', ' ') + '.' if label else ''}{' ' + caption.replace('\n', ' ') if caption else ''}]({image_url})'
-        markdown_output += f"![{label_part}{caption_part}]({image_url})\n\n"
+        out.write(f"![{label_part}{caption_part}]({image_url})\n\n")
         if caption or label:
-            markdown_output += f"*{label_part}{caption_part}*\n\n"
-
-    return markdown_output
+            out.write(f"*{label_part}{caption_part}*\n\n")
 
 
-def handle_table(data):
-    markdown_output = ""
+def handle_table(data, out=None):
+    if out is None:
+        return render_to_string(handle_table, data)
+    table_body = MarkdownWriter()
     caption = ""
     label = ""
     source = ""
@@ -359,28 +828,30 @@ def handle_table(data):
             if item["#name"] == "label":
                 label = handle_label(item)
             elif item["#name"] == "caption":
-                caption = handle_caption(item).strip()
+                caption = render_normalized(handle_caption, item).strip()
             elif item["#name"] == "source":
                 source = handle_label(item)
             elif item["#name"] == "tgroup":
-                markdown_output += handle_tgroup(item)
+                spill = table_spill
+                if spill is not None and spill.spills(table_body_rows(item)):
+                    spill_tgroup(item, spill, data.get("$", {}).get("id"), out=table_body)
+                else:
+                    handle_tgroup(item, out=table_body)
             elif item["#name"] == "table-footnote":
                 footnotes.append(handle_table_footnote(item))
 
     if caption or label:
-        markdown_output = (
+        out.write(
             f"{'**' + label + '**:' if label else ''}{' ' + caption if caption else ''}\n\n"
-            + markdown_output
         )
+    out.write(table_body.getvalue())
     if source:
-        markdown_output += f"\nSource: {source}\n"
+        out.write(f"\nSource: {source}\n")
 
     if footnotes:
-        markdown_output += "\n" + "\n".join(footnotes) + "\n"
-
-    markdown_output += "\n---\n\n"
+        out.write("\n" + "\n".join(footnotes) + "\n")
 
-    return markdown_output
+    out.write("\n---\n\n")
 
 
 def handle_table_footnote(data):
@@ -396,149 +867,269 @@ def handle_table_footnote(data):
     return f"- {label}. {note_para}"
 
 
-def handle_tgroup(data):
-    markdown_output = ""
+def handle_tgroup(data, out=None):
+    if out is None:
+        return render_to_string(handle_tgroup, data)
     if "$$" in data:
         num_cols = int(data["$"]["cols"]) if "$" in data and "cols" in data["$"] else 0
-        col_widths = []
+        columns = table_columns(data)
         header = []
         rows = []
 
         for item in data["$$"]:
-            if item["#name"] == "colspec":
-                # You might want to extract col width info here
-                col_widths.append(1)  # Default width
-            elif item["#name"] == "thead":
-                header = handle_thead(item, num_cols)
+            if item["#name"] == "thead":
+                header = handle_thead(item, num_cols, columns)
             elif item["#name"] == "tbody":
-                rows = handle_tbody(item, num_cols)
-
-        if header:
-            for header_row in header:
-                markdown_output += "|"
-                for _, cell in enumerate(header_row):
-                    markdown_output += cell + "|"
-                markdown_output += "\n"
-
-                # Add separator row after each header row
-                markdown_output += "|"
-                for i in range(len(header_row)):
-                    markdown_output += "---|"
-                markdown_output += "\n"
-        elif num_cols > 0:
-            # Add separator row even if there's no header
-            markdown_output += "|"
-            markdown_output += " |" * num_cols
-            markdown_output += "\n|"
-            markdown_output += "---|" * num_cols
-            markdown_output += "\n"
-
-        if rows:
-            for row in rows:
-                markdown_output += "|"
-                for cell in row:
-                    markdown_output += cell + "|"
-                markdown_output += "\n"
-
-    markdown_output += "\n"
-    return markdown_output
+                # Several bodies are laid out one after the other
+                rows.extend(handle_tbody(item, num_cols, columns))
+
+        _write_pipe_table(header, rows, num_cols, out)
 
+    out.write("\n")
 
-def handle_thead(data, num_cols):
+
+def spill_tgroup(data, spill, name=None, out=None):
+    """
+    Writes the body of a large `tgroup` to a sidecar file of `spill`, row
+    by row, and renders the header and the first rows followed by a link.
+
+    Args:
+        data: The `tgroup` node.
+        spill: The `TableSpill` to write to.
+        name: Name of the sidecar file, before its content hash.
+    """
+    if out is None:
+        return render_to_string(spill_tgroup, data, spill, name)
+    num_cols = int(data["$"]["cols"]) if "$" in data and "cols" in data["$"] else 0
+    columns = table_columns(data)
     header = []
-    if "$$" in data:
-        for item in data["$$"]:
-            if item["#name"] == "row":
-                row_data = [""] * num_cols
-                col_index = 0
-                if "$$" in item:
-                    for entry in item["$$"]:
-                        if entry["#name"] == "entry":
-                            if "$" in entry:
-                                if "namest" in entry["$"] and "nameend" in entry["$"]:
-                                    start_col = int(entry["$"]["namest"][3:]) - 1
-                                    end_col = int(entry["$"]["nameend"][3:]) - 1
-                                    content = handle_label(entry)
-
-                                    # Fill in the spanned cells
-                                    for i in range(start_col, end_col + 1):
-                                        row_data[i] = content
-                                    col_index = end_col + 1
-                                elif "colname" in entry["$"]:
-                                    col_num = int(entry["$"]["colname"][3:]) - 1
-                                    content = handle_label(entry)
-                                    row_data[col_num] = content
-                                    col_index = col_num + 1
-                                else:
-                                    row_data[col_index] = handle_label(entry)
-                                    col_index += 1
-                            else:
-                                row_data[col_index] = handle_label(entry)
-                                col_index += 1
-
-                header.append(row_data)
-    return header
-
-
-def handle_tbody(data, num_cols):
-    rows = []
-    if "$$" in data:
-        for item in data["$$"]:
-            if item["#name"] == "row":
-                row_data = [""] * num_cols
-                col_index = 0
-                if "$$" in item:
-                    for entry in item["$$"]:
-                        if entry["#name"] == "entry":
-                            content = ""
-                            if "$" in entry:
-                                if "namest" in entry["$"] and "nameend" in entry["$"]:
-                                    start_col = int(entry["$"]["namest"][3:]) - 1
-                                    end_col = int(entry["$"]["nameend"][3:]) - 1
-                                    content = handle_label(entry)
-
-                                    # Fill in the spanned cells
-                                    for i in range(start_col, end_col + 1):
-                                        row_data[i] = content
-                                    col_index = end_col + 1
-
-                                elif "colname" in entry["$"]:
-                                    col_num = int(entry["$"]["colname"][3:]) - 1
-                                    content = handle_label(entry)
-                                    row_data[col_num] = content
-                                    col_index = col_num + 1
-                                else:
-                                    row_data[col_index] = handle_label(entry)
-                                    col_index += 1
-                            else:
-                                row_data[col_index] = handle_label(entry)
-                                col_index += 1
-
-                rows.append(row_data)
-    return rows
-
-
-def handle_outline(data):
-    markdown_output = ""
+    bodies = []
+    for item in data.get("$$", ()):
+        if item["#name"] == "thead":
+            header = handle_thead(item, num_cols, columns)
+        elif item["#name"] == "tbody":
+            bodies.append(item)
+
+    preview = []
+
+    def rows():
+        for body in bodies:
+            for row in iter_table_rows(body, num_cols, columns):
+                if len(preview) < spill.preview_rows:
+                    preview.append(row)
+                yield row
+
+    link, count = spill.write(name or "table", header, rows(), num_cols)
+    _write_pipe_table(header, preview, num_cols, out)
+    out.write(f"\n[Full table: {count} rows]({link})\n\n")
+
+
+def _write_pipe_table(header, rows, num_cols, out):
+    if header:
+        # A separator row after each header row
+        separator = "|" + "---|" * num_cols + "\n"
+        out.write("".join(_table_row(row) + separator for row in header))
+    elif num_cols > 0:
+        # Add separator row even if there's no header
+        out.write("|" + " |" * num_cols + "\n|" + "---|" * num_cols + "\n")
+
+    if rows:
+        out.write("".join(map(_table_row, rows)))
+
+
+def _table_row(cells):
+    return "|" + "|".join(cells) + "|\n" if cells else "|\n"
+
+
+def table_columns(tgroup):
+    """
+    Returns the column index of each `colspec` name of a `tgroup`.
+
+    Columns are numbered by their `colnum` attribute, or in document order.
+    """
+    columns = {}
+    position = 0
+    for item in tgroup.get("$$", ()):
+        if item.get("#name") != "colspec":
+            continue
+        attributes = item.get("$", {})
+        position = int(attributes["colnum"]) if "colnum" in attributes else position + 1
+        if "colname" in attributes:
+            columns[attributes["colname"]] = position - 1
+    return columns
+
+
+def table_body_rows(tgroup):
+    """Returns the number of body rows of a `tgroup`, without rendering them."""
+    return sum(
+        1
+        for item in tgroup.get("$$", ())
+        if item.get("#name") == "tbody"
+        for row in item.get("$$", ())
+        if row.get("#name") == "row"
+    )
+
+
+def table_grid(data, num_cols, columns=None):
+    """
+    Lays out the rows of a `thead` or `tbody` on a grid of `num_cols` columns.
+
+    See `iter_table_rows`.
+
+    Returns:
+        A list of rows, each a list of `num_cols` Markdown cells.
+    """
+    return list(iter_table_rows(data, num_cols, columns))
+
+
+def iter_table_rows(data, num_cols, columns=None):
+    """
+    Lays out the rows of a `thead` or `tbody` on `num_cols` columns, one row
+    at a time.
+
+    An entry goes in the column named by its `colname`, spans from `namest`
+    to `nameend`, or else takes the next free column. Spanned cells repeat
+    the entry's content, across columns as well as down the `morerows` rows
+    below it, which later entries of those rows skip.
+
+    Args:
+        data: The `thead` or `tbody` node.
+        num_cols: The `cols` of the table group.
+        columns: Column index by name, see `table_columns`. Names missing
+            from it are read as "col<number>".
+
+    Yields:
+        A list of `num_cols` Markdown cells per row. Only the spans reaching
+        into the following rows are kept between rows.
+    """
+    # Copied so that the names parsed below are only parsed once
+    columns = dict(columns or ())
+
+    def column(name):
+        index = columns.get(name)
+        if index is None:
+            index = columns[name] = int(name[3:]) - 1
+        return index
+
+    rows = [item for item in data.get("$$", ()) if item["#name"] == "row"]
+    # Cells spanned from the rows above: row index -> {column: content}
+    spanned = {}
+    for row_index, item in enumerate(rows):
+        row_data = [""] * num_cols
+        taken = spanned.pop(row_index, {})
+        for col, content in taken.items():
+            row_data[col] = content
+        col_index = 0
+        for entry in item.get("$$", ()):
+            if entry["#name"] != "entry":
+                continue
+            attributes = entry.get("$")
+            if attributes and "namest" in attributes and "nameend" in attributes:
+                start_col = column(attributes["namest"])
+                end_col = column(attributes["nameend"])
+            elif attributes and "colname" in attributes:
+                start_col = end_col = column(attributes["colname"])
+            else:
+                while col_index in taken:
+                    col_index += 1
+                start_col = end_col = col_index
+            content = entry.get("_", "") if "$$" not in entry else handle_label(entry)
+            col_index = end_col + 1
+            if start_col == end_col:
+                row_data[start_col] = content
+            elif 0 <= start_col < end_col < num_cols:
+                row_data[start_col:col_index] = [content] * (col_index - start_col)
+            else:
+                # Out of the grid: fail, or wrap around, like single cells
+                for i in range(start_col, col_index):
+                    row_data[i] = content
+                continue
+
+            if attributes and "morerows" in attributes and start_col >= 0:
+                last = min(row_index + int(attributes["morerows"]), len(rows) - 1)
+                for below in range(row_index + 1, last + 1):
+                    cells = spanned.setdefault(below, {})
+                    for col in range(start_col, col_index):
+                        cells[col] = content
+        yield row_data
+
+
+def handle_thead(data, num_cols, columns=None):
+    return table_grid(data, num_cols, columns)
+
+
+def handle_tbody(data, num_cols, columns=None):
+    return table_grid(data, num_cols, columns)
+
+
+def handle_outline(data, out=None):
+    if out is None:
+        return render_to_string(handle_outline, data)
     if "$$" in data:
         for item in data["$$"]:
             if item.get("#name") == "list":
-                markdown_output += handle_list(item)
-    return markdown_output
-
-
-def handle_section(data):
+                handle_list(item, out=out)
+
+
+def handle_section(data, out=None):
+    if out is None:
+        return render_to_string(handle_section, data)
+    render_parts(_section_parts(data), out)
+
+
+def _section_parts(data, LaTeX=False):
+    context = current_context()
+    if section_cache is None or context.in_section or context.normalize_nodes:
+        return _section_body_parts(data)
+    return [partial(_render_cached_section, data)]
+
+
+def _render_cached_section(data, out):
+    context = current_context()
+    cache = section_cache
+    start = time.perf_counter()
+    key = section_key(data, context)
+    entry = cache.get(key, time.perf_counter() - start)
+    if entry is not None:
+        out.write(entry["markdown"])
+        context.processed_floats.update(entry["floats"])
+        return
+
+    floats = set(context.processed_floats)
+    failures = context.math_failures
+    section_out = MarkdownWriter()
+    start = time.perf_counter()
+    context.in_section = True
+    try:
+        render_parts(_section_body_parts(data), section_out)
+    finally:
+        context.in_section = False
+    seconds = time.perf_counter() - start
+    markdown = section_out.getvalue()
+    # Like the math cache, keeps no failed conversion
+    if context.math_failures == failures:
+        cache.put(key, markdown, context.processed_floats - floats, seconds)
+    out.write(markdown)
+
+
+def _section_body_parts(data):
     if "$$" in data:
         for item in data["$$"]:
             if item.get("#name") == "section-title":
-                return handle_section_with_title(data)
-    return f"\n\n---\n\n{handle_label(data)}\n\n---\n\n"
+                return _section_with_title_parts(data)
+    return ["\n\n---\n\n", *_label_parts(data), "\n\n---\n\n"]
+
 
+def handle_section_with_title(data, out=None):
+    if out is None:
+        return render_to_string(handle_section_with_title, data)
+    render_parts(_section_with_title_parts(data), out)
 
-def handle_section_with_title(data):
+
+def _section_with_title_parts(data):
     label = ""
     section_title = ""
-    other_content = ""
+    other_content = []
     heading_level = 2
     if "$$" in data:
         for item in data["$$"]:
@@ -549,74 +1140,110 @@ def handle_section_with_title(data):
             elif item.get("#name") == "section-title":
                 section_title = handle_label(item)
             else:
-                other_content += json_to_markdown(item)
+                other_content.append((item, False))
+
+    heading = f"\n\n---\n\n{'#' * heading_level} {label} {section_title}\n\n"
+    return [heading, *other_content, "\n\n---\n\n"]
+
 
-    return f"\n\n---\n\n{'#' * heading_level} {label} {section_title}\n\n{other_content}\n\n---\n\n"
+def handle_section_title(data, out=None):
+    if out is None:
+        return render_to_string(handle_section_title, data)
+    out.write("## ")
+    handle_label(data, out=out)
+    out.write("\n\n")
 
 
-def handle_section_title(data):
-    return "## " + handle_label(data) + "\n\n"
+def handle_br(data, out=None):
+    if out is None:
+        return render_to_string(handle_br, data)
+    out.write("<br>")
 
 
-def handle_br(data):
-    return "<br>"
+def handle_bold(data, LaTeX=False, out=None):
+    if out is None:
+        return render_to_string(handle_bold, data, LaTeX=LaTeX)
+    render_parts(_bold_parts(data, LaTeX), out)
 
 
-def handle_bold(data, LaTeX=False):
+def _bold_parts(data, LaTeX=False):
     if not LaTeX:
-        return f"**{handle_label(data)}**"
-    return f"\\textbf{{{handle_label(data, LaTeX)}}}"
+        return ["**", *_label_parts(data), "**"]
+    return ["\\textbf{", *_label_parts(data, LaTeX), "}"]
+
+
+def handle_italic(data, LaTeX=False, out=None):
+    if out is None:
+        return render_to_string(handle_italic, data, LaTeX=LaTeX)
+    render_parts(_italic_parts(data, LaTeX), out)
 
 
-def handle_italic(data, LaTeX=False):
+def _italic_parts(data, LaTeX=False):
     if not LaTeX:
-        return f"*{handle_label(data)}*"
-    return f"\\textit{{{handle_label(data, LaTeX)}}}"
+        return ["*", *_label_parts(data), "*"]
+    return ["\\textit{", *_label_parts(data, LaTeX), "}"]
 
 
-def handle_small_caps(data):
+def handle_small_caps(data, out=None):
+    if out is None:
+        return render_to_string(handle_small_caps, data)
     # Small caps are not supported in Markdown, so we convert them to uppercase
     upper = handle_label(data, LaTeX=True).upper()
     # then make it small using latex format
-    return "$_{" + upper + "}$"
+    out.write("$_{" + upper + "}$")
 
 
-def handle_sup(data):
-    return "$^{" + handle_label(data, LaTeX=True) + "}$"
+def handle_sup(data, out=None):
+    if out is None:
+        return render_to_string(handle_sup, data)
+    render_parts(_sup_parts(data), out)
 
 
-def handle_inf(data):
-    text = handle_label(data, LaTeX=True)
+def _sup_parts(data, LaTeX=False):
+    return ["$^{", *_label_parts(data, LaTeX=True), "}$"]
+
+
+def handle_inf(data, out=None):
+    if out is None:
+        return render_to_string(handle_inf, data)
+    render_parts(_inf_parts(data), out)
+
+
+def _inf_parts(data, LaTeX=False):
+    opening = "$_{"
     # we need to add many / when special characters can come
     if "$" in data:
         loc = data["$"]["loc"]
         if loc == "pre":
-            return "$^{" + text + "}$"
-        elif loc == "post":
-            return "$_{" + text + "}$"
-        else:
+            opening = "$^{"
+        elif loc != "post":
             print(f"Unhandled loc: {loc}")
             print(data)
-    return "$_{" + text + "}$"
+    return [opening, *_label_parts(data, LaTeX=True), "}$"]
 
 
-def handle_hsp(data):
-    return " "
+def handle_hsp(data, out=None):
+    if out is None:
+        return render_to_string(handle_hsp, data)
+    out.write(" ")
 
 
 # formula
-def handle_formula(data):
-    markdown_output = "\n"
+def handle_formula(data, out=None):
+    if out is None:
+        return render_to_string(handle_formula, data)
+    out.write("\n")
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
+        render_markdown(data["$$"], out=out)
     if "$" in data:
         if "id" in data["$"]:
             id = data["$"]["id"]
-            markdown_output += f" [^({id})]"
-    return markdown_output
+            out.write(f" [^({id})]")
 
 
-def handle_glyph(data):
+def handle_glyph(data, out=None):
+    if out is None:
+        return render_to_string(handle_glyph, data)
     if "$" in data:
         if "name" in data["$"]:
             name = data["$"]["name"]
@@ -634,39 +1261,59 @@ def handle_glyph(data):
                 )
 
                 if unicode:
-                    return f"&#x{unicode:x};"
+                    out.write(f"&#x{unicode:x};")
+                    return
 
                 base_path = "https://sdfestaticassets-us-east-1.sciencedirectassets.com/shared-assets/55/entities/"
-                return f"![{description}]({base_path}{filename})"
+                out.write(f"![{description}]({base_path}{filename})")
 
 
-def handle_label(data: dict, LaTeX=False):
-    _data = ""
-    subdata = ""
-    if "_" in data:
-        _data = data["_"]
+def handle_label(data: dict, LaTeX=False, out=None):
+    if out is None:
+        if "$$" not in data:
+            # Plain text nodes are by far the most common, skip the writer
+            return data.get("_", "")
+        return render_to_string(handle_label, data, LaTeX=LaTeX)
+    render_parts(_label_parts(data, LaTeX), out)
+
+
+def _label_parts(data, LaTeX=False):
+    parts = [data["_"]] if "_" in data else []
     if "$$" in data:
-        for item in data["$$"]:
-            subdata += json_to_markdown(item, LaTeX)
-    return _data + subdata
+        parts.extend((item, LaTeX) for item in data["$$"])
+    return parts
 
 
-def handle_cross_ref(data):
+def handle_cross_ref(data, out=None):
+    if out is None:
+        return render_to_string(handle_cross_ref, data)
     if "refid" in data["$"]:
         refid = data["$"]["refid"]
-        link_text = handle_label(data)
-        return f"[{link_text}](#{refid})"
-    return handle_label(data) if "_" in data else ""
+        out.write("[")
+        handle_label(data, out=out)
+        out.write(f"](#{refid})")
+        return
+    if "_" in data:
+        handle_label(data, out=out)
 
 
-def handle_inter_ref(data):
+def handle_inter_ref(data, out=None):
+    if out is None:
+        return render_to_string(handle_inter_ref, data)
     if "href" in data["$"]:
         href = data["$"]["href"]
-        return f"[{handle_label(data) if '_' in data else ''}]({href})"
-    return handle_label(data) if "_" in data else ""
+        out.write("[")
+        if "_" in data:
+            handle_label(data, out=out)
+        out.write(f"]({href})")
+        return
+    if "_" in data:
+        handle_label(data, out=out)
 
 
-def handle_intra_ref(data):
+def handle_intra_ref(data, out=None):
+    if out is None:
+        return render_to_string(handle_intra_ref, data)
     if "href" in data["$"]:
         href = data["$"]["href"]
         # Modify the href as per the rule:
@@ -674,40 +1321,47 @@ def handle_intra_ref(data):
         modified_href = "https://www.sciencedirect.com/science/article/" + href.replace(
             ":", "/"
         ).replace("-", "").replace(".", "")
-        return f"[{handle_label(data) if '_' in data else ''}]({modified_href})"
-    return handle_label(data) if "_" in data else ""
+        out.write("[")
+        if "_" in data:
+            handle_label(data, out=out)
+        out.write(f"]({modified_href})")
+        return
+    if "_" in data:
+        handle_label(data, out=out)
 
 
-def handle_display(data):
-    markdown_output = ""
+def handle_display(data, out=None):
+    if out is None:
+        return render_to_string(handle_display, data)
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
-    return markdown_output
+        render_markdown(data["$$"], out=out)
 
 
-def handle_textbox(data):
-    markdown_output = ""
+def handle_textbox(data, out=None):
+    if out is None:
+        return render_to_string(handle_textbox, data)
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
-    return markdown_output
+        render_markdown(data["$$"], out=out)
 
 
-def handle_caption(data):
-    markdown_output = ""
+def handle_caption(data, out=None):
+    if out is None:
+        return render_to_string(handle_caption, data)
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
-    return markdown_output
+        render_markdown(data["$$"], out=out)
 
 
-def handle_textbox_body(data):
-    markdown_output = ""
+def handle_textbox_body(data, out=None):
+    if out is None:
+        return render_to_string(handle_textbox_body, data)
     if "$$" in data:
-        markdown_output += json_to_markdown(data["$$"])
-    return markdown_output
+        render_markdown(data["$$"], out=out)
 
 
-def handle_inline_figure(data):
-    global attachment_lookup
+def handle_inline_figure(data, out=None):
+    if out is None:
+        return render_to_string(handle_inline_figure, data)
+    attachment_lookup = current_context().index.attachments
     if "$$" in data:
         if data["$$"][0]["#name"] == "link":
             link = data["$$"][0]
@@ -719,15 +1373,156 @@ def handle_inline_figure(data):
 
                 if attachment_eid:
                     image_url = construct_image_url(attachment_eid)
-                    return f"![]({image_url})"
-    return ""
+                    out.write(f"![]({image_url})")
 
 
-def handle_link(data):
+def handle_link(data, out=None):
+    if out is None:
+        return render_to_string(handle_link, data)
     if "locator" in data["$"]:
-        image_url = construct_image_url(data["$"]["locator"])
-        return f"![]({image_url})"
-    return ""
+        context = current_context()
+        locator = data["$"]["locator"]
+        # The remote URL takes the locator, local copies are kept by eid
+        eid = context.index.attachments.get(locator)
+        image_url = context.asset_links.get(eid) or construct_image_url(locator)
+        out.write(f"![]({image_url})")
+
+
+# Maps a `#name` to its handler and whether the handler takes the `LaTeX` flag
+TAG_HANDLERS = {
+    "para": (handle_para, False),
+    "list": (handle_list, False),
+    "math": (handle_math, False),
+    "figure": (handle_figure, False),
+    "table": (handle_table, False),
+    "outline": (handle_outline, False),
+    "sections": (handle_label, False),
+    "body": (handle_label, False),
+    "section": (handle_section, False),
+    "section-title": (handle_section_title, False),
+    "simple-para": (handle_simple_para, False),
+    "br": (handle_br, False),
+    "bold": (handle_bold, True),
+    "italic": (handle_italic, True),
+    "small-caps": (handle_small_caps, False),
+    "sup": (handle_sup, False),
+    "inf": (handle_inf, False),
+    "hsp": (handle_hsp, False),
+    "formula": (handle_formula, False),
+    "glyph": (handle_glyph, False),
+    "label": (handle_label, False),
+    "cross-ref": (handle_cross_ref, False),
+    "inter-ref": (handle_inter_ref, False),
+    "intra-ref": (handle_intra_ref, False),
+    "display": (handle_display, False),
+    "textbox": (handle_textbox, False),
+    "caption": (handle_caption, False),
+    "textbox-body": (handle_textbox_body, False),
+    "chem": (handle_label, False),
+    "inline-figure": (handle_inline_figure, False),
+    "link": (handle_link, False),
+    "__text__": (handle_label, False),
+    "acknowledgment": (handle_label, False),
+    "conflict-of-interest": (handle_label, False),
+}
+
+
+# The parts of the handlers `render_parts` expands on its stack instead of
+# calling them, called as `parts(data, LaTeX)`. Handlers registered in their
+# place, or wrapped by `profile_handlers`, are called as usual.
+HANDLER_PARTS = {
+    handle_para: _para_parts,
+    handle_simple_para: _simple_para_parts,
+    handle_list: _list_parts,
+    handle_section: _section_parts,
+    handle_bold: _bold_parts,
+    handle_italic: _italic_parts,
+    handle_sup: _sup_parts,
+    handle_inf: _inf_parts,
+}
+
+
+def register_handler(tag_name, handler, LaTeX=False):
+    """
+    Registers a handler for an Elsevier tag, replacing any existing one.
+
+    Args:
+        tag_name: The `#name` of the nodes to handle.
+        handler: Called as `handler(data, out=writer)`, or as
+            `handler(data, LaTeX, out=writer)` when `LaTeX` is true. It must
+            write its Markdown into `out`.
+        LaTeX: Whether the handler receives the LaTeX flag.
+    """
+    TAG_HANDLERS[tag_name] = (handler, LaTeX)
+
+
+# Counts the unhandled tags while `profile_handlers` runs
+handler_profiler = None
+
+
+@contextmanager
+def profile_handlers(profiler=None):
+    """
+    Times every registered handler for the duration of the block.
+
+    The handlers are replaced by `HandlerProfiler.wrap`ped versions, both in
+    `TAG_HANDLERS` and in this module, so handlers calling each other
+    directly are timed too. `handle_label` is left alone since
+    `render_markdown` expands it inline. Nothing is wrapped outside the
+    block, so profiling costs nothing when it isn't used.
+
+    Args:
+        profiler: The `HandlerProfiler` to record into; a new one by default.
+
+    Yields:
+        The `HandlerProfiler`.
+    """
+    global handler_profiler
+    if profiler is None:
+        profiler = HandlerProfiler()
+    wrapped = {}
+    for handler, _ in TAG_HANDLERS.values():
+        if handler is not handle_label and handler not in wrapped:
+            wrapped[handler] = profiler.wrap(handler)
+    tag_handlers = dict(TAG_HANDLERS)
+    module = globals()
+    names = [
+        name
+        for name, value in module.items()
+        if isinstance(value, FunctionType) and value in wrapped
+    ]
+    for tag_name, (handler, takes_latex) in tag_handlers.items():
+        if handler in wrapped:
+            TAG_HANDLERS[tag_name] = (wrapped[handler], takes_latex)
+    for name in names:
+        module[name] = wrapped[module[name]]
+    handler_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        handler_profiler = None
+        for name in names:
+            module[name] = module[name].__wrapped_handler__
+        for tag_name, entry in tag_handlers.items():
+            if TAG_HANDLERS.get(tag_name, (None,))[0] is wrapped.get(entry[0]):
+                TAG_HANDLERS[tag_name] = entry
+
+
+def load_plugin_handlers(group="sciencedirect2markdown.handlers"):
+    """
+    Registers the handlers advertised by installed packages.
+
+    Each entry point in `group` is named after the tag it handles and points
+    to the handler. A handler with a truthy `LaTeX` attribute receives the
+    LaTeX flag.
+    """
+    for entry_point in entry_points(group=group):
+        try:
+            handler = entry_point.load()
+        except Exception as e:
+            print(f"Failed to load handler plugin {entry_point.name}: {e}")
+            continue
+        register_handler(entry_point.name, handler, getattr(handler, "LaTeX", False))
 
 
 def construct_image_url(locator):
@@ -738,9 +1533,21 @@ def construct_image_url(locator):
         locator: The locator string.
 
     Returns:
-        The constructed image URL.
+        The constructed image URL, or the link to the local copy when the
+        asset mirror has it.
     """
-    return f"https://ars.els-cdn.com/content/image/{locator}"
+    link = current_context().asset_links.get(locator)
+    if link is not None:
+        return link
+    return f"{IMAGE_BASE_URL}{locator}"
+
+
+# From the start of a run only, or every space of a long run would rescan it
+TRAILING_SPACES_RE = re.compile(r"(?<! ) +\n")
+EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
+# A rule directly followed by another; dropping it, rather than matching the
+# whole run, also catches runs that share a newline, e.g. "\n---\n---\n\n---\n"
+REPEATED_RULES_RE = re.compile(r"\n---\n(?=\n---\n)")
 
 
 def handle_post_process(markdown_output):
@@ -753,66 +1560,455 @@ def handle_post_process(markdown_output):
     Returns:
         The post-processed Markdown output.
     """
-    # Remove extra newlines
-    markdown_output = re.sub(r"\n{3,}", "\n\n", markdown_output)
-
     # Remove extra spaces before newlines
-    markdown_output = re.sub(r" +\n", "\n", markdown_output)
+    markdown_output = TRAILING_SPACES_RE.sub("\n", markdown_output)
+
+    # Remove extra newlines
+    markdown_output = EXTRA_NEWLINES_RE.sub("\n\n", markdown_output)
 
     # remove extra ---
-    markdown_output = re.sub(r"\n---\n\n---\n", "\n---\n", markdown_output)
+    markdown_output = REPEATED_RULES_RE.sub("", markdown_output)
 
     return markdown_output
 
 
-def remove_trailing_commas(json_string):
-    """Removes trailing commas from a JSON string."""
+class StreamingPostProcessor:
+    """
+    Applies `handle_post_process` to Markdown that arrives in pieces.
+
+    Every rule only matches runs of spaces, newlines and dashes, so the text up
+    to the last other character can be normalized on its own. Only that
+    trailing run is held back until more text arrives or `flush` is called,
+    which makes the output identical to post-processing the joined text.
+    """
 
-    # Remove trailing commas in objects and arrays
-    cleaned_json_string = re.sub(r",\s*}", "}", json_string)
-    cleaned_json_string = re.sub(r",\s*]", "]", cleaned_json_string)
+    def __init__(self):
+        self.pending = ""
 
-    return cleaned_json_string
+    def feed(self, text):
+        """Returns the normalized part of `text` that can no longer change."""
+        text = self.pending + text
+        cut = len(text.rstrip(" \n-"))
+        self.pending = text[cut:]
+        return handle_post_process(text[:cut])
 
+    def flush(self):
+        """Returns whatever was held back."""
+        text, self.pending = self.pending, ""
+        return handle_post_process(text)
 
-def batch_process_files(files):
+
+# Spine tags whose children are converted one at a time when streaming
+STREAMED_TAGS = {"body", "sections"}
+
+
+def iter_markdown_file(fp, LaTeX=False, context=None):
     """
-    Batch process multiple JSON files and return a dict of markdown outputs.
+    Converts a JSON document read from a file object, yielding the Markdown of
+    every block as soon as it completes.
+
+    The document is read twice: once to index `attachments` and `floats`,
+    skipping everything else, then again to convert `content`. The children
+    of `body` and `sections` are built and converted one at a time, so peak
+    memory is bounded by the largest section (plus the floats) rather than the
+    whole document. Trailing commas are tolerated. Documents that cannot be
+    streamed (unseekable files, no top-level `content`) are loaded whole.
 
     Args:
-        files: List of uploaded files
+        fp: A seekable text or binary (UTF-8) file object.
+        context: Optional `ConversionContext` to convert into, e.g. to read
+            its index and timings afterwards.
+
+    Yields:
+        Post-processed Markdown fragments that join to the same output as
+        `json_to_markdown`.
+    """
+    if context is None:
+        context = ConversionContext()
+    start = fp.tell() if fp.seekable() else None
+    if start is None or not _index_document(TokenStream(fp), context):
+        if start is not None:
+            # Drop what the first pass indexed, the whole document is added
+            context.index = DocumentIndex(context.index.prefer_high_res)
+            fp.seek(start)
+        yield from iter_markdown(loads_json(fp.read()), LaTeX, context)
+        return
+    localize_assets(context)
+    fp.seek(start)
+
+    stream = TokenStream(fp)
+    post_processor = StreamingPostProcessor()
+    stream.expect("{")
+    for key in iter_object(stream):
+        if key != "content":
+            skip_value(stream)
+            continue
+        token = stream.next()
+        items = iter_array(stream) if token[0] == "[" else [token]
+        for item in items:
+            for markdown in _iter_node_markdown(stream, item, context, LaTeX):
+                text = post_processor.feed(markdown)
+                if text:
+                    yield text
+    yield post_processor.flush()
+
+
+def _index_document(stream, context):
+    # Indexes the attachments and floats; False if there is no content to
+    # stream. Targets are left out, they would keep every section alive.
+    if stream.next()[0] != "{":
+        return False
+    index = context.index
+    start = time.perf_counter()
+    has_content = False
+    for key in iter_object(stream):
+        if key == "attachments":
+            index.add_attachments(parse_value(stream))
+        elif key == "floats":
+            index.add_floats(parse_value(stream))
+        else:
+            has_content = has_content or key == "content"
+            skip_value(stream)
+    index.documents += 1
+    index.seconds += time.perf_counter() - start
+    return has_content
+
+
+def _iter_node_markdown(stream, token, context, LaTeX):
+    # Yields the raw Markdown of the node starting at `token`. The text of a
+    # streamed spine node is written before its children, like `handle_label`.
+    node = {}
+    streamed = False
+    if token[0] == "{":
+        for key in iter_object(stream):
+            tag_name = node.get("#name")
+            if (
+                key == "$$"
+                and tag_name in STREAMED_TAGS
+                and TAG_HANDLERS.get(tag_name, (None,))[0] is handle_label
+            ):
+                first = stream.next()
+                if first[0] == "[":
+                    streamed = True
+                    yield node.pop("_", "")
+                    for item in iter_array(stream):
+                        yield from _iter_node_markdown(stream, item, context, LaTeX)
+                else:
+                    node[key] = parse_value(stream, first)
+            else:
+                node[key] = parse_value(stream)
+        if streamed:
+            yield node.get("_", "")
+            return
+    else:
+        node = parse_value(stream, token)
+
+    start = time.perf_counter()
+    with use_context(context):
+        context.prepared_math = prepare_math(node) if batch_math else {}
+        markdown = render_markdown(node, LaTeX)
+    context.render_seconds += time.perf_counter() - start
+    yield markdown
+
+
+def iter_markdown(data, LaTeX=False, context=None):
+    """
+    Converts the given JSON data to Markdown, yielding fragments in document
+    order as the tree is walked.
+
+    Each paragraph, list, display, float... is rendered and post-processed
+    on its own (see `StreamingPostProcessor`), so the first fragments can be
+    written out before the rest is rendered and the whole document never
+    needs to exist as one string. Sections are rendered whole while the
+    section cache is enabled, to go through it, and while profiling, to be
+    timed.
+
+    Args:
+        data: The JSON data to convert.
+        context: Optional `ConversionContext` to convert into.
+
+    Yields:
+        Markdown fragments that join to the output of `json_to_markdown`.
+    """
+    context = _start_document(data, context)
+    post_processor = StreamingPostProcessor()
+    open_sections = section_cache is None and handler_profiler is None
+    blocks = _iter_blocks(data, LaTeX, context, ((), ""), open_sections)
+    for markdown, _, _ in blocks:
+        text = post_processor.feed(markdown)
+        if text:
+            yield text
+    yield post_processor.flush()
+
+
+def _start_document(data, context):
+    if context is None:
+        context = ConversionContext()
+    if not context.index.documents:
+        context.index.add_document(data)
+    localize_assets(context)
+    with use_context(context):
+        context.prepared_math = prepare_math(data) if batch_math else {}
+    return context
+
+
+def iter_chunks(data, max_size=4000, measure=len, LaTeX=False, context=None):
+    """
+    Converts the given JSON data to Markdown in chunks for retrieval.
+
+    The document is rendered block by block (paragraphs, lists, displays,
+    floats, section headings...) and the blocks are grouped by `Chunker`:
+    chunks stay within one section and within `max_size` when the blocks
+    allow it. Nothing larger than a block is held as one string.
+
+    Args:
+        data: The JSON data to convert.
+        max_size: Budget of a chunk, in units of `measure`.
+        measure: Size of a text, `len` by default; pass a tokenizer's
+            counting function for a token budget.
+        context: Optional `ConversionContext` to convert into.
+
+    Yields:
+        `Chunk`s with their section path, section label, float ids and
+        offsets. Their texts join to the output of `json_to_markdown`.
+    """
+    context = _start_document(data, context)
+    chunker = Chunker(max_size, measure)
+    post_processor = StreamingPostProcessor()
+    section = ((), "")
+    for markdown, section, float_ids in _iter_blocks(data, LaTeX, context, section):
+        yield from chunker.add(post_processor.feed(markdown), section, float_ids)
+    yield from chunker.add(post_processor.flush(), section)
+    yield from chunker.flush()
+
+
+def _iter_blocks(data, LaTeX, context, section, open_sections=True):
+    # Yields (raw Markdown, (section path, label), float ids) per block, in
+    # the order `render_markdown` writes them. The nodes that `handle_label`
+    # renders, and sections unless `open_sections` is false, are opened up;
+    # everything else is one block.
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_blocks(item, False, context, section, open_sections)
+        return
+    if not isinstance(data, dict):
+        return
+    if "#name" not in data:
+        if "content" in data:
+            yield from _iter_blocks(data["content"], False, context, section, open_sections)
+        elif "floats" in data:
+            yield from _iter_blocks(data["floats"], False, context, section, open_sections)
+        return
+
+    handler, takes_latex = TAG_HANDLERS.get(data["#name"], (None, False))
+    if handler is handle_section and open_sections:
+        yield from _iter_section_blocks(data, context, section)
+        return
+    if handler is handle_label:
+        yield data.get("_", ""), section, ()
+        LaTeX = LaTeX if takes_latex else False
+        for item in data.get("$$", ()):
+            yield from _iter_blocks(item, LaTeX, context, section, open_sections)
+        return
+
+    floats = set(context.processed_floats)
+    start = time.perf_counter()
+    with use_context(context):
+        markdown = render_markdown(data, LaTeX)
+    context.render_seconds += time.perf_counter() - start
+    yield markdown, section, sorted(context.processed_floats - floats)
+
+
+def _iter_section_blocks(data, context, section):
+    # The blocks of `_section_body_parts`, with the heading as a block of its own
+    children = data.get("$$", ())
+    if not any(item.get("#name") == "section-title" for item in children):
+        yield "\n\n---\n\n", section, ()
+        yield data.get("_", ""), section, ()
+        for item in children:
+            yield from _iter_blocks(item, False, context, section)
+        yield "\n\n---\n\n", section, ()
+        return
+
+    label = ""
+    section_title = ""
+    heading_level = 2
+    with use_context(context):
+        for item in children:
+            if item.get("#name") == "label":
+                label = handle_label(item)
+                if "." in label:
+                    heading_level = len(label.split("."))
+            elif item.get("#name") == "section-title":
+                section_title = handle_label(item)
+    path, _ = section
+    heading = f"{label} {section_title}".strip()
+    section = (path + (heading,), label)
+    yield f"\n\n---\n\n{'#' * heading_level} {label} {section_title}\n\n", section, ()
+    for item in children:
+        if item.get("#name") not in ("label", "section-title"):
+            yield from _iter_blocks(item, False, context, section)
+    yield "\n\n---\n\n", section, ()
+
+
+def convert_json_string(json_data, cache=None):
+    """
+    Parses a ScienceDirect JSON payload and converts it to Markdown.
+
+    Payloads larger than `STREAMING_THRESHOLD` are converted section by section
+    with `convert_json_file` instead of being parsed whole.
+
+    Args:
+        json_data: The JSON document as str or UTF-8 bytes.
+        cache: Optional `TTLCache` of Markdown by `result_key`, looked up
+            before parsing.
+
     Returns:
-        Dict with filename as key and markdown content as value
+        The Markdown string.
     """
-    results = {}
-    for file in files:
-        try:
-            json_data = file.read().decode("utf-8")
-            cleaned_json_data = remove_trailing_commas(json_data)
-            data = json.loads(cleaned_json_data)
-            markdown_output = json_to_markdown(data)
-            filename = file.name.replace(".json", ".md")
-            results[filename] = markdown_output
-        except Exception as e:
-            results[f"{file.name}.error"] = str(e)
-    return results
+    if cache is not None:
+        key = result_key(json_data)
+        markdown = cache.get(key)
+        if markdown is None:
+            markdown = convert_json_string(json_data)
+            cache.put(key, markdown)
+        return markdown
+    if len(json_data) > STREAMING_THRESHOLD:
+        if isinstance(json_data, bytes):
+            return convert_json_file(BytesIO(json_data))
+        return convert_json_file(StringIO(json_data))
+    return json_to_markdown(loads_json(json_data))
+
+
+def iter_json_string(json_data):
+    """
+    Like `convert_json_string`, yielding the Markdown in fragments as it is
+    rendered, see `iter_markdown` and `iter_markdown_file`.
+    """
+    if len(json_data) > STREAMING_THRESHOLD:
+        if isinstance(json_data, bytes):
+            yield from iter_markdown_file(BytesIO(json_data))
+        else:
+            yield from iter_markdown_file(StringIO(json_data))
+        return
+    yield from iter_markdown(loads_json(json_data))
+
+
+def convert_json_file(fp):
+    """
+    Converts a JSON document read from a file object, see `iter_markdown_file`.
+
+    Args:
+        fp: A seekable text or binary (UTF-8) file object.
+
+    Returns:
+        The Markdown string.
+    """
+    return "".join(iter_markdown_file(fp))
+
+
+def result_key(json_data):
+    """Returns the key of a whole JSON payload in the result caches."""
+    return payload_key(json_data, converter_version())
 
 
-def create_zip_download(markdown_files):
+@st.cache_resource
+def shared_result_cache():
+    """
+    Returns the cache of converted documents shared by all the sessions of
+    the server, so that converting the same paste or uploads again is free.
+
+    Documents expire after `RESULT_CACHE_TTL` seconds, and the least recently
+    used are evicted beyond `RESULT_CACHE_BYTES` of Markdown.
+    """
+    return TTLCache(
+        maxsize=1024,
+        maxbytes=RESULT_CACHE_BYTES,
+        ttl=RESULT_CACHE_TTL,
+        sizeof=sys.getsizeof,
+    )
+
+
+def batch_process_files(
+    files, workers=None, timeout=None, progress=None, stats=None, cache=None, archive=None
+):
+    """
+    Batch process multiple JSON files and return a dict of markdown outputs.
+
+    Args:
+        files: List of uploaded files
+        workers: Number of worker processes, defaults to the CPU count
+        timeout: Optional per-file limit in seconds
+        progress: Optional callback called as `progress(done, total, result)`
+        stats: Optional `BatchStats` collecting throughput
+        cache: Optional `TTLCache` of Markdown by `result_key`; only the files
+            missing from it are converted, and failures are not cached
+        archive: Optional `MarkdownArchive` every output is added to as soon
+            as it is available, in completion order
+    Returns:
+        Dict with filename as key and markdown content as value, in upload order
+    """
+    sources = [(file.name, file.read()) for file in files]
+    if stats is None:
+        stats = BatchStats()
+    total = len(sources)
+    converted = {}
+    pending = []
+    keys = {}
+
+    def done(result):
+        if archive is not None and result.name not in converted:
+            archive.add(*_batch_output(result))
+        converted[result.name] = result
+
+    for name, payload in sources:
+        markdown = None
+        if cache is not None:
+            keys[name] = result_key(payload)
+            markdown = cache.get(keys[name])
+        if markdown is None:
+            pending.append((name, payload))
+            continue
+        result = BatchResult(name, markdown, size=len(payload))
+        done(result)
+        stats.add(result)
+        if progress is not None:
+            progress(stats.files, total, result)
+
+    def report(count, _, result):
+        if progress is not None:
+            progress(count, total, result)
+
+    for result in convert_batch(pending, workers, timeout, report, stats):
+        done(result)
+        if cache is not None and result.ok:
+            cache.put(keys[result.name], result.markdown)
+
+    return dict(_batch_output(converted[name]) for name, _ in sources)
+
+
+def _batch_output(result):
+    """Returns the output file name and content of a `BatchResult`."""
+    if result.ok:
+        return result.name.replace(".json", ".md"), result.markdown
+    return f"{result.name}.error", result.error
+
+
+def create_zip_download(markdown_files, compresslevel=None, store_only=False):
     """
     Create a ZIP file containing all markdown files.
 
     Args:
         markdown_files: Dict with filename as key and content as value
+        compresslevel: Optional deflate level, 0 to 9
+        store_only: Store the files uncompressed
     Returns:
-        BytesIO object containing the ZIP file
+        File object containing the ZIP file, see `MarkdownArchive`
     """
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, content in markdown_files.items():
-            zip_file.writestr(filename, content)
-    zip_buffer.seek(0)
-    return zip_buffer
+    archive = MarkdownArchive(compresslevel, store_only)
+    for filename, content in markdown_files.items():
+        archive.add(filename, content)
+    return archive.finish()
 
 
 # Entry point for Streamlit app
@@ -856,24 +2052,40 @@ def main():
 
         # Process uploaded files if any
         if uploaded_files:
-            results = batch_process_files(uploaded_files)
+            stats = BatchStats()
+            progress_bar = st.progress(0.0, text="Converting...")
+            # Compressed as the files come in, only needed for several files
+            archive = MarkdownArchive() if len(uploaded_files) > 1 else None
+            with archive or nullcontext():
+                results = batch_process_files(
+                    uploaded_files,
+                    progress=lambda done, total, result: progress_bar.progress(
+                        done / total, text=f"Converted {done}/{total}: {result.name}"
+                    ),
+                    stats=stats,
+                    cache=shared_result_cache(),
+                    archive=archive,
+                )
+                # Streamlit takes the download as bytes, so the archive is read
+                # back whole; the spooling only bounds memory while converting
+                zip_data = archive.finish().read() if archive is not None else None
+            progress_bar.empty()
+            st.caption(stats.summary())
 
             # Create ZIP download if multiple files
-            if len(results) > 1:
-                zip_buffer = create_zip_download(results)
+            if zip_data is not None:
                 st.download_button(
                     label="Download All as ZIP",
-                    data=zip_buffer,
+                    data=zip_data,
                     file_name="converted_markdown_files.zip",
                     mime="application/zip",
                 )
 
         # Process pasted JSON if no files uploaded
         elif json_data:
-            cleaned_json_data = remove_trailing_commas(json_data)
-            data = json.loads(cleaned_json_data)
-            markdown_output = json_to_markdown(data)
-            results["converted_markdown.md"] = markdown_output
+            results["converted_markdown.md"] = convert_json_string(
+                json_data, cache=shared_result_cache()
+            )
 
         # Display results
         if results:
@@ -905,5 +2117,7 @@ def main():
         st.exception(e)
 
 
+load_plugin_handlers()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,25 @@
+import io
+
+# Handlers append their Markdown into a shared writer and the text is joined
+# once at the end. `io.StringIO` keeps written fragments in one growing buffer,
+# so deep trees don't copy their intermediate output at every level.
+MarkdownWriter = io.StringIO
+
+
+def render_to_string(handler, data, *args, **kwargs):
+    """
+    Runs a writer-based handler and returns its output as a string.
+
+    Handlers take an optional `out` writer; when it is omitted they call this
+    helper so they can still be used as plain string-returning functions.
+
+    Args:
+        handler: A function called as `handler(data, *args, out=writer, **kwargs)`.
+        data: The JSON node to render.
+
+    Returns:
+        The rendered Markdown string.
+    """
+    out = MarkdownWriter()
+    handler(data, *args, out=out, **kwargs)
+    return out.getvalue()
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from importlib import resources
+from pathlib import Path
+
+from lxml import etree
+
+
+def _packaged_stylesheets():
+    if __package__:
+        return Path(str(resources.files(__package__).joinpath("mathconverter")))
+    return Path(__file__).resolve().parent / "mathconverter"  # run as a script
+
+
+# The stylesheets ship in the package's `mathconverter/` directory; the
+# SD2MD_MATHCONVERTER_DIR environment variable points elsewhere, e.g. to a
+# checkout with the transpect submodule.
+MATHCONVERTER_DIR = Path(
+    os.environ.get("SD2MD_MATHCONVERTER_DIR") or _packaged_stylesheets()
+)
+
+STYLESHEETS = {
+    "yarosh": ("xsl_yarosh", "mmltex.xsl"),
+    "transpect": ("xsl_transpect", "xsl", "mml2tex.xsl"),
+}
+
+
+class XSLTRegistry:
+    """
+    Process-wide registry of compiled XSLT transforms.
+
+    Each stylesheet is parsed once per process and compiled once per thread,
+    since a compiled lxml transform must not be run concurrently from several
+    threads.
+    """
+
+    def __init__(self, base_dir=MATHCONVERTER_DIR, stylesheets=STYLESHEETS):
+        self.base_dir = Path(base_dir)
+        self.stylesheets = dict(stylesheets)
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._local = threading.local()
+        self._stats = {}
+
+    def path(self, name):
+        """Returns the absolute path of the stylesheet registered as `name`."""
+        if name not in self.stylesheets:
+            raise KeyError(f"Unknown stylesheet: {name}")
+        return self.base_dir.joinpath(*self.stylesheets[name])
+
+    def require(self, name):
+        """
+        Returns the path of the stylesheet `name`, raising `FileNotFoundError`
+        with a hint when it isn't there.
+        """
+        path = self.path(name)
+        if not path.is_file():
+            relative = "/".join(self.stylesheets[name])
+            raise FileNotFoundError(
+                f"Stylesheet {name!r} not found at {path}. Set "
+                f"SD2MD_MATHCONVERTER_DIR to a directory holding {relative} "
+                "(the transpect stylesheets are the mathconverter/xsl_transpect "
+                "git submodule)."
+            )
+        return path
+
+    def get(self, name):
+        """
+        Returns the compiled transform for `name`, compiling it on first use.
+
+        Args:
+            name: The registered stylesheet name, e.g. "yarosh".
+
+        Returns:
+            An `etree.XSLT` object owned by the calling thread.
+        """
+        transforms = getattr(self._local, "transforms", None)
+        if transforms is None:
+            transforms = self._local.transforms = {}
+        transform = transforms.get(name)
+        if transform is None:
+            start = time.perf_counter()
+            transform = etree.XSLT(self._document(name))
+            self._record(name, "compile", time.perf_counter() - start)
+            transforms[name] = transform
+        return transform
+
+    def transform(self, name, dom):
+        """Runs the stylesheet `name` over `dom` and returns the result tree."""
+        transform = self.get(name)
+        start = time.perf_counter()
+        result = transform(dom)
+        self._record(name, "transform", time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        """
+        Returns the compile/transform counters per stylesheet.
+
+        Returns:
+            A dict like {"yarosh": {"compile_count": 1, "compile_seconds": ...,
+            "transform_count": ..., "transform_seconds": ...}}.
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def clear(self):
+        """Drops every parsed stylesheet and resets the counters."""
+        with self._lock:
+            self._documents.clear()
+            self._stats.clear()
+        self._local = threading.local()
+
+    def _document(self, name):
+        with self._lock:
+            document = self._documents.get(name)
+            if document is None:
+                start = time.perf_counter()
+                document = etree.parse(str(self.require(name)))
+                self._documents[name] = document
+                self._record_locked(name, "parse", time.perf_counter() - start)
+            return document
+
+    def _record(self, name, kind, seconds):
+        with self._lock:
+            self._record_locked(name, kind, seconds)
+
+    def _record_locked(self, name, kind, seconds):
+        stats = self._stats.setdefault(
+            name,
+            {
+                "parse_count": 0,
+                "parse_seconds": 0.0,
+                "compile_count": 0,
+                "compile_seconds": 0.0,
+                "transform_count": 0,
+                "transform_seconds": 0.0,
+            },
+        )
+        stats[f"{kind}_count"] += 1
+        stats[f"{kind}_seconds"] += seconds
+
+
+registry = XSLTRegistry()
@@ -0,0 +1,188 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sciencedirect2markdown.assets import AssetMirror, FetchError, HTTPFetcher
+from sciencedirect2markdown.streamlitweb import (
+    configure_asset_mirror,
+    configure_section_cache,
+    disable_asset_mirror,
+    disable_section_cache,
+    json_to_markdown,
+)
+
+IMAGES = {
+    "/gr1.jpg": b"figure one",
+    "/gr2.jpg": b"figure one",
+    "/gr3.png": b"figure three",
+    "/mmc1.jpg": b"supplementary",
+}
+
+
+@pytest.fixture(autouse=True)
+def no_asset_mirror():
+    yield
+    disable_asset_mirror()
+    disable_section_cache()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = IMAGES.get(self.path)
+        self.send_response(200 if body is not None else 404)
+        body = body if body is not None else b"not found"
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    ImageHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+class FlakyFetcher:
+    """Fails each URL `failures` times with a retryable error."""
+
+    def __init__(self, failures=1, status=503):
+        self.failures = failures
+        self.status = status
+        self.calls = []
+
+    async def fetch(self, url):
+        self.calls.append(url)
+        if self.calls.count(url) <= self.failures:
+            raise FetchError(url, self.status)
+        await asyncio.sleep(0)
+        return url.encode()
+
+
+def article():
+    figure = {
+        "#name": "figure",
+        "$": {"id": "f1"},
+        "$$": [
+            {"#name": "label", "_": "Fig. 1"},
+            {"#name": "caption", "$$": [{"#name": "simple-para", "_": "A figure."}]},
+            {"#name": "link", "$": {"locator": "gr1"}},
+        ],
+    }
+    section = {
+        "#name": "section",
+        "$": {"id": "s1"},
+        "$$": [
+            {"#name": "section-title", "_": "Introduction"},
+            {"#name": "para", "$$": [{"#name": "float-anchor", "$": {"refid": "f1"}}]},
+            {"#name": "link", "$": {"locator": "mmc1"}},
+        ],
+    }
+    attachments = [
+        {"file-basename": "gr1", "attachment-eid": "gr1.jpg", "attachment-type": "IMAGE-DOWNSAMPLED"},
+        {"file-basename": "mmc1", "attachment-eid": "mmc1.jpg", "attachment-type": "APPLICATION"},
+    ]
+    body = {"#name": "body", "$$": [{"#name": "sections", "$$": [section]}]}
+    return {"content": [body], "floats": [figure], "attachments": attachments}
+
+
+def test_mirror_over_http_is_content_addressed(tmp_path, image_server):
+    fetcher = HTTPFetcher(timeout=5)
+    mirror = AssetMirror(tmp_path, "assets", fetcher, concurrency=1, base_url=image_server)
+    links = mirror.localize(["gr1.jpg", "gr2.jpg", "gr3.png", "missing.jpg"])
+
+    assert set(links) == {"gr1.jpg", "gr2.jpg", "gr3.png"}
+    # Identical content is stored once
+    assert links["gr1.jpg"] == links["gr2.jpg"]
+    assert links["gr1.jpg"].startswith("assets/") and links["gr1.jpg"].endswith(".jpg")
+    path = tmp_path / links["gr3.png"].removeprefix("assets/")
+    assert path.read_bytes() == b"figure three"
+    # A 404 isn't retried
+    assert ImageHandler.requests.count("/missing.jpg") == 1
+    assert "HTTP 404" in mirror.failures["missing.jpg"]
+    # One keep-alive connection serves the requests made one at a time
+    assert fetcher.connections == 1
+    mirror.close()
+
+    # The index keeps the files across runs
+    again = AssetMirror(tmp_path, "assets", HTTPFetcher(), base_url=image_server)
+    assert again.localize(["gr1.jpg"]) == {"gr1.jpg": links["gr1.jpg"]}
+    assert again.downloaded == 0
+    again.close()
+
+
+def test_retries_with_backoff(tmp_path):
+    fetcher = FlakyFetcher(failures=2)
+    mirror = AssetMirror(tmp_path, fetcher=fetcher, retries=2, backoff=0, base_url="x:")
+    assert set(mirror.localize(["a.jpg", "b.jpg"])) == {"a.jpg", "b.jpg"}
+    assert len(fetcher.calls) == 6
+
+    fetcher = FlakyFetcher(failures=5)
+    mirror = AssetMirror(tmp_path / "b", fetcher=fetcher, retries=1, backoff=0)
+    assert mirror.localize(["c.jpg"]) == {}
+    assert "HTTP 503" in mirror.failures["c.jpg"]
+    assert len(fetcher.calls) == 2
+
+
+def test_rate_limit_spaces_requests(tmp_path):
+    async def localize(mirror):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await mirror.localize_async(["a", "b", "c"])
+        return loop.time() - start
+
+    mirror = AssetMirror(tmp_path, fetcher=FlakyFetcher(failures=0), rate=20)
+    assert asyncio.run(localize(mirror)) >= 0.09
+
+
+def test_memory_is_bounded(tmp_path):
+    fetcher = FlakyFetcher(failures=1)
+    mirror = AssetMirror(tmp_path, fetcher=fetcher, retries=0, maxsize=2)
+    assert mirror.localize(["a", "b", "c"]) == {}
+    assert list(mirror.failures) == ["b", "c"]
+    links = mirror.localize(["a", "b", "c"])
+    assert len(links) == 3 and not mirror.failures
+    assert len(mirror.paths) == 2
+    # Evicted entries are read back from the index
+    assert mirror.localize(["a"]) == {"a": links["a"]}
+    assert mirror.downloaded == 3
+
+
+def test_localize_inside_running_loop(tmp_path):
+    async def convert():
+        mirror = AssetMirror(tmp_path, fetcher=FlakyFetcher(failures=0))
+        return mirror.localize(["a.jpg"])
+
+    assert list(asyncio.run(convert())) == ["a.jpg"]
+
+
+def test_markdown_links_local_copies(tmp_path, image_server):
+    remote = json_to_markdown(article())
+    assert "(https://ars.els-cdn.com/content/image/gr1.jpg)" in remote
+
+    cache = configure_section_cache()
+    json_to_markdown(article())
+    mirror = configure_asset_mirror(tmp_path, "images", base_url=image_server)
+    local = json_to_markdown(article())
+    expected = remote.replace(
+        "https://ars.els-cdn.com/content/image/gr1.jpg", mirror.link("gr1.jpg")
+    ).replace("https://ars.els-cdn.com/content/image/mmc1", mirror.link("mmc1.jpg"))
+    assert local == expected
+    assert "(images/" in local and "els-cdn" not in local
+    # The section linking the image isn't served from the cache
+    assert cache.stats()["hits"] == 0
+    # Nor is a later document with the same attachments left remote
+    assert json_to_markdown(article()) == expected
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from sciencedirect2markdown.archive import MarkdownArchive
+from sciencedirect2markdown.batch import (
+    BatchStats,
+    convert_batch,
+    convert_source,
+)
+from sciencedirect2markdown.caching import TTLCache
+from sciencedirect2markdown.streamlitweb import (
+    batch_process_files,
+    convert_json_string,
+    create_zip_download,
+)
+
+DOCUMENT = json.dumps({"content": [{"#name": "para", "_": "Hello"}]}).encode("utf-8")
+
+
+def test_convert_source_reports_errors():
+    result = convert_source("bad.json", b"{not json")
+    assert not result.ok
+    assert result.markdown is None
+    assert result.error
+
+
+def test_convert_batch_in_process_with_progress():
+    calls = []
+    stats = BatchStats()
+    results = list(
+        convert_batch(
+            [("a.json", DOCUMENT), ("b.json", b"[")],
+            workers=1,
+            progress=lambda done, total, result: calls.append((done, total, result.name)),
+            stats=stats,
+        )
+    )
+    assert [r.markdown for r in results] == ["Hello\n\n", None]
+    assert calls == [(1, 2, "a.json"), (2, 2, "b.json")]
+    assert stats.files == 2
+    assert stats.failures == 1
+    assert stats.input_bytes == len(DOCUMENT) + 1
+
+
+def test_convert_batch_process_pool():
+    sources = [(f"{i}.json", DOCUMENT) for i in range(6)]
+    results = list(convert_batch(sources, workers=2, timeout=30))
+    assert sorted(r.name for r in results) == sorted(name for name, _ in sources)
+    assert all(r.markdown == "Hello\n\n" for r in results)
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_timeout_kills_stuck_conversion(tmp_path):
+    # Reading a pipe nobody writes to blocks until the worker is killed
+    stuck = tmp_path / "stuck.json"
+    os.mkfifo(stuck)
+    sources = [("stuck.json", stuck), ("a.json", DOCUMENT), ("b.json", DOCUMENT)]
+    start = time.perf_counter()
+    results = {r.name: r for r in convert_batch(sources, workers=1, timeout=0.5)}
+    assert time.perf_counter() - start < 5
+    assert "timed out after 0.5s" in results["stuck.json"].error
+    # A new worker takes over after the stuck one is killed
+    assert results["a.json"].markdown == results["b.json"].markdown == "Hello\n\n"
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_timeout_applies_to_single_source(tmp_path):
+    stuck = tmp_path / "stuck.json"
+    os.mkfifo(stuck)
+    target = tmp_path / "out" / "stuck.md"
+    targets = {"stuck.json": target}
+    [result] = convert_batch([("stuck.json", stuck)], timeout=0.2, targets=targets)
+    assert not result.ok
+    assert not target.exists()
+
+
+def test_batch_process_files_keeps_error_entries():
+    good = BytesIO(DOCUMENT)
+    good.name = "good.json"
+    bad = BytesIO(b"{")
+    bad.name = "bad.json"
+    results = batch_process_files([good, bad], workers=1)
+    assert list(results) == ["good.md", "bad.json.error"]
+    assert results["good.md"] == "Hello\n\n"
+
+
+def uploads(**payloads):
+    files = []
+    for name, payload in payloads.items():
+        file = BytesIO(payload)
+        file.name = f"{name}.json"
+        files.append(file)
+    return files
+
+
+def test_batch_process_files_reuses_cached_results():
+    cache = TTLCache(maxbytes=1 << 20)
+    batch_process_files(uploads(good=DOCUMENT, bad=b"{"), workers=1, cache=cache)
+    assert cache.stats()["size"] == 1
+
+    calls = []
+    other = json.dumps({"content": [{"#name": "para", "_": "Bye"}]}).encode("utf-8")
+    results = batch_process_files(
+        uploads(good=DOCUMENT, bad=b"{", other=other),
+        workers=1,
+        progress=lambda done, total, result: calls.append((done, total, result.name)),
+        cache=cache,
+    )
+    assert list(results) == ["good.md", "bad.json.error", "other.md"]
+    assert (results["good.md"], results["other.md"]) == ("Hello\n\n", "Bye\n\n")
+    assert calls == [(1, 3, "good.json"), (2, 3, "bad.json"), (3, 3, "other.json")]
+    assert cache.stats()["hits"] == 1
+
+
+def test_convert_json_string_cache():
+    cache = TTLCache()
+    text = DOCUMENT.decode("utf-8")
+    assert convert_json_string(text, cache=cache) == "Hello\n\n"
+    assert convert_json_string(text, cache=cache) == "Hello\n\n"
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+@pytest.mark.parametrize("options", [{}, {"compresslevel": 1}, {"store_only": True}])
+def test_batch_process_files_streams_into_archive(options):
+    with MarkdownArchive(spool_size=64, **options) as archive:
+        batch_process_files(uploads(good=DOCUMENT, bad=b"{"), workers=1, archive=archive)
+        assert archive.count == 2
+        assert archive.spilled
+        with zipfile.ZipFile(archive.finish()) as zip_file:
+            assert zip_file.namelist() == ["good.md", "bad.json.error"]
+            assert zip_file.read("good.md") == b"Hello\n\n"
+            expected = zipfile.ZIP_STORED if options.get("store_only") else zipfile.ZIP_DEFLATED
+            assert zip_file.getinfo("good.md").compress_type == expected
+
+
+def test_create_zip_download():
+    with zipfile.ZipFile(create_zip_download({"a.md": "x", "b.md": "y"})) as zip_file:
+        assert zip_file.read("b.md") == b"y"
@@ -0,0 +1,192 @@
+import sys
+
+import pytest
+
+from sciencedirect2markdown import streamlitweb
+from sciencedirect2markdown.caching import (
+    LRUCache,
+    SQLiteStore,
+    TTLCache,
+    content_key,
+    encode_json,
+)
+from sciencedirect2markdown.context import ConversionContext
+from sciencedirect2markdown.streamlitweb import (
+    configure_section_cache,
+    disable_section_cache,
+    json_to_markdown,
+)
+
+
+def test_content_key_is_canonical():
+    a = {"#name": "mi", "$": {"b": "1", "a": "2"}, "_": "x"}
+    b = {"_": "x", "$": {"a": "2", "b": "1"}, "#name": "mi"}
+    assert content_key(a) == content_key(b)
+    assert content_key(a, "yarosh") != content_key(a, "transpect")
+
+
+def test_encode_json_past_recursion_limit():
+    depth = sys.getrecursionlimit() * 2
+    node = 0
+    for _ in range(depth):
+        node = {"b": node, "a": ["é", None]}
+    assert encode_json(node, sort_keys=True, ensure_ascii=False) == (
+        '{"a":["é",null],"b":' * depth + "0" + "}" * depth
+    )
+    assert encode_json(node) == '{"b":' * depth + "0" + ',"a":["\\u00e9",null]}' * depth
+    assert content_key(node) != content_key(node["b"])
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.stats() == {
+        "hits": 1,
+        "disk_hits": 0,
+        "misses": 1,
+        "evictions": 1,
+        "size": 2,
+        "maxsize": 2,
+    }
+
+
+def test_sqlite_tier_survives_new_cache(tmp_path):
+    path = tmp_path / "math.sqlite"
+    LRUCache(store=SQLiteStore(path)).put("k", "$x$")
+
+    cache = LRUCache(store=SQLiteStore(path))
+    assert cache.get("k") == "$x$"
+    assert cache.get("k") == "$x$"
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    now = [0.0]
+    cache = TTLCache(ttl=10, clock=lambda: now[0])
+    cache.put("a", "1")
+    now[0] = 9.0
+    assert cache.get("a") == "1"
+    now[0] = 10.0
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["expirations"], stats["size"], stats["bytes"]) == (1, 0, 0)
+
+
+def test_ttl_cache_bounds_bytes():
+    cache = TTLCache(maxbytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.get("a")
+    cache.put("c", "123")  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == "12345"
+    cache.put("d", "x" * 11)  # larger than the cache
+    assert cache.get("d") is None
+    assert cache.stats()["bytes"] == 8
+
+
+@pytest.fixture(autouse=True)
+def no_section_cache():
+    yield
+    disable_section_cache()
+
+
+def section(section_id, title, *paras):
+    children = [{"#name": "section-title", "_": title}]
+    for para in paras:
+        children.append({"#name": "para", "$$": para})
+    return {"#name": "section", "$": {"id": section_id}, "$$": children}
+
+
+def text(value):
+    return {"#name": "__text__", "_": value}
+
+
+def anchor(refid):
+    return {"#name": "float-anchor", "$": {"refid": refid}}
+
+
+def article(*sections, caption="A figure."):
+    figure = {
+        "#name": "figure",
+        "$": {"id": "f1"},
+        "$$": [
+            {"#name": "label", "_": "Fig. 1"},
+            {"#name": "caption", "$$": [{"#name": "simple-para", "_": caption}]},
+            {"#name": "link", "$": {"locator": "gr1"}},
+        ],
+    }
+    attachments = [
+        {"file-basename": "gr1", "attachment-eid": "gr1.jpg", "attachment-type": "IMAGE-DOWNSAMPLED"}
+    ]
+    body = {"#name": "body", "$$": [{"#name": "sections", "$$": list(sections)}]}
+    return {"content": [body], "floats": [figure], "attachments": attachments}
+
+
+def sections_v1():
+    return [
+        section("s1", "Introduction", [text("See the figure."), anchor("f1")]),
+        section("s2", "Methods", [text("Anchored again."), anchor("f1")]),
+        section("s3", "Results", [text("Nothing changed here.")]),
+    ]
+
+
+def test_revised_document_reuses_unchanged_sections():
+    original = article(*sections_v1())
+    revised_sections = sections_v1()
+    revised_sections[2] = section("s3", "Results", [text("Revised results.")])
+    revised = article(*revised_sections)
+    expected = [json_to_markdown(original), json_to_markdown(revised)]
+
+    cache = configure_section_cache()
+    assert json_to_markdown(original) == expected[0]
+    assert cache.stats()["misses"] == 3
+    assert json_to_markdown(revised) == expected[1]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 4)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_floats_processed_in_cached_sections():
+    document = article(*sections_v1())
+    expected = json_to_markdown(document)
+    assert expected.count("*Fig. 1. A figure.*") == 1
+
+    configure_section_cache()
+    json_to_markdown(document)
+    # The second section doesn't render the figure again on a hit either
+    assert json_to_markdown(document) == expected
+    # The figure is a dependency of the sections that anchor it
+    revised = json_to_markdown(article(*sections_v1(), caption="Another figure."))
+    assert "*Fig. 1. Another figure.*" in revised
+    assert streamlitweb.section_cache.stats()["hits"] == 4
+
+
+def test_sections_persist_in_sqlite(tmp_path):
+    path = tmp_path / "sections.sqlite"
+    document = article(*sections_v1())
+    configure_section_cache(path=path)
+    expected = json_to_markdown(document)
+
+    cache = configure_section_cache(path=path)
+    assert json_to_markdown(document) == expected
+    assert cache.stats()["hits"] == 3
+
+
+def test_sections_with_failed_math_are_not_cached():
+    failed = {"#name": "math", "$$": [{"#name": "mfenced", "_": "x\x01"}]}
+    document = article(
+        section("s1", "Introduction", [text("Fine.")]),
+        section("s2", "Methods", [text("Broken "), failed]),
+    )
+    cache = configure_section_cache()
+    for _ in range(2):
+        context = ConversionContext()
+        assert "$x\x01$" in json_to_markdown(document, context=context)
+        assert context.math_failures == 1
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 3)
@@ -0,0 +1,118 @@
+import pytest
+
+from sciencedirect2markdown.chunking import Chunker
+from sciencedirect2markdown.streamlitweb import iter_chunks, json_to_markdown
+
+
+def para(text, *children):
+    return {"#name": "para", "$$": [{"#name": "__text__", "_": text}, *children]}
+
+
+def section(label, title, *children):
+    return {
+        "#name": "section",
+        "$$": [
+            {"#name": "label", "_": label},
+            {"#name": "section-title", "_": title},
+            *children,
+        ],
+    }
+
+
+DOCUMENT = {
+    "content": [
+        {
+            "#name": "body",
+            "$$": [
+                {
+                    "#name": "sections",
+                    "$$": [
+                        section(
+                            "1",
+                            "Introduction",
+                            para("First paragraph. " * 5),
+                            para(
+                                "Second, with a figure.",
+                                {"#name": "float-anchor", "$": {"refid": "f1"}},
+                            ),
+                            section("1.1", "Scope", para("Nested.")),
+                        ),
+                        section("2", "Methods", *[para(f"Method {i}. " * 10) for i in range(6)]),
+                    ],
+                }
+            ],
+        }
+    ],
+    "floats": [
+        {
+            "#name": "figure",
+            "$": {"id": "f1"},
+            "$$": [
+                {"#name": "label", "_": "Fig. 1"},
+                {"#name": "caption", "$$": [{"#name": "simple-para", "_": "A figure."}]},
+                {"#name": "link", "$": {"locator": "gr1"}},
+            ],
+        }
+    ],
+    "attachments": [
+        {"file-basename": "gr1", "attachment-eid": "gr1.jpg", "attachment-type": "IMAGE-DOWNSAMPLED"}
+    ],
+}
+
+
+@pytest.mark.parametrize("max_size", [20, 200, 10000])
+def test_chunks_join_to_the_markdown(max_size):
+    expected = json_to_markdown(DOCUMENT)
+    chunks = list(iter_chunks(DOCUMENT, max_size=max_size))
+    assert "".join(chunk.text for chunk in chunks) == expected
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert expected[chunk.start : chunk.end] == chunk.text
+        assert len(chunk.text) <= max_size
+        assert chunk.text.strip("\n -")
+
+
+def test_chunks_follow_sections():
+    chunks = list(iter_chunks(DOCUMENT, max_size=200))
+    paths = [chunk.section_path for chunk in chunks]
+    assert paths[0] == ("1 Introduction",)
+    assert ("1 Introduction", "1.1 Scope") in paths
+    assert paths[-1] == ("2 Methods",)
+    assert len([path for path in paths if path == ("2 Methods",)]) > 1
+    figure = [chunk for chunk in chunks if chunk.float_ids]
+    assert [chunk.float_ids for chunk in figure] == [["f1"]]
+    assert "Fig. 1" in figure[0].text
+    assert figure[0].label == "1"
+
+
+def test_chunker_splits_oversized_blocks():
+    chunker = Chunker(max_size=10)
+    chunks = chunker.add("line one\nline two\n" + "x" * 25) + chunker.flush()
+    texts = [chunk.text for chunk in chunks]
+    assert texts == ["line one\n", "line two\n", "x" * 10, "x" * 10, "x" * 5]
+    assert chunks[-1].end == 43
+
+
+def test_chunker_token_budget():
+    chunker = Chunker(max_size=4, measure=lambda text: len(text.split()))
+    chunks = []
+    for text in ["a b ", "c ", "d e f ", "g "]:
+        chunks += chunker.add(text)
+    chunks += chunker.flush()
+    assert [chunk.text for chunk in chunks] == ["a b c ", "d e f g "]
+    assert [chunk.size for chunk in chunks] == [3, 4]
+
+
+def test_chunker_keeps_blank_text_with_its_neighbours():
+    chunker = Chunker(max_size=10)
+    chunks = []
+    for text in ["abcdefgh", "\n\n", "ijklmnop", "\n\n---\n\n"]:
+        chunks += chunker.add(text)
+    assert [chunk.text for chunk in chunks] == ["abcdefgh\n\n"]
+    chunks += chunker.flush()
+    assert [chunk.text for chunk in chunks] == ["abcdefgh\n\n", "ijklmnop\n\n---\n\n"]
+    assert chunks[-1].end == 25
+
+    chunker = Chunker(max_size=10)
+    chunks = chunker.add("\n\n" + "x" * 12) + chunker.flush()
+    assert [chunk.text for chunk in chunks] == ["\n\nxxxxxxxx", "xxxx"]
@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from sciencedirect2markdown.cli import collect_inputs, main, output_path
+
+DOCUMENT = {"content": [{"#name": "para", "_": "Hello"}]}
+
+
+def write_tree(root):
+    (root / "a" / "b").mkdir(parents=True)
+    for relative in ("one.json", "a/two.json", "a/b/three.json"):
+        (root / relative).write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    (root / "a" / "broken.json").write_text("{", encoding="utf-8")
+
+
+def test_collect_inputs_from_directory_and_glob(tmp_path):
+    write_tree(tmp_path)
+    from_dir = collect_inputs([str(tmp_path)])
+    assert len(from_dir) == 4
+    assert all(root == tmp_path for _, root in from_dir)
+
+    from_glob = collect_inputs([str(tmp_path / "a" / "**" / "t*.json")])
+    assert sorted(p.name for p, _ in from_glob) == ["three.json", "two.json"]
+    assert all(root == tmp_path / "a" for _, root in from_glob)
+
+
+def test_output_path_mirrors_tree(tmp_path):
+    path = tmp_path / "in" / "x" / "doc.json"
+    assert output_path(path, tmp_path / "in") == tmp_path / "in" / "x" / "doc.md"
+    mirrored = output_path(path, tmp_path / "in", tmp_path / "out")
+    assert mirrored == tmp_path / "out" / "x" / "doc.md"
+
+
+def test_main_converts_skips_and_reports(tmp_path, capsys):
+    write_tree(tmp_path / "in")
+    out = tmp_path / "out"
+
+    assert main([str(tmp_path / "in"), "-o", str(out), "-j", "1", "-q"]) == 1
+    assert (out / "a" / "b" / "three.md").read_text(encoding="utf-8") == "Hello\n\n"
+    assert not (out / "a" / "broken.md").exists()
+    captured = capsys.readouterr()
+    assert "Converted: 3, skipped: 0, failed: 1" in captured.out
+    assert "broken.json" in captured.err
+
+    # Outputs newer than their inputs are skipped on the next run
+    (tmp_path / "in" / "a" / "broken.json").unlink()
+    assert main([str(tmp_path / "in"), "-o", str(out), "-j", "1", "-q"]) == 0
+    assert "Converted: 0, skipped: 3, failed: 0" in capsys.readouterr().out
+
+    source = tmp_path / "in" / "one.json"
+    os.utime(source, (source.stat().st_atime, source.stat().st_mtime + 10))
+    assert main([str(tmp_path / "in"), "-o", str(out), "-j", "1", "-q"]) == 0
+    assert "Converted: 1, skipped: 2, failed: 0" in capsys.readouterr().out
+
+
+def test_main_profiles_in_process(tmp_path, capsys):
+    write_tree(tmp_path / "in")
+    profile = tmp_path / "profile.json"
+    arguments = [str(tmp_path / "in"), "-o", str(tmp_path / "out"), "-q"]
+
+    with pytest.raises(SystemExit):
+        main([*arguments, "--profile", str(profile), "--timeout", "30"])
+    assert "--timeout cannot be used with --profile" in capsys.readouterr().err
+    assert not profile.exists()
+
+    assert main([*arguments, "--profile", str(profile)]) == 1
+    assert "para" in json.loads(profile.read_text(encoding="utf-8"))["handlers"]
@@ -1,12 +1,16 @@
 import pytest
+from sciencedirect2markdown import streamlitweb
+from sciencedirect2markdown.context import ConversionContext, use_context
 from sciencedirect2markdown.streamlitweb import (
     json_to_markdown,
     handle_math,
     handle_inter_ref,
     handle_intra_ref,
     handle_outline,
+    handle_tgroup,
     convert_json_to_mathml,
     construct_image_url,
+    configure_math_cache,
 )
 
 
@@ -345,6 +349,65 @@ def test_math():
     assert handle_math(json_data) == expected_markdown
 
 
+def test_mathml_is_escaped():
+    json_data = {
+        "#name": "math",
+        "$$": [
+            {"#name": "mfenced", "$": {"open": '"'}, "$$": [{"#name": "mi", "_": "a<b&c"}]}
+        ],
+    }
+    mathml = convert_json_to_mathml(json_data)
+    assert '<mfenced open="&quot;"><mi>a&lt;b&amp;c</mi></mfenced>' in mathml
+    context = ConversionContext()
+    with use_context(context):
+        assert "a<b\\&c" in handle_math(json_data)
+    assert context.math_failures == 0
+
+
+def test_math_failures_are_counted(capsys):
+    json_data = {"#name": "math", "$$": [{"#name": "mfenced", "_": "x\x01"}]}
+    context = ConversionContext()
+    with use_context(context):
+        assert handle_math(json_data) == "$x\x01$"
+    assert context.math_failures == 1
+    assert "Math conversion failed" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("batch_math", [False, True])
+def test_math_failures_are_not_cached(monkeypatch, batch_math):
+    monkeypatch.setattr(streamlitweb, "batch_math", batch_math)
+    document = {"#name": "math", "$$": [{"#name": "mfenced", "_": "x\x01"}]}
+    for _ in range(2):
+        context = ConversionContext()
+        assert json_to_markdown(document, context=context) == "$x\x01$"
+        assert context.math_failures == 1
+
+
+def test_math_cache_reuses_conversions(monkeypatch):
+    # Restores the module's cache afterwards
+    monkeypatch.setattr(streamlitweb, "math_cache", streamlitweb.math_cache)
+    cache = configure_math_cache(maxsize=8)
+    json_data = {"#name": "math", "$$": [{"#name": "mi", "_": "x"}]}
+    first = handle_math(json_data)
+    assert handle_math(dict(json_data)) == first
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_math_cache_is_keyed_by_converter_version(monkeypatch, tmp_path):
+    monkeypatch.setattr(streamlitweb, "math_cache", streamlitweb.math_cache)
+    json_data = {"#name": "math", "$$": [{"#name": "mi", "_": "x"}]}
+    configure_math_cache(path=tmp_path / "math.sqlite")
+    handle_math(json_data)
+
+    # A newer converter doesn't reuse what the older one stored on disk
+    monkeypatch.setattr(streamlitweb, "converter_version", lambda: "newer")
+    cache = configure_math_cache(path=tmp_path / "math.sqlite")
+    handle_math(json_data)
+    assert cache.stats()["disk_hits"] == 0
+    assert cache.stats()["misses"] == 1
+
+
 def test_image_url_construction():
     locator = "3-s2.0-B9780444637833000186-f18-01-9780444637833.gif"
     expected_url = "https://ars.els-cdn.com/content/image/" + locator
@@ -460,6 +523,43 @@ def test_handle_table():
     assert json_to_markdown(json_data) == expected_markdown
 
 
+def entry(text, **attributes):
+    node = {"#name": "entry", "_": text}
+    if attributes:
+        node["$"] = attributes
+    return node
+
+
+def test_table_grid_spans():
+    tgroup = {
+        "#name": "tgroup",
+        "$": {"cols": "3"},
+        "$$": [
+            {"#name": "colspec", "$": {"colname": "a"}},
+            {"#name": "colspec", "$": {"colname": "c", "colnum": "3"}},
+            {"#name": "colspec", "$": {"colname": "b", "colnum": "2"}},
+            {
+                "#name": "tbody",
+                "$$": [
+                    {
+                        "#name": "row",
+                        "$$": [entry("x", morerows="1"), entry("y", namest="b", nameend="c")],
+                    },
+                    {"#name": "row", "$$": [entry("1"), entry("2")]},
+                    {"#name": "row", "$$": [entry("3", colname="c"), entry("4", colname="col1")]},
+                ],
+            },
+        ],
+    }
+    expected_markdown = (
+        "| | | |\n|---|---|---|\n"
+        + "|x|y|y|\n"
+        + "|x|1|2|\n"
+        + "|4||3|\n\n"
+    )
+    assert handle_tgroup(tgroup) == expected_markdown
+
+
 def test_basic_sections():
     json_data = {
         "#name": "sections",
@@ -639,3 +739,298 @@ def test_empty_table():
     json_data = {"#name": "table", "$": {"id": "t0010"}, "$$": []}
     expected_markdown = ""
     assert json_to_markdown(json_data) == expected_markdown
+
+
+def per_level_json_to_markdown(json_data):
+    # As before: the output of every node post-processed on its own. The old
+    # rules only collapsed part of some runs (a run of three rules, or spaces
+    # between newlines) at each level, so that part depended on the nesting;
+    # the runs now collapse fully at any depth.
+    context = ConversionContext()
+    context.normalize_nodes = True
+    return json_to_markdown(json_data, context=context)
+
+
+def nested_sections(depth, paras=1):
+    section = {"#name": "para", "_": "End  \n\n\n"}
+    for level in range(depth, 0, -1):
+        section = {
+            "#name": "section",
+            "$$": [
+                {"#name": "label", "_": ".".join(["1"] * level)},
+                {"#name": "section-title", "_": f"Level {level} "},
+                *(
+                    {"#name": "para", "_": "Text  \n", "$$": [{"#name": "bold", "_": "B "}]}
+                    for _ in range(paras)
+                ),
+                section,
+            ],
+        }
+    return {"#name": "sections", "$$": [section]}
+
+
+POST_PROCESSING_DOCUMENTS = [
+    nested_sections(3),
+    {
+        "#name": "sections",
+        "$$": [
+            {"#name": "section", "$$": [{"#name": "para", "_": "Untitled"}]},
+            {
+                "#name": "section",
+                "$$": [
+                    {
+                        "#name": "para",
+                        "$$": [
+                            {"#name": "__text__", "_": "---"},
+                            {"#name": "para", "_": "\n---\n"},
+                        ],
+                    }
+                ],
+            },
+        ],
+    },
+    {
+        "#name": "list",
+        "$$": [
+            {
+                "#name": "list-item",
+                "$$": [
+                    {"#name": "label", "$$": [{"#name": "__text__", "_": "1.  \n"}]},
+                    {
+                        "#name": "para",
+                        "_": "  ",
+                        "$$": [
+                            {
+                                "#name": "section",
+                                "$$": [{"#name": "para", "_": "\n---\n  "}],
+                            },
+                            {"#name": "italic", "_": " x \n\n\n"},
+                        ],
+                    },
+                ],
+            }
+        ],
+    },
+    {
+        "content": [{"#name": "para", "$$": [{"#name": "float-anchor", "$": {"refid": "f1"}}]}],
+        "floats": [
+            {
+                "#name": "figure",
+                "$": {"id": "f1"},
+                "$$": [
+                    {
+                        "#name": "label",
+                        "_": "Fig. ",
+                        "$$": [
+                            {"#name": "bold", "_": "1  \n\n\n"},
+                            {"#name": "__text__", "_": "a \n"},
+                        ],
+                    },
+                    {
+                        "#name": "caption",
+                        "$$": [
+                            {"#name": "simple-para", "_": "First  \n\n\n\n"},
+                            {"#name": "simple-para", "_": "Second \n---\n\n---\n"},
+                        ],
+                    },
+                    {"#name": "link", "$": {"locator": "gr1"}},
+                ],
+            }
+        ],
+        "attachments": [{"file-basename": "gr1", "attachment-eid": "EID-gr1.jpg"}],
+    },
+]
+
+
+@pytest.mark.parametrize("json_data", POST_PROCESSING_DOCUMENTS)
+def test_post_processed_once_matches_every_level(json_data):
+    expected_markdown = per_level_json_to_markdown(json_data)
+    assert json_to_markdown(json_data) == expected_markdown
+
+
+def test_post_processing_is_linear(monkeypatch):
+    scanned = []
+    post_process = streamlitweb.handle_post_process
+
+    def counting_post_process(markdown_output):
+        scanned.append(len(markdown_output))
+        return post_process(markdown_output)
+
+    monkeypatch.setattr(streamlitweb, "handle_post_process", counting_post_process)
+    for depth in (10, 100):
+        scanned.clear()
+        markdown = json_to_markdown(nested_sections(depth, paras=5))
+        # Each character is scanned once, not once per enclosing section
+        assert sum(scanned) < 2 * len(markdown)
+
+
+def test_post_process_collapses_runs():
+    markdown = "a \n \n\nb\n---\n\n---\n\n---\nc"
+    assert streamlitweb.handle_post_process(markdown) == "a\n\nb\n---\nc"
+
+
+def test_handlers_append_into_writer():
+    out = streamlitweb.MarkdownWriter()
+    out.write("Intro ")
+    assert handle_inter_ref(
+        {"#name": "inter-ref", "$": {"href": "http://a.b"}, "_": "A"}, out=out
+    ) is None
+    streamlitweb.handle_bold({"#name": "bold", "_": "B"}, out=out)
+    assert out.getvalue() == "Intro [A](http://a.b)**B**"
+
+
+def test_register_handler_for_new_tag(monkeypatch):
+    monkeypatch.setattr(streamlitweb, "TAG_HANDLERS", dict(streamlitweb.TAG_HANDLERS))
+
+    def handle_keyword(data, LaTeX=False, out=None):
+        out.write(f"`{data['_']}`" if not LaTeX else f"\\texttt{{{data['_']}}}")
+
+    streamlitweb.register_handler("keyword", handle_keyword, LaTeX=True)
+    json_data = {
+        "#name": "para",
+        "$$": [
+            {"#name": "keyword", "_": "kinetics"},
+            {"#name": "bold", "$$": [{"#name": "keyword", "_": "rate"}]},
+        ],
+    }
+    assert json_to_markdown(json_data) == "`kinetics`**`rate`**\n\n"
+
+
+FIGURE_DOCUMENT = {
+    "content": [
+        {
+            "#name": "para",
+            "$$": [
+                {"#name": "__text__", "_": "See figure."},
+                {"#name": "float-anchor", "$": {"refid": "f1"}},
+            ],
+        },
+        {
+            "#name": "para",
+            "$$": [
+                {"#name": "__text__", "_": "Again."},
+                {"#name": "float-anchor", "$": {"refid": "f1"}},
+            ],
+        },
+    ],
+    "floats": [
+        {
+            "#name": "figure",
+            "$": {"id": "f1"},
+            "$$": [{"#name": "link", "$": {"locator": "gr1"}}],
+        }
+    ],
+    "attachments": [{"file-basename": "gr1", "attachment-eid": "EID-gr1.jpg"}],
+}
+
+
+def test_float_rendered_once_per_document():
+    expected_markdown = (
+        "See figure.\n\n![](https://ars.els-cdn.com/content/image/EID-gr1.jpg)\n\n"
+        "Again.\n\n"
+    )
+    assert json_to_markdown(FIGURE_DOCUMENT) == expected_markdown
+    # A second conversion starts from a clean state
+    assert json_to_markdown(FIGURE_DOCUMENT) == expected_markdown
+
+
+def test_attachments_do_not_leak_between_documents():
+    json_to_markdown(FIGURE_DOCUMENT)
+    figure = FIGURE_DOCUMENT["floats"][0]
+    assert json_to_markdown(figure) == ""
+
+
+def test_parallel_conversions_are_isolated():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def document(i):
+        return {
+            "content": [
+                {
+                    "#name": "inline-figure",
+                    "$$": [{"#name": "link", "$": {"locator": "gr1"}}],
+                }
+            ],
+            "attachments": [{"file-basename": "gr1", "attachment-eid": f"EID-{i}.jpg"}],
+        }
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: json_to_markdown(document(i)), range(64)))
+    assert results == [
+        f"![](https://ars.els-cdn.com/content/image/EID-{i}.jpg)" for i in range(64)
+    ]
+
+
+def test_glyph_with_unicode():
+    json_data = {"#name": "glyph", "$": {"name": "dcurt"}}
+    assert json_to_markdown(json_data) == "&#x221;"
+
+
+def test_deeply_nested_labels_render_without_recursion():
+    import sys
+
+    node = {"#name": "__text__", "_": "x"}
+    for _ in range(sys.getrecursionlimit() * 2):
+        node = {"#name": "label", "_": "a", "$$": [node]}
+    markdown = json_to_markdown({"content": [node]})
+    assert markdown == "a" * (sys.getrecursionlimit() * 2) + "x"
+
+
+def test_deeply_nested_mathml_converts_without_recursion():
+    import sys
+
+    depth = sys.getrecursionlimit() * 2
+    node = {"#name": "mi", "_": "x"}
+    for _ in range(depth):
+        node = {"#name": "mrow", "$$": [node]}
+    mathml = convert_json_to_mathml({"#name": "math", "$$": [node]})
+    assert mathml.count("<mrow>") == depth
+    assert mathml.endswith("<mi>x</mi>" + "</mrow>" * depth + "</math>")
+
+
+def test_deeply_nested_lists_render_without_recursion():
+    import sys
+
+    depth = sys.getrecursionlimit() * 2
+    node = {"#name": "list", "$$": []}
+    for _ in range(depth):
+        item = {"#name": "list-item", "$$": [{"#name": "para", "_": "x"}, node]}
+        node = {"#name": "list", "$$": [item]}
+    markdown = json_to_markdown(node)
+    lines = markdown.split()
+    assert lines == ["-", "x"] * depth
+    assert markdown.endswith("\n" + "    " * (depth - 1) + "- x\n\n")
+
+
+@pytest.mark.parametrize("tag_name", ["bold", "italic", "sup", "para", "section"])
+def test_deeply_nested_wrappers_render_without_recursion(tag_name):
+    import sys
+
+    depth = sys.getrecursionlimit() * 2
+    node = {"#name": "__text__", "_": "x"}
+    for _ in range(depth):
+        children = [node]
+        if tag_name == "section":
+            children.insert(0, {"#name": "section-title", "_": "T"})
+        node = {"#name": tag_name, "$$": children}
+    markdown = json_to_markdown(node)
+    assert "x" in markdown
+
+
+def test_deeply_nested_math_renders_without_recursion(monkeypatch):
+    import sys
+
+    monkeypatch.setattr(streamlitweb, "math_cache", streamlitweb.math_cache)
+    configure_math_cache()
+    depth = sys.getrecursionlimit() * 2
+    node = {"#name": "mi", "_": "x"}
+    for _ in range(depth):
+        node = {"#name": "mrow", "$$": [node]}
+    json_data = {"#name": "math", "$$": [node]}
+    context = ConversionContext()
+    markdown = json_to_markdown({"#name": "para", "$$": [json_data]}, context=context)
+    assert markdown == "$$ x$$\n\n"
+    assert context.math_failures == 0
+    # Served from the cache, under a key built without recursing
+    assert len(streamlitweb.math_cache) == 1
+    assert json_to_markdown(json_data) == "$$ x$$"
@@ -0,0 +1,62 @@
+from sciencedirect2markdown.context import ConversionContext
+from sciencedirect2markdown.index import DocumentIndex, build_index
+from sciencedirect2markdown.streamlitweb import json_to_markdown
+
+ATTACHMENTS = [
+    {"file-basename": "gr1", "attachment-eid": "gr1.sml", "attachment-type": "IMAGE-THUMBNAIL"},
+    {"file-basename": "gr1", "attachment-eid": "gr1_lrg.jpg", "attachment-type": "IMAGE-HIGH-RES"},
+    {"file-basename": "gr1", "attachment-eid": "gr1.jpg", "attachment-type": "IMAGE-DOWNSAMPLED"},
+    {"file-basename": "gr2", "attachment-eid": "gr2.sml", "attachment-type": "IMAGE-THUMBNAIL"},
+    {"file-basename": "gr2", "attachment-eid": "gr2-other.sml", "attachment-type": "IMAGE-THUMBNAIL"},
+]
+
+DOCUMENT = {
+    "content": [
+        {
+            "#name": "section",
+            "$": {"id": "s1"},
+            "$$": [
+                {"#name": "para", "$": {"id": "p1"}, "_": "See "},
+                {"#name": "cross-ref", "$": {"refid": "f1"}, "_": "Fig. 1"},
+            ],
+        }
+    ],
+    "floats": [{"#name": "figure", "$": {"id": "f1"}, "$$": []}],
+    "attachments": ATTACHMENTS,
+}
+
+
+def test_attachment_preference():
+    assert build_index(DOCUMENT).attachments == {"gr1": "gr1.jpg", "gr2": "gr2.sml"}
+    index = build_index(DOCUMENT, prefer_high_res=True)
+    assert index.attachments == {"gr1": "gr1_lrg.jpg", "gr2": "gr2.sml"}
+
+
+def test_floats_and_targets_by_id():
+    index = build_index(DOCUMENT)
+    assert list(index.floats) == ["f1"]
+    assert set(index.targets) == {"s1", "p1", "f1"}
+    assert index.targets["p1"]["_"] == "See "
+
+
+def test_conversion_reuses_a_prebuilt_index():
+    index = DocumentIndex(prefer_high_res=True)
+    index.add_document(DOCUMENT)
+    context = ConversionContext(index)
+    json_to_markdown(DOCUMENT, context=context)
+    assert context.index is index
+    assert index.documents == 1
+    assert context.render_seconds > 0
+    assert index.seconds >= 0
+
+
+def test_targets_skip_strings_and_descend_into_lists():
+    index = DocumentIndex()
+    index.add_targets(
+        {
+            "#name": "formula",
+            "$": {"id": "e1"},
+            "$$": ["x", [{"#name": "math", "$": {"id": "m1"}, "$$": ["+", "1"]}]],
+        }
+    )
+    assert set(index.targets) == {"e1", "m1"}
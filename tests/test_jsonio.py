@@ -0,0 +1,196 @@
+import json
+import time
+from io import BytesIO, StringIO
+
+import pytest
+
+from sciencedirect2markdown import batch
+from sciencedirect2markdown.jsonio import (
+    END,
+    VALUE,
+    TokenStream,
+    load,
+    loads,
+    parse_value,
+    remove_trailing_commas,
+)
+from sciencedirect2markdown.streamlitweb import (
+    StreamingPostProcessor,
+    convert_json_file,
+    handle_post_process,
+    iter_markdown,
+    iter_markdown_file,
+    json_to_markdown,
+)
+from sciencedirect2markdown.context import ConversionContext
+
+DOCUMENT = {
+    "content": [
+        {
+            "#name": "body",
+            "$$": [
+                {
+                    "#name": "sections",
+                    "$$": [
+                        {
+                            "#name": "section",
+                            "$$": [
+                                {"#name": "section-title", "_": "Intro"},
+                                {
+                                    "#name": "para",
+                                    "_": "See ",
+                                    "$$": [
+                                        {"#name": "float-anchor", "$": {"refid": "f1"}},
+                                        {"#name": "italic", "_": "café \"quoted\""},
+                                    ],
+                                },
+                            ],
+                        },
+                        {
+                            "#name": "section",
+                            "$$": [
+                                {"#name": "section-title", "_": "Results"},
+                                {"#name": "para", "_": "Done.   \n\n\n\n"},
+                            ],
+                        },
+                    ],
+                }
+            ],
+        }
+    ],
+    "floats": [
+        {
+            "#name": "figure",
+            "$": {"id": "f1"},
+            "$$": [
+                {"#name": "label", "_": "Fig. 1"},
+                {"#name": "link", "$": {"locator": "gr1"}},
+            ],
+        }
+    ],
+    "attachments": [
+        {"file-basename": "gr1", "attachment-eid": "1-s2.0-gr1.jpg"},
+    ],
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 16])
+def test_tokenizer_handles_chunk_boundaries(chunk_size):
+    text = json.dumps(DOCUMENT, indent=1) + "\n"
+    stream = TokenStream(StringIO(text), chunk_size=chunk_size)
+    assert parse_value(stream) == DOCUMENT
+    assert stream.next()[0] == "end"
+
+    stream = TokenStream(BytesIO(text.encode("utf-8")), chunk_size=chunk_size)
+    assert parse_value(stream) == DOCUMENT
+
+
+@pytest.mark.parametrize("offset", range(12))
+def test_tokenizer_reads_numbers_and_utf8_across_chunks(offset):
+    text = " " * offset + '[1.5e-3, -2E+10, "é€𝄞"]'
+    expected = ["[", (VALUE, 1.5e-3), ",", (VALUE, -2e10), ",", (VALUE, "é€𝄞"), "]"]
+    expected = [token if isinstance(token, tuple) else (token, None) for token in expected]
+    for chunk_size in (1, 2, 3, 5, 8):
+        for fp in (StringIO(text), BytesIO(text.encode("utf-8"))):
+            stream = TokenStream(fp, chunk_size=chunk_size)
+            tokens = [stream.next() for _ in expected]
+            assert tokens == expected
+            assert stream.next()[0] == END
+
+
+def test_trailing_commas_are_tolerated():
+    text = '{"a": [1, 2.5, true, null,], "b": {"c": "x\\n",},}'
+    expected = {"a": [1, 2.5, True, None], "b": {"c": "x\n"}}
+    assert load(StringIO(text)) == expected
+    assert loads(text) == expected
+
+
+def test_trailing_comma_repair_leaves_strings_alone():
+    text = '{"a": ["x,]", "y\\",}",], "b": {"c": ",  }",},}'
+    assert remove_trailing_commas(text) == '{"a": ["x,]", "y\\",}"], "b": {"c": ",  }"}}'
+    assert loads(text) == {"a": ["x,]", 'y",}'], "b": {"c": ",  }"}}
+
+
+def test_trailing_comma_repair_is_linear_in_strings():
+    def seconds(count):
+        text = "[" + ",".join(['"a,}b,]\\n"'] * count) + ",]"
+        start = time.perf_counter()
+        assert remove_trailing_commas(text) == text[:-2] + "]"
+        return time.perf_counter() - start
+
+    seconds(100)
+    small = min(seconds(1000) for _ in range(3))
+    large = min(seconds(16000) for _ in range(3))
+    # Quadratic would be 256 times slower
+    assert large < 64 * small
+
+
+def test_invalid_json_raises_decode_error():
+    with pytest.raises(json.JSONDecodeError):
+        load(StringIO('{"a": }'))
+    with pytest.raises(json.JSONDecodeError):
+        load(StringIO('{"a": "unterminated'))
+
+
+def test_streamed_conversion_matches_whole_document():
+    expected = json_to_markdown(DOCUMENT)
+    text = json.dumps(DOCUMENT).replace("]", ",]")
+    assert convert_json_file(BytesIO(text.encode("utf-8"))) == expected
+    assert "1-s2.0-gr1.jpg" in expected
+
+
+def test_streamed_conversion_yields_sections_separately():
+    fragments = list(iter_markdown_file(StringIO(json.dumps(DOCUMENT))))
+    assert len(fragments) > 2
+    assert "".join(fragments) == json_to_markdown(DOCUMENT)
+
+
+def test_unstreamable_file_converts_into_callers_context():
+    document = {key: value for key, value in DOCUMENT.items() if key != "content"}
+    context = ConversionContext()
+    fragments = list(iter_markdown_file(StringIO(json.dumps(document)), context=context))
+    assert "".join(fragments) == json_to_markdown(document)
+    assert context.index.documents == 1
+    assert set(context.index.floats) == {"f1"}
+    assert context.render_seconds > 0
+
+
+def test_iter_markdown_yields_blocks_in_order():
+    fragments = list(iter_markdown(DOCUMENT))
+    assert len(fragments) > 2
+    assert "".join(fragments) == json_to_markdown(DOCUMENT)
+
+
+def test_streaming_post_processor_matches_whole_text():
+    text = "a  \n\n\n\n---\n\n---\n\nb -- \n\n\n"
+    for size in range(1, 6):
+        post_processor = StreamingPostProcessor()
+        pieces = [text[i : i + size] for i in range(0, len(text), size)]
+        output = "".join(post_processor.feed(piece) for piece in pieces)
+        output += post_processor.flush()
+        assert output == handle_post_process(text)
+
+
+def test_large_files_are_streamed_from_disk(tmp_path, monkeypatch):
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    monkeypatch.setattr(batch, "STREAMING_THRESHOLD", 0)
+    result = batch.convert_source("doc.json", path)
+    assert result.ok
+    assert result.markdown == json_to_markdown(DOCUMENT)
+    assert result.size == path.stat().st_size
+
+
+@pytest.mark.parametrize("threshold", [0, 1 << 30])
+def test_convert_source_writes_target(tmp_path, monkeypatch, threshold):
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    monkeypatch.setattr(batch, "STREAMING_THRESHOLD", threshold)
+    target = tmp_path / "out" / "doc.md"
+    result = batch.convert_source("doc.json", path, target=target)
+    assert result.ok and result.markdown is None
+    assert target.read_text(encoding="utf-8") == json_to_markdown(DOCUMENT)
+
+    failed = batch.convert_source("bad.json", b"{", target=tmp_path / "bad.md")
+    assert not failed.ok
+    assert list(tmp_path.glob("bad.md*")) == []
@@ -0,0 +1,119 @@
+import pytest
+
+from sciencedirect2markdown import streamlitweb
+from sciencedirect2markdown.mathlatex import UnsupportedMath, math_to_latex, xpath_number
+from sciencedirect2markdown.streamlitweb import (
+    configure_math_cache,
+    convert_json_to_mathml,
+    handle_math,
+    json_to_markdown,
+    mathml2latex_yarosh,
+    mathml2latex_yarosh_batch,
+)
+
+
+def mi(text, **attributes):
+    node = {"#name": "mi", "_": text}
+    if attributes:
+        node["$"] = attributes
+    return node
+
+
+def mo(text, **attributes):
+    node = {"#name": "mo", "_": text}
+    if attributes:
+        node["$"] = attributes
+    return node
+
+
+def mn(text):
+    return {"#name": "mn", "_": text}
+
+
+def node(tag_name, *children, **attributes):
+    node = {"#name": tag_name, "$$": list(children)}
+    if attributes:
+        node["$"] = attributes
+    return node
+
+
+EQUATIONS = [
+    node("math", mi("x")),
+    node("math", mi("sin"), mo("("), mi("θ"), mo(")"), display="block"),
+    node("math", mo("["), mn("1.5"), mo("]", stretchy="false"), mo("|"), mn("1e3"), mn("n/a")),
+    node("math", node("mfrac", node("mrow", mi("a"), mo("+"), mn("2")), node("msqrt", mi("b")))),
+    node("math", node("mroot", mi("x"), mn("3")), node("mroot", mi("x"))),
+    node("math", node("msubsup", mo("∑"), node("mrow", mi("i"), mo("="), mn("1")), mi("n"))),
+    node("math", node("munderover", mo("∫"), mn("0"), mi("∞")), node("mover", mi("x"), mo("¯"))),
+    node("math", node("mover", mi("x"), mo("^"), accent="true"), node("munder", mi("y"), mo("̲"))),
+    node("math", node("mstyle", node("mfrac", mn("1"), mn("2")), scriptlevel="1")),
+    node("math", node("mstyle", mi("x"), displaystyle="true"), mode="display"),
+    node("math", node("mtable", node("mtr", node("mtd", mn("1")), node("mtd", mn("0"))))),
+    node("math", mi("R", mathvariant="double-struck"), {"#name": "mtext", "_": " if  x_1 "}),
+    node("math", {"#name": "mspace", "$": {"width": "1em"}}, node("mphantom", mi("x"))),
+]
+
+
+@pytest.mark.parametrize("equation", EQUATIONS)
+def test_matches_xslt(equation):
+    expected = str(mathml2latex_yarosh(convert_json_to_mathml(equation)))
+    assert math_to_latex(equation) == expected
+
+
+@pytest.mark.parametrize(
+    "equation",
+    [
+        node("math", node("mfenced", mi("x"))),
+        node("math", mi("x", mathcolor="red")),
+        node("math", node("mfrac", mn("1"), mn("2"), linethickness="0")),
+        node("math", mi("\x01")),
+        node("math", {"#name": "mrow", "_": "x", "$$": [mi("y")]}),
+    ],
+)
+def test_unsupported_constructs(equation):
+    with pytest.raises(UnsupportedMath):
+        math_to_latex(equation)
+
+
+def test_handle_math_falls_back_to_xslt(monkeypatch):
+    configure_math_cache(maxsize=8)
+    equation = node("math", node("mfenced", mi("x"), mi("y")))
+    expected = f"${mathml2latex_yarosh(convert_json_to_mathml(equation))}$"
+    assert handle_math(equation) == expected
+
+    configure_math_cache(maxsize=8)
+    monkeypatch.setattr(streamlitweb, "native_math", False)
+    assert handle_math(EQUATIONS[3]) == f"${math_to_latex(EQUATIONS[3])}$"
+
+
+def test_batch_matches_single_conversions():
+    equations = [convert_json_to_mathml(equation) for equation in EQUATIONS]
+    equations.insert(2, "<math><mi>unclosed</math>")
+    equations.append(convert_json_to_mathml(node("math", mi("\ue000"))))
+    expected = [str(mathml2latex_yarosh(equation)) for equation in equations[3:-1]]
+    converted = mathml2latex_yarosh_batch(equations)
+    assert converted[2] is None
+    assert converted[3:-1] == expected
+    assert converted[-1] == "$ \ue000$"
+
+
+def test_batched_document_matches_per_equation(monkeypatch):
+    document = {
+        "content": [
+            node("para", EQUATIONS[1], node("math", node("mfenced", mi("x"))), EQUATIONS[1]),
+            node("para", node("math", mi("a < b")), node("math", mi("\x01"))),
+        ]
+    }
+    configure_math_cache(maxsize=8)
+    expected = json_to_markdown(document)
+    configure_math_cache(maxsize=8)
+    monkeypatch.setattr(streamlitweb, "native_math", False)
+    monkeypatch.setattr(streamlitweb, "batch_math", True)
+    assert json_to_markdown(document) == expected
+
+
+def test_xpath_number():
+    assert xpath_number(" 2.5\n") == 2.5
+    assert xpath_number("1e3") == 1000
+    assert xpath_number("1e") == 1
+    assert xpath_number("+1") != xpath_number("+1")
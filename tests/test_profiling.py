@@ -0,0 +1,59 @@
+import json
+
+from sciencedirect2markdown import streamlitweb
+from sciencedirect2markdown.cli import main
+from sciencedirect2markdown.streamlitweb import json_to_markdown, profile_handlers
+
+DOCUMENT = {
+    "content": [
+        {
+            "#name": "section",
+            "$$": [
+                {"#name": "section-title", "_": "Intro"},
+                {
+                    "#name": "para",
+                    "$$": [
+                        {"#name": "__text__", "_": "Energy "},
+                        {"#name": "bold", "_": "E"},
+                        {"#name": "math", "$$": [{"#name": "mi", "_": "x"}]},
+                        {"#name": "unknown-tag", "_": "?"},
+                    ],
+                },
+            ],
+        }
+    ]
+}
+
+
+def test_profiled_output_is_unchanged():
+    expected = json_to_markdown(DOCUMENT)
+    with profile_handlers() as profiler:
+        assert json_to_markdown(DOCUMENT) == expected
+
+    stats = profiler.to_dict()
+    assert stats["handlers"]["para"]["calls"] == 1
+    assert stats["handlers"]["math"]["chars"] == len("$$ x$$")
+    section = stats["handlers"]["section"]
+    assert section["self_seconds"] <= section["seconds"]
+    assert stats["unhandled"] == {"unknown-tag": 1}
+    stacks = [line.rsplit(" ", 1)[0] for line in profiler.collapsed_stacks().splitlines()]
+    assert "section;para;math" in stacks
+
+
+def test_handlers_restored_after_profiling():
+    handlers = dict(streamlitweb.TAG_HANDLERS)
+    handle_para = streamlitweb.handle_para
+    with profile_handlers():
+        assert streamlitweb.handle_para is not handle_para
+    assert streamlitweb.TAG_HANDLERS == handlers
+    assert streamlitweb.handle_para is handle_para
+    assert streamlitweb.handler_profiler is None
+
+
+def test_cli_writes_profile(tmp_path):
+    source = tmp_path / "doc.json"
+    source.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    profile = tmp_path / "profile.json"
+    assert main([str(source), "-q", "--profile", str(profile)]) == 0
+    assert "para" in json.loads(profile.read_text(encoding="utf-8"))["handlers"]
+    assert "section;para" in (tmp_path / "profile.folded").read_text(encoding="utf-8")
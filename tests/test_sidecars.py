@@ -0,0 +1,107 @@
+import csv
+
+import pytest
+
+from sciencedirect2markdown.sidecars import TableSpill, column_names, parquet_available
+from sciencedirect2markdown.streamlitweb import (
+    configure_table_spill,
+    disable_table_spill,
+    handle_table,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_table_spill():
+    yield
+    disable_table_spill()
+
+
+def entry(text):
+    return {"#name": "entry", "_": text}
+
+
+def table(rows):
+    body = [{"#name": "row", "$$": [entry(str(i)), entry(f"v{i}")]} for i in range(rows)]
+    return {
+        "#name": "table",
+        "$": {"id": "t0010"},
+        "$$": [
+            {"#name": "label", "_": "Table 1"},
+            {
+                "#name": "tgroup",
+                "$": {"cols": "2"},
+                "$$": [
+                    {
+                        "#name": "thead",
+                        "$$": [{"#name": "row", "$$": [entry("n"), entry("value")]}],
+                    },
+                    {"#name": "tbody", "$$": body},
+                ],
+            },
+            {
+                "#name": "table-footnote",
+                "$$": [{"#name": "label", "_": "a"}, {"#name": "note-para", "_": "A note."}],
+            },
+        ],
+    }
+
+
+def test_small_tables_stay_inline(tmp_path):
+    expected = handle_table(table(5))
+    spill = configure_table_spill(tmp_path, threshold=5)
+    assert handle_table(table(5)) == expected
+    assert spill.written == []
+
+
+def test_large_table_spills_to_csv(tmp_path):
+    spill = configure_table_spill(
+        tmp_path / "tables", threshold=5, preview_rows=2, link_prefix="tables/"
+    )
+    markdown = handle_table(table(50))
+    [path] = spill.written
+    assert path.name.startswith("t0010-") and path.suffix == ".csv"
+    assert markdown.startswith("**Table 1**:\n\n|n|value|\n|---|---|\n|0|v0|\n|1|v1|\n")
+    assert f"[Full table: 50 rows](tables/{path.name})" in markdown
+    assert "- a. A note." in markdown
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["n", "value"]
+    assert rows[-1] == ["49", "v49"]
+    assert len(rows) == 51
+    # The same table gets the same file
+    assert handle_table(table(50)) == markdown
+    assert len(list(path.parent.iterdir())) == 1
+
+
+def test_spilled_and_inline_tables_keep_every_body(tmp_path):
+    data = table(4)
+    tgroup = data["$$"][1]
+    tgroup["$$"].append(table(2)["$$"][1]["$$"][1])
+    inline = handle_table(data)
+    assert "|3|v3|\n|0|v0|\n|1|v1|\n" in inline
+
+    spill = configure_table_spill(tmp_path, threshold=5, preview_rows=6)
+    spilled = handle_table(data)
+    assert "[Full table: 6 rows]" in spilled
+    # The preview holds every row, so it matches the inline table
+    assert spilled.startswith(inline.split("\n- a.")[0].rstrip("\n"))
+    with open(spill.written[0], encoding="utf-8", newline="") as f:
+        assert len(list(csv.reader(f))) == 7
+
+
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow is not installed")
+def test_large_table_spills_to_parquet(tmp_path):
+    import pyarrow.parquet as pq
+
+    spill = TableSpill(tmp_path, threshold=5, format="parquet")
+    link, count = spill.write("t1", [["n", "n"]], ([str(i), "x"] for i in range(3000)), 2)
+    assert count == 3000
+    assert link.endswith(".parquet")
+    data = pq.read_table(spill.written[0])
+    assert data.column_names == ["n", "n_"]
+    assert data.num_rows == 3000
+
+
+def test_column_names():
+    header = [["Group", "Group", ""], ["a", "b", ""]]
+    assert column_names(header, 3) == ["Group a", "Group b", "col3"]
@@ -0,0 +1,52 @@
+import threading
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from sciencedirect2markdown import xslt
+from sciencedirect2markdown.xslt import XSLTRegistry, MATHCONVERTER_DIR
+
+MATHML = '<math xmlns="http://www.w3.org/1998/Math/MathML"><mi>x</mi></math>'
+
+
+def test_stylesheet_path_is_package_relative(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = XSLTRegistry()
+    assert registry.path("yarosh") == MATHCONVERTER_DIR / "xsl_yarosh" / "mmltex.xsl"
+    assert str(registry.transform("yarosh", etree.fromstring(MATHML))) == "$ x$"
+
+
+def test_stylesheet_compiled_once_per_thread():
+    registry = XSLTRegistry()
+    for _ in range(5):
+        registry.transform("yarosh", etree.fromstring(MATHML))
+
+    def worker():
+        registry.transform("yarosh", etree.fromstring(MATHML))
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    stats = registry.stats()["yarosh"]
+    assert stats["parse_count"] == 1
+    assert stats["compile_count"] == 2
+    assert stats["transform_count"] == 6
+    assert stats["transform_seconds"] > 0
+
+
+def test_unknown_stylesheet():
+    registry = XSLTRegistry()
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_stylesheets_ship_in_the_package():
+    assert (Path(xslt.__file__).parent / "mathconverter" / "xsl_yarosh" / "mmltex.xsl").is_file()
+
+
+def test_missing_stylesheet_names_the_setting(tmp_path):
+    registry = XSLTRegistry(base_dir=tmp_path)
+    with pytest.raises(FileNotFoundError, match="SD2MD_MATHCONVERTER_DIR"):
+        registry.get("yarosh")